@@ -0,0 +1,53 @@
+"""Connect, stop and output handling of CommandWorker against the fake zju-connect"""
+import time
+
+from harness import benchmark, core_command, WorkerRun, Sink, socks_connect, send_through
+
+FLOOD_LINES = 50000
+TRANSFER_BYTES = 64 * 1024 * 1024
+
+@benchmark("s", repeat=9, tolerance=0.5)
+def time_to_ready():
+    """Worker start until the state machine reports ready, with an instant login"""
+    from utils.output_utils import STATE_READY
+    run = WorkerRun(core_command(login_delay=0)[0])
+    run.wait_for(lambda: STATE_READY in run.states)
+    elapsed = run.state_times[STATE_READY] - run.started
+    run.stop()
+    return elapsed
+
+# A few milliseconds, so scheduler noise alone moves it by tens of percent
+@benchmark("s", repeat=9, tolerance=1.0)
+def stop_latency():
+    """stop() until finished for a core that exits on terminate"""
+    from utils.output_utils import STATE_READY
+    run = WorkerRun(core_command(login_delay=0)[0])
+    run.wait_for(lambda: STATE_READY in run.states)
+    return run.stop()
+
+@benchmark("lines/s", higher_is_better=True, repeat=3, tolerance=0.3)
+def output_throughput():
+    """Lines per second read, parsed, rate limited and session-logged while the core floods its output"""
+    from utils.output_utils import STATE_READY
+    run = WorkerRun(core_command("flood", login_delay=0, flood_lines=FLOOD_LINES)[0])
+    last = f"packet {FLOOD_LINES - 1} "
+    run.wait_for(lambda: any(last in line for line in list(run.worker.recent_lines)))
+    elapsed = time.perf_counter() - run.state_times[STATE_READY]
+    run.stop()
+    return FLOOD_LINES / elapsed
+
+@benchmark("MB/s", higher_is_better=True, repeat=3, tolerance=0.3)
+def socks_throughput():
+    """One bulk transfer through the fake core's SOCKS5 listener, covering the test proxy itself"""
+    from utils.output_utils import STATE_READY
+    command_args, _, socks_port = core_command(login_delay=0)
+    run = WorkerRun(command_args)
+    run.wait_for(lambda: STATE_READY in run.states)
+    sink = Sink()
+    try:
+        with socks_connect(socks_port, "127.0.0.1", sink.port) as sock:
+            elapsed = send_through(sock, TRANSFER_BYTES)
+    finally:
+        sink.close()
+        run.stop()
+    return TRANSFER_BYTES / elapsed / 1e6
@@ -0,0 +1,85 @@
+"""How many zju-connect lines per second the log pane takes before the GUI's frame time degrades"""
+import statistics
+import time
+
+from harness import benchmark, qt_app
+
+FRAME_BUDGET = 1 / 60  # seconds
+RATES = (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000)
+LINE = "2024/01/01 00:00:00 debug: packet {} from 10.249.0.2:51234 to 10.248.98.30:53 proto udp len 96"
+
+class Window:
+    output_text = None
+    log_lines = None
+
+def log_pane():
+    from PySide6.QtWidgets import QTextEdit
+    from utils.log_utils import init_log_view
+    app = qt_app()
+    window = Window()
+    window.output_text = QTextEdit()
+    window.output_text.setReadOnly(True)
+    window.output_text.resize(600, 400)
+    init_log_view(window.output_text)
+    window.output_text.show()
+    # The first paint lays out the widget; keep it out of the measurements
+    window.output_text.viewport().repaint()
+    app.processEvents()
+    return app, window
+
+def frame_times(rate, seconds=1.0):
+    """Append one second of output at rate lines/s the way the worker batches it, timing each frame.
+
+    A frame is one batch appended plus the repaint it causes. The worker's rate limit is left out,
+    so this shows what the pane itself can take.
+    """
+    from utils.log_utils import append_output
+    from utils.set_proxy import LOG_FLUSH_INTERVAL, LOG_FLUSH_LINES
+    app, window = log_pane()
+    batch_size = max(1, min(LOG_FLUSH_LINES, int(rate * LOG_FLUSH_INTERVAL)))
+    times = []
+    for start in range(0, int(rate * seconds), batch_size):
+        text = "\n".join(LINE.format(i) for i in range(start, start + batch_size))
+        began = time.perf_counter()
+        append_output(window, text)
+        window.output_text.viewport().repaint()
+        app.processEvents()
+        times.append(time.perf_counter() - began)
+    window.output_text.deleteLater()
+    return times
+
+def keeps_up(rate):
+    """The pane keeps up when a typical frame fits the budget and appending takes at most half the GUI thread"""
+    times = frame_times(rate)
+    return statistics.median(times) <= FRAME_BUDGET and sum(times) <= 0.5
+
+@benchmark("lines/s", higher_is_better=True, repeat=3, tolerance=0.5)
+def max_lines_per_second():
+    """Highest rate in RATES at which the pane keeps up; compare with LOG_MAX_LINES_PER_SECOND"""
+    best = 0
+    for rate in RATES:
+        if not keeps_up(rate):
+            break
+        best = rate
+    return best
+
+@benchmark("s", tolerance=0.5)
+def flush_frame_time():
+    """Median frame time for one full flush of LOG_FLUSH_LINES lines"""
+    from utils.set_proxy import LOG_FLUSH_LINES, LOG_FLUSH_INTERVAL
+    return statistics.median(frame_times(LOG_FLUSH_LINES / LOG_FLUSH_INTERVAL))
+
+@benchmark("s", tolerance=0.5)
+def unbatched_frame_time():
+    """Median time per line when every line is appended on its own, as before batching"""
+    from utils.log_utils import append_output
+    app, window = log_pane()
+    times = []
+    for i in range(500):
+        began = time.perf_counter()
+        append_output(window, LINE.format(i))
+        window.output_text.viewport().repaint()
+        app.processEvents()
+        times.append(time.perf_counter() - began)
+    window.output_text.deleteLater()
+    return statistics.median(times)
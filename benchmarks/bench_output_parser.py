@@ -0,0 +1,45 @@
+"""Throughput of the zju-connect output parser on a sample debug log"""
+import os
+import time
+
+from harness import benchmark
+
+SAMPLE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "zju-connect-debug.log")
+PASSES = 40
+
+def sample_lines():
+    with open(SAMPLE_LOG, "r", encoding="utf-8") as f:
+        return f.readlines() * PASSES
+
+def lines_per_second(feed, lines):
+    started = time.perf_counter()
+    for line in lines:
+        feed(line)
+    return len(lines) / (time.perf_counter() - started)
+
+@benchmark("lines/s", higher_is_better=True, tolerance=0.3)
+def parser_throughput():
+    """OutputParser.feed, with its trigger-word screen, over the sample log"""
+    from utils.output_utils import OutputParser
+    return lines_per_second(OutputParser().feed, sample_lines())
+
+@benchmark("lines/s", higher_is_better=True, tolerance=0.3)
+def unscreened_throughput():
+    """The combined event pattern alone on every line, as a reference for what the screen saves"""
+    from utils.output_utils import OutputParser
+    return lines_per_second(OutputParser().pattern.search, sample_lines())
+
+@benchmark("lines/s", higher_is_better=True, tolerance=0.3)
+def state_machine_throughput():
+    """Parsing plus feeding every event to ConnectionStateMachine, as the worker does"""
+    from utils.output_utils import OutputParser, ConnectionStateMachine
+    parser = OutputParser()
+    machine = ConnectionStateMachine(recovery_quiet=3600)
+
+    def feed(line):
+        event = parser.feed(line)
+        if event:
+            machine.handle(event)
+    result = lines_per_second(feed, sample_lines())
+    machine.stop()
+    return result
@@ -0,0 +1,60 @@
+"""Split tunneling rules at scale: compiling 12000 rules, looking hosts up and rendering the PAC script"""
+import ipaddress
+import random
+import time
+
+from harness import benchmark
+
+DOMAIN_RULES = 6000
+NETWORK_RULES = 6000
+LOOKUPS = 20000
+
+def make_rules(seed=0):
+    """Domain and network rules, a tenth of them exceptions, and hosts that hit, miss and straddle them"""
+    rng = random.Random(seed)
+    words = ["hitsz", "hit", "edu", "lib", "jw", "vpn", "mail", "cdn", "api", "www", "cs", "ee"]
+    tlds = ["cn", "com", "net", "org"]
+    lines, hosts = [], []
+    for index in range(DOMAIN_RULES):
+        domain = f"{rng.choice(words)}{index}.{rng.choice(words)}.{rng.choice(tlds)}"
+        lines.append(("!" if index % 10 == 0 else "") + domain)
+        hosts.append(f"{rng.choice(words)}.{domain}")
+        hosts.append(f"{rng.choice(words)}{index}.example.{rng.choice(tlds)}")
+    for index in range(NETWORK_RULES):
+        length = rng.randint(8, 30)
+        network = ipaddress.IPv4Network((rng.getrandbits(32) >> (32 - length) << (32 - length), length))
+        lines.append(("!" if index % 10 == 0 else "") + str(network))
+        hosts.append(str(network.network_address + rng.randrange(network.num_addresses)))
+        hosts.append(str(ipaddress.IPv4Address(rng.getrandbits(32))))
+    rng.shuffle(hosts)
+    return lines, hosts[:LOOKUPS]
+
+LINES, HOSTS = make_rules()
+
+@benchmark("ms", tolerance=0.5)
+def compile_time():
+    """RuleSet over 6000 domain and 6000 network rules"""
+    from utils.pac_utils import RuleSet
+    started = time.perf_counter()
+    RuleSet(LINES)
+    return (time.perf_counter() - started) * 1000
+
+@benchmark("us", tolerance=0.5)
+def route_time():
+    """One RuleSet.route() against the 12000 rules, over a mix of domains and addresses"""
+    from utils.pac_utils import RuleSet
+    rules = RuleSet(LINES)
+    route = rules.route
+    started = time.perf_counter()
+    for host in HOSTS:
+        route(host)
+    return (time.perf_counter() - started) / len(HOSTS) * 1e6
+
+@benchmark("ms", tolerance=0.5)
+def pac_render_time():
+    """RuleSet.to_pac() for the 12000 rules, as on every reload of the rules file"""
+    from utils.pac_utils import RuleSet
+    rules = RuleSet(LINES)
+    started = time.perf_counter()
+    rules.to_pac(http_port=1080, socks_port=1081)
+    return (time.perf_counter() - started) * 1000
@@ -0,0 +1,92 @@
+"""Time to ready with several server endpoints, racing them on connect or taking a prefetched winner"""
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+from harness import benchmark, core_command, WorkerRun
+
+# Stand-ins for two EasyConnect servers, one nearer than the other; each sleeps this long
+# before its TLS handshake, in place of the network round trips to a real server
+ENDPOINT_DELAYS = (0.02, 0.06)
+
+class TlsEndpoint:
+    """A local TLS server that completes the handshake after a delay and then hangs up"""
+
+    def __init__(self, delay, context):
+        self.delay = delay
+        self.context = context
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handshake, args=(client,), daemon=True).start()
+
+    def _handshake(self, client):
+        time.sleep(self.delay)
+        try:
+            with self.context.wrap_socket(client, server_side=True):
+                pass
+        except OSError:
+            client.close()
+
+    def close(self):
+        self.server.close()
+
+_context = None
+
+def server_context():
+    """A TLS context with a throwaway self-signed certificate, made once with the openssl tool"""
+    global _context
+    if _context is None:
+        directory = tempfile.mkdtemp(prefix="hitsz-connect-tls-")
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                       check=True, capture_output=True)
+        _context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        _context.load_cert_chain(cert, key)
+    return _context
+
+def time_to_ready(prefetched):
+    from utils.command_utils import build_zju_connect_args
+    from utils.output_utils import STATE_READY
+    from utils.prefetch_utils import Prefetcher
+    servers = [TlsEndpoint(delay, server_context()) for delay in ENDPOINT_DELAYS]
+    endpoints = [("127.0.0.1", server.port) for server in servers]
+    prefetcher = None
+    if prefetched:
+        # Done while the app is idle, before the user clicks connect, so it is not timed
+        prefetcher = Prefetcher(lambda: endpoints, lambda: True)
+        prefetcher.refresh()
+    command_args = core_command(login_delay=0)[0]
+    try:
+        run = WorkerRun(command_args, endpoints=endpoints, prefetcher=prefetcher)
+        run.wait_for(lambda: STATE_READY in run.states)
+        elapsed = run.state_times[STATE_READY] - run.started
+        run.stop()
+    finally:
+        for server in servers:
+            server.close()
+    return elapsed
+
+@benchmark("s", repeat=9, tolerance=0.5)
+def race_time_to_ready():
+    """Worker start until ready with two endpoints raced on connect"""
+    return time_to_ready(prefetched=False)
+
+@benchmark("s", repeat=9, tolerance=0.5)
+def prefetched_time_to_ready():
+    """Worker start until ready with the race already won by the prefetcher"""
+    return time_to_ready(prefetched=True)
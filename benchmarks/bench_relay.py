@@ -0,0 +1,85 @@
+"""Aggregate throughput of the multi-tunnel relay as the number of tunnels grows"""
+import socket
+import threading
+import time
+
+from harness import benchmark
+
+TUNNEL_RATE = 10 * 1024 * 1024  # bytes per second one stand-in tunnel can carry
+DOWNLOADS = 8
+DOWNLOAD_BYTES = 2 * 1024 * 1024
+CHUNK = 64 * 1024
+
+class ThrottledTunnel:
+    """Stand-in for one zju-connect session: every connection streams data, sharing one rate cap"""
+
+    def __init__(self, rate=TUNNEL_RATE):
+        self.rate = rate
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+        self._lock = threading.Lock()
+        self._next_send = 0.0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._stream, args=(client,), daemon=True).start()
+
+    def _stream(self, client):
+        chunk = b"\x00" * CHUNK
+        with client:
+            try:
+                for _ in range(DOWNLOAD_BYTES // CHUNK):
+                    with self._lock:
+                        now = time.perf_counter()
+                        send_at = max(now, self._next_send)
+                        self._next_send = send_at + CHUNK / self.rate
+                    time.sleep(send_at - now)
+                    client.sendall(chunk)
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+def download(port, received, index):
+    with socket.create_connection(("127.0.0.1", port), timeout=30) as sock:
+        while data := sock.recv(CHUNK):
+            received[index] += len(data)
+
+def aggregate_throughput(tunnels):
+    """MiB/s of DOWNLOADS parallel downloads through a relay in front of that many stand-in tunnels"""
+    from utils.relay_utils import Relay, RelayBackend
+    from utils.port_utils import find_free_ports
+    upstreams = [ThrottledTunnel() for _ in range(tunnels)]
+    listen_port = find_free_ports(1)[0]
+    relay = Relay({"socks": listen_port}, [RelayBackend(i, {"socks": t.port}) for i, t in enumerate(upstreams)])
+    relay.start()
+    received = [0] * DOWNLOADS
+    threads = [threading.Thread(target=download, args=(listen_port, received, i)) for i in range(DOWNLOADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    relay.close()
+    for upstream in upstreams:
+        upstream.close()
+    assert sum(received) == DOWNLOADS * DOWNLOAD_BYTES
+    return sum(received) / elapsed / 1024 / 1024
+
+def scaling(tunnels):
+    def measure():
+        return aggregate_throughput(tunnels)
+    measure.__name__ = f"aggregate_throughput_{tunnels}_tunnels"
+    return benchmark("MiB/s", higher_is_better=True, repeat=3, tolerance=0.2)(measure)
+
+for count in (1, 2, 4, 8):
+    scaling(count)
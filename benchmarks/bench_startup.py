@@ -0,0 +1,97 @@
+"""Startup time and memory of the headless CLI compared with the GUIs"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import benchmark, ROOT, FAKE_CORE
+
+def environment():
+    """A fresh home, so every run starts from default settings, with Qt rendering offscreen"""
+    home = tempfile.mkdtemp(prefix="hitsz-connect-home-")
+    return dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, ".config"),
+                XDG_DATA_HOME=os.path.join(home, ".local", "share"), QT_QPA_PLATFORM="offscreen",
+                HITSZ_CONNECT_CORE=FAKE_CORE, FAKE_CORE_SCENARIO="normal", FAKE_CORE_LOGIN_DELAY="0",
+                HITSZ_CONNECT_PASSWORD="secret")
+
+# Peak RSS carries over from the parent when a process is forked and then execs, so the
+# measured program is spawned from this minimal launcher instead of from the benchmark
+# process. The launcher itself is well under the RSS of anything it measures.
+LAUNCHER = """
+import os, signal, sys
+os.write(1, b"spawning\\n")
+pid = os.posix_spawn(sys.argv[1], sys.argv[1:], os.environ)
+signal.signal(signal.SIGTERM, lambda *_: os.kill(pid, signal.SIGTERM))
+_, status, usage = os.wait4(pid, 0)
+os.write(2, b"maxrss %d\\n" % usage.ru_maxrss)
+"""
+
+def run_until(args, ready, stop=None):
+    """Start args, wait for an output line containing ready, then stop it if it is still running.
+
+    Returns the seconds from launch to that line and the process's peak RSS in MB, which
+    does not include zju-connect.
+    """
+    process = subprocess.Popen([sys.executable, "-S", "-c", LAUNCHER, *args], cwd=ROOT, env=environment(),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    started = time.perf_counter()
+    elapsed = None
+    for line in process.stdout:
+        if ready in line:
+            elapsed = time.perf_counter() - started
+            break
+    if stop is not None:
+        process.send_signal(stop)
+    _, errors = process.communicate()
+    if elapsed is None:
+        raise RuntimeError(f"{' '.join(args)} exited before printing {ready!r}")
+    return elapsed, int(errors.rsplit("maxrss ", 1)[1]) / 1024
+
+def cli_run():
+    from utils.port_utils import find_free_ports
+    http_port, socks_port = find_free_ports(2)
+    return run_until([sys.executable, "-m", "utils.cli", "--username", "student", "--no-proxy",
+                      "--http-bind", str(http_port), "--socks-bind", str(socks_port), "run"],
+                     "VPN client started", stop=signal.SIGTERM)
+
+def gui(script):
+    # --startup-check exits as soon as the tray icon is shown
+    return run_until([sys.executable, script, "--startup-check"], "startup:")
+
+@benchmark("s", tolerance=0.5)
+def cli_status_time():
+    """Launch to exit of `python -m utils.cli status`, the CLI's cold start"""
+    return run_until([sys.executable, "-m", "utils.cli", "status"], "daemon")[0]
+
+@benchmark("s", tolerance=0.5)
+def cli_ready_time():
+    """Launch of `python -m utils.cli run` until the tunnel is ready"""
+    return cli_run()[0]
+
+@benchmark("MB", repeat=3, tolerance=0.2)
+def cli_peak_rss():
+    """Peak RSS of `python -m utils.cli run` with the tunnel up"""
+    return cli_run()[1]
+
+@benchmark("s", tolerance=0.5)
+def gui_startup_time():
+    """Launch of main.py until the tray icon is shown"""
+    return gui("main.py")[0]
+
+@benchmark("MB", repeat=3, tolerance=0.2)
+def gui_peak_rss():
+    """Peak RSS of main.py by the time the tray icon is shown"""
+    return gui("main.py")[1]
+
+@benchmark("s", tolerance=0.5)
+def fluent_startup_time():
+    """Launch of main_fluent.py until the tray icon is shown"""
+    return gui("main_fluent.py")[0]
+
+@benchmark("MB", repeat=3, tolerance=0.2)
+def fluent_peak_rss():
+    """Peak RSS of main_fluent.py by the time the tray icon is shown"""
+    return gui("main_fluent.py")[1]
@@ -0,0 +1,129 @@
+"""What traffic statistics cost: the relay in the data path, and sampling its counters"""
+import socket
+import statistics
+import threading
+import time
+
+from harness import benchmark, Sink, send_through
+
+TRANSFER_BYTES = 64 * 1024 * 1024
+CONNECTIONS = 200
+SAMPLES = 2000
+
+class Echo:
+    """A local server that answers every byte with the same byte, for connection round trips"""
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._echo, args=(client,), daemon=True).start()
+
+    def _echo(self, client):
+        with client:
+            try:
+                while data := client.recv(1024):
+                    client.sendall(data)
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+class Target:
+    """Port to connect to for upstream_port, either directly or through a single-tunnel relay"""
+
+    def __init__(self, upstream_port, relayed):
+        from utils.relay_utils import Relay, RelayBackend
+        from utils.port_utils import find_free_ports
+        self.relay = None
+        self.port = upstream_port
+        if relayed:
+            self.port = find_free_ports(1)[0]
+            self.relay = Relay({"socks": self.port}, [RelayBackend(0, {"socks": upstream_port})])
+            self.relay.start()
+
+    def close(self):
+        if self.relay:
+            self.relay.close()
+
+def throughput(relayed):
+    sink = Sink()
+    target = Target(sink.port, relayed)
+    try:
+        with socket.create_connection(("127.0.0.1", target.port), timeout=30) as sock:
+            elapsed = send_through(sock, TRANSFER_BYTES)
+    finally:
+        target.close()
+        sink.close()
+    return TRANSFER_BYTES / elapsed / 1e6
+
+def connect_latency(relayed):
+    """Median time to open a connection and get a one-byte reply, in milliseconds"""
+    echo = Echo()
+    target = Target(echo.port, relayed)
+    times = []
+    try:
+        for _ in range(CONNECTIONS):
+            started = time.perf_counter()
+            with socket.create_connection(("127.0.0.1", target.port), timeout=10) as sock:
+                sock.sendall(b"x")
+                sock.recv(1)
+            times.append(time.perf_counter() - started)
+    finally:
+        target.close()
+        echo.close()
+    return statistics.median(times) * 1000
+
+def sample_cost(connections):
+    """Microseconds per TrafficSampler.sample() with that many connections open"""
+    from utils.relay_utils import Relay
+    from utils.metrics_utils import TrafficSampler
+    relay = Relay({}, [])
+    for index in range(connections):
+        flow = [index * 1024, index * 4096]
+        relay._flows[id(flow)] = flow
+    sampler = TrafficSampler(relay)
+    started = time.perf_counter()
+    for _ in range(SAMPLES):
+        sampler.sample()
+    return (time.perf_counter() - started) / SAMPLES * 1e6
+
+@benchmark("MB/s", higher_is_better=True, repeat=3, tolerance=0.3)
+def direct_throughput():
+    """One bulk upload straight to a local sink, the path without traffic statistics"""
+    return throughput(relayed=False)
+
+@benchmark("MB/s", higher_is_better=True, repeat=3, tolerance=0.3)
+def relay_throughput():
+    """The same upload through the relay that traffic statistics put in front of zju-connect"""
+    return throughput(relayed=True)
+
+@benchmark("ms", tolerance=0.5)
+def direct_connect_latency():
+    """New connection and one-byte round trip straight to a local echo server"""
+    return connect_latency(relayed=False)
+
+@benchmark("ms", tolerance=0.5)
+def relay_connect_latency():
+    """New connection and one-byte round trip through the relay"""
+    return connect_latency(relayed=True)
+
+@benchmark("us", tolerance=0.5)
+def sample_cost_idle():
+    """TrafficSampler.sample() with no open connections"""
+    return sample_cost(0)
+
+@benchmark("us", tolerance=0.5)
+def sample_cost_1000_connections():
+    """TrafficSampler.sample() with 1000 open connections"""
+    return sample_cost(1000)
@@ -0,0 +1,157 @@
+"""Shared pieces of the benchmark suite: registration, the fake zju-connect and a worker driver"""
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_CORE = os.path.join(ROOT, "tests", "fake_core", "zju-connect")
+CORE_CONFIG = {"server": "vpn.hitsz.edu.cn", "port": "443", "dns": "10.248.98.30", "keep_alive": True,
+               "debug_dump": False}
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BENCHMARKS = []
+
+class Benchmark:
+    def __init__(self, name, function, unit, higher_is_better, repeat, tolerance):
+        self.name = name
+        self.function = function
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+        self.repeat = repeat
+        self.tolerance = tolerance
+
+    def run(self):
+        """Median of repeat runs, so one slow run does not decide the result"""
+        return statistics.median(self.function() for _ in range(self.repeat))
+
+def benchmark(unit, higher_is_better=False, repeat=5, tolerance=0.25):
+    """Register a function returning one measurement; tolerance is the allowed relative regression"""
+    def register(function):
+        BENCHMARKS.append(Benchmark(f"{function.__module__}.{function.__name__}", function, unit,
+                                    higher_is_better, repeat, tolerance))
+        return function
+    return register
+
+def qt_app():
+    """The shared application; a QApplication, so widget benchmarks can run in the same process"""
+    from PySide6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+def use_temporary_app_data(directory):
+    """Write session logs under directory instead of the user's app data"""
+    from utils import log_utils
+    os.environ["XDG_DATA_HOME"] = directory
+    log_utils._session_log = None
+
+def core_command(scenario="normal", **env):
+    """zju-connect arguments running the fake core, with its HTTP and SOCKS ports"""
+    from utils.command_utils import build_zju_connect_args, CORE_PATH_ENV
+    from utils.port_utils import find_free_ports
+    os.environ[CORE_PATH_ENV] = FAKE_CORE
+    os.environ["FAKE_CORE_SCENARIO"] = scenario
+    for name in [name for name in os.environ if name.startswith("FAKE_CORE_") and name != "FAKE_CORE_SCENARIO"]:
+        del os.environ[name]
+    for name, value in env.items():
+        os.environ[f"FAKE_CORE_{name.upper()}"] = str(value)
+    http_port, socks_port = find_free_ports(2)
+    config = dict(CORE_CONFIG, http_bind=str(http_port), socks_bind=str(socks_port))
+    return build_zju_connect_args("student", "secret", config), http_port, socks_port
+
+class WorkerRun:
+    """Start a CommandWorker on the fake core and pump Qt events while waiting on it"""
+
+    def __init__(self, command_args, **worker_args):
+        from PySide6.QtCore import Qt
+        from utils.set_proxy import CommandWorker
+        self.app = qt_app()
+        self.worker = CommandWorker(command_args, False, **worker_args)
+        self.states = []
+        self.state_times = {}
+        self.done = threading.Event()
+        self.worker.state_changed.connect(self.states.append)
+        # Timestamped on the worker thread, as the state changes rather than when Qt delivers it
+        self.worker.state_changed.connect(self._record_state, Qt.DirectConnection)
+        self.worker.finished.connect(self.done.set)
+        self.started = time.perf_counter()
+        self.worker.start()
+
+    def _record_state(self, state):
+        self.state_times.setdefault(state, time.perf_counter())
+
+    def wait_for(self, predicate, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"fake core did not get there; states {self.states}")
+            self.app.processEvents()
+            time.sleep(0.001)
+
+    def stop(self, timeout=5.0):
+        """Stop the worker and return how long it took to finish"""
+        from PySide6.QtCore import QCoreApplication, QEvent
+        started = time.perf_counter()
+        self.worker.stop(timeout=timeout)
+        self.wait_for(self.done.is_set)
+        elapsed = time.perf_counter() - started
+        self.worker.wait()
+        self.worker.deleteLater()
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        return elapsed
+
+def socks_connect(proxy_port, host, port):
+    """A socket connected to host:port through the SOCKS5 proxy on proxy_port"""
+    sock = socket.create_connection(("127.0.0.1", proxy_port), timeout=10)
+    sock.sendall(b"\x05\x01\x00")
+    sock.recv(2)
+    sock.sendall(b"\x05\x01\x00\x01" + socket.inet_aton(host) + port.to_bytes(2, "big"))
+    reply = b""
+    while len(reply) < 10:
+        reply += sock.recv(10 - len(reply))
+    if reply[1] != 0:
+        raise OSError(f"SOCKS5 connect failed with code {reply[1]}")
+    return sock
+
+class Sink:
+    """A local server that reads and discards everything sent to it, then answers with one byte"""
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._drain, args=(client,), daemon=True).start()
+
+    def _drain(self, client):
+        with client:
+            while client.recv(256 * 1024):
+                pass
+            try:
+                client.sendall(b"\x00")
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+def send_through(sock, total, chunk=b"\x00" * (256 * 1024)):
+    """Send total bytes, wait for the sink to acknowledge, and return the elapsed seconds"""
+    started = time.perf_counter()
+    sent = 0
+    while sent < total:
+        sock.sendall(chunk)
+        sent += len(chunk)
+    sock.shutdown(socket.SHUT_WR)
+    sock.recv(1)
+    return time.perf_counter() - started
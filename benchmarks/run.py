@@ -0,0 +1,73 @@
+"""Run the benchmark suite and compare it with the stored baseline.
+
+    python benchmarks/run.py                    # run everything, exit 1 on a regression
+    python benchmarks/run.py -k core            # only benchmarks whose name contains "core"
+    python benchmarks/run.py --update-baseline  # store the results as the new baseline
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baseline.json")
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import harness
+
+def load_benchmarks(selection):
+    for name in sorted(os.listdir(BENCHMARKS_DIR)):
+        if name.startswith("bench_") and name.endswith(".py"):
+            importlib.import_module(name[:-3])
+    return [bench for bench in harness.BENCHMARKS if not selection or any(s in bench.name for s in selection)]
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(bench, value, baseline):
+    """Relative change against the baseline, positive when worse, or None without a baseline"""
+    previous = baseline.get(bench.name, {}).get("value")
+    if not previous:
+        return None
+    change = (value - previous) / previous
+    return -change if bench.higher_is_better else change
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("-k", action="append", default=[], help="run only benchmarks whose name contains this")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    harness.use_temporary_app_data(tempfile.mkdtemp(prefix="hitsz-connect-bench-"))
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+    for bench in load_benchmarks(args.k):
+        value = bench.run()
+        results[bench.name] = {"value": round(value, 6), "unit": bench.unit, "higher_is_better": bench.higher_is_better}
+        change = compare(bench, value, baseline)
+        verdict = "" if change is None else f"{change:+.0%}"
+        if change is not None and change > bench.tolerance:
+            verdict += " REGRESSION"
+            regressions.append(bench.name)
+        print(f"{bench.name:<50} {value:>14.4f} {bench.unit:<10} {verdict}", flush=True)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) regressed beyond their tolerance: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
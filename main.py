@@ -1,3 +1,11 @@
+import sys
+import time
+STARTED = time.perf_counter()
+if "--tunnel-daemon" in sys.argv:
+    # Detached tunnel supervisor: runs without loading Qt
+    from utils.tunnel_daemon import main as tunnel_daemon_main
+    sys.exit(tunnel_daemon_main())
+
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QLabel, QLineEdit, QCheckBox, QPushButton, 
     QTextEdit, QVBoxLayout, QHBoxLayout, QWidget
@@ -5,15 +13,17 @@ from PySide6.QtWidgets import (
 from PySide6.QtGui import QIcon
 from PySide6.QtCore import QTimer
 from platform import system
-from utils.tray_utils import handle_close_event, quit_app, init_tray_icon
+from utils.tray_utils import handle_close_event, quit_app, init_tray_icon, show_panel
 from utils.credential_utils import save_credentials
-from utils.connection_utils import start_connection, stop_connection
+from utils.connection_utils import (start_connection, stop_connection, start_prefetch, attach_tunnel,
+                                    update_metrics_server, restore_panel_state, set_connect_checked)
 from utils.common import get_resource_path, get_version
 from utils.password_utils import toggle_password_visibility
 from utils.menu_utils import setup_menubar, check_for_updates
 if system() == "Darwin":
     from utils.macos_utils import hide_dock_icon
 from utils.config_utils import load_settings
+from utils.startup_utils import probe_launch_at_login_async, report_startup
 
 VERSION = get_version()
 
@@ -24,13 +34,19 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(300, 450) 
         
         self.worker = None
+        self.output_text = None
         self.load_settings()
-        setup_menubar(self, VERSION)
-        self.setup_ui()
+        # Tray first: the panel is only built when it is first shown, which silent mode may never do
         self.tray_icon = init_tray_icon(self)
+        if not self.silent_mode:
+            self.build_panel()
+        probe_launch_at_login_async()
+        start_prefetch(self)
+        update_metrics_server(self)
+        attach_tunnel(self)
         
         if self.connect_startup:
-            QTimer.singleShot(5000, lambda: self.connect_button.setChecked(True))
+            QTimer.singleShot(5000, lambda: set_connect_checked(self, True))
 
         if self.check_update:
             QTimer.singleShot(1000, lambda: check_for_updates(parent=self, current_version=VERSION, startup=True))
@@ -67,6 +83,8 @@ class MainWindow(QMainWindow):
         status_layout.addWidget(QLabel("运行信息"))
         layout.addLayout(status_layout)
         status_layout.addStretch()
+        self.rate_label = QLabel()
+        status_layout.addWidget(self.rate_label)
         self.status_label = QLabel("状态: 未连接")
         status_layout.addWidget(self.status_label)
 
@@ -78,9 +96,10 @@ class MainWindow(QMainWindow):
         button_layout = QHBoxLayout()
         self.connect_button = QPushButton("连接")
         self.connect_button.setCheckable(True)
-        self.connect_button.toggled.connect(lambda: self.start_connection() if self.connect_button.isChecked() else self.stop_connection())
         self.connect_button.toggled.connect(lambda: self.connect_button.setText("断开") if self.connect_button.isChecked() else self.connect_button.setText("连接"))
-        self.connect_button.toggled.connect(self.save_credentials)
+        # The tray action drives the connection; the button only mirrors it
+        self.connect_button.toggled.connect(self.connect_action.setChecked)
+        self.connect_action.toggled.connect(self.connect_button.setChecked)
         button_layout.addWidget(self.connect_button)
 
         button_layout.addStretch()
@@ -96,6 +115,17 @@ class MainWindow(QMainWindow):
         container.setLayout(layout)
         self.setCentralWidget(container)
 
+    def build_panel(self):
+        """Build the menu bar and widgets and bring them up to date with the current state"""
+        setup_menubar(self, VERSION)
+        self.setup_ui()
+        restore_panel_state(self)
+
+    def destroy_panel(self):
+        """Delete the widgets built by build_panel; the window itself stays as the app's state holder"""
+        self.takeCentralWidget().deleteLater()
+        self.setMenuWidget(None)
+
     def closeEvent(self, event):
         handle_close_event(self, event, self.tray_icon)
 
@@ -134,7 +164,8 @@ if __name__ == "__main__":
     app.setWindowIcon(app_icon)
     
     if not window.silent_mode:
-        window.show()
+        show_panel(window)
+    QTimer.singleShot(0, lambda: report_startup(window, STARTED))
     
     if system() == "Darwin":
         hide_dock_icon(window.hide_dock_icon)
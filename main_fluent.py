@@ -1,3 +1,11 @@
+import sys
+import time
+STARTED = time.perf_counter()
+if "--tunnel-daemon" in sys.argv:
+    # Detached tunnel supervisor: runs without loading Qt
+    from utils.tunnel_daemon import main as tunnel_daemon_main
+    sys.exit(tunnel_daemon_main())
+
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget
 )
@@ -7,24 +15,44 @@ from qfluentwidgets import (PushButton, CheckBox, LineEdit, TextEdit, PasswordLi
 from PySide6.QtGui import QIcon
 from PySide6.QtCore import QTimer
 from platform import system
-from utils.tray_utils import handle_close_event, quit_app, init_tray_icon
+from utils.tray_utils import handle_close_event, quit_app, init_tray_icon, show_panel
 from utils.credential_utils import save_credentials
-from utils.connection_utils import start_connection, stop_connection
+from utils.connection_utils import (start_connection, stop_connection, start_prefetch, attach_tunnel,
+                                    update_metrics_server, restore_panel_state, set_connect_checked)
 from utils.common import get_resource_path, get_version
 from utils.menu_utils_fluent import setup_menubar, check_for_updates
 from utils.config_utils import load_settings
+from utils.startup_utils import probe_launch_at_login_async, report_startup
 
 VERSION = get_version()
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.themeListener = SystemThemeListener(self)
         self.setWindowTitle("HITSZ Connect Verge")
         self.setMinimumSize(300, 450)  
         
         self.worker = None
-        
+        self.output_text = None
+        self.themeListener = None
+        self.load_settings()
+        # Tray first: the panel is only built when it is first shown, which silent mode may never do
+        self.tray_icon = init_tray_icon(self)
+        if not self.silent_mode:
+            self.build_panel()
+        probe_launch_at_login_async()
+        start_prefetch(self)
+        update_metrics_server(self)
+        attach_tunnel(self)
+
+        if self.connect_startup:
+            QTimer.singleShot(5000, lambda: set_connect_checked(self, True))
+
+        if self.check_update:
+            QTimer.singleShot(1000, lambda: check_for_updates(parent=self, current_version=VERSION, startup=True))
+
+    def build_panel(self):
+        """Build the command bar, widgets and theme listener and bring them up to date with the current state"""
         # Create central widget and main layout first
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -33,23 +61,23 @@ class MainWindow(QMainWindow):
         # Setup interface
         self.command_bar = setup_menubar(self, VERSION)
         self.main_layout.addWidget(self.command_bar)
-        self.load_settings()
         self.setup_ui()
-        self.tray_icon = init_tray_icon(self)
-
-        if self.connect_startup:
-            QTimer.singleShot(5000, lambda: self.connect_button.setChecked(True))
-        
-        if self.silent_mode:
-            QTimer.singleShot(0, lambda: self.hide())
-
-        if self.check_update:
-            QTimer.singleShot(1000, lambda: check_for_updates(parent=self, current_version=VERSION, startup=True))
+        restore_panel_state(self)
 
         setTheme(Theme.AUTO)
+        self.themeListener = SystemThemeListener(self)
         self.themeListener.start()
         self.themeListener.systemThemeChanged.connect(lambda: setTheme(Theme.AUTO))
 
+    def destroy_panel(self):
+        """Delete what build_panel created; the window itself stays as the app's state holder"""
+        self.themeListener.terminate()
+        self.themeListener.deleteLater()
+        self.themeListener = None
+        self.takeCentralWidget().deleteLater()
+        self.central_widget = None
+        self.main_layout = None
+
     def setup_ui(self):
         # Create a container for the main content
         content_widget = QWidget()
@@ -78,6 +106,8 @@ class MainWindow(QMainWindow):
         status_layout = QHBoxLayout()
         status_layout.addWidget(BodyLabel("运行信息"))
         status_layout.addStretch()
+        self.rate_label = BodyLabel()
+        status_layout.addWidget(self.rate_label)
         self.status_icon = IconInfoBadge(FluentIcon.CANCEL_MEDIUM)
         status_layout.addWidget(self.status_icon)
         self.status_label = BodyLabel("状态: 未连接")
@@ -90,9 +120,10 @@ class MainWindow(QMainWindow):
         # Buttons
         button_layout = QHBoxLayout()
         self.connect_button = TogglePushButton("连接")
-        self.connect_button.toggled.connect(lambda: self.start_connection() if self.connect_button.isChecked() else self.stop_connection())
         self.connect_button.toggled.connect(lambda: self.connect_button.setText("断开") if self.connect_button.isChecked() else self.connect_button.setText("连接"))
-        self.connect_button.toggled.connect(self.save_credentials)
+        # The tray action drives the connection; the button only mirrors it
+        self.connect_button.toggled.connect(self.connect_action.setChecked)
+        self.connect_action.toggled.connect(self.connect_button.setChecked)
         button_layout.addWidget(self.connect_button)
 
         button_layout.addStretch()
@@ -108,8 +139,6 @@ class MainWindow(QMainWindow):
         handle_close_event(self, event, self.tray_icon)
 
     def quit_app(self):
-        self.themeListener.terminate()
-        self.themeListener.deleteLater()
         quit_app(self, self.tray_icon)
 
     def save_credentials(self):
@@ -143,5 +172,6 @@ if __name__ == "__main__":
     
     window = MainWindow()
     if not window.silent_mode:
-        window.show()
+        show_panel(window)
+    QTimer.singleShot(0, lambda: report_startup(window, STARTED))
     app.exec()
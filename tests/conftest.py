@@ -0,0 +1,75 @@
+import json
+import os
+import pytest
+
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+
+class StubTool:
+    """A stub executable from tests/stubs with its own state file and command log"""
+
+    def __init__(self, name, directory, state):
+        self.path = os.path.join(STUBS_DIR, name)
+        self.state_path = os.path.join(directory, f"{name}.json")
+        self.log_path = os.path.join(directory, f"{name}.log")
+        self.write_state(state)
+
+    def read_state(self):
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def commands(self):
+        """Arguments of every invocation so far"""
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def writes(self):
+        return [args for args in self.commands() if args[0] == "set" or args[0].startswith("-set")]
+
+@pytest.fixture
+def stub_tool(tmp_path, monkeypatch):
+    """Factory for stub tools; the stubs find their state through STUB_STATE and STUB_LOG"""
+    def make(name, state):
+        tool = StubTool(name, str(tmp_path), state)
+        monkeypatch.setenv("STUB_STATE", tool.state_path)
+        monkeypatch.setenv("STUB_LOG", tool.log_path)
+        return tool
+    return make
+
+FAKE_CORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_core", "zju-connect")
+CORE_CONFIG = {"server": "vpn.hitsz.edu.cn", "port": "443", "dns": "10.248.98.30", "keep_alive": True,
+               "debug_dump": False}
+
+@pytest.fixture
+def app_data(tmp_path, monkeypatch):
+    """Keep session logs and other app data under the test's temporary directory"""
+    from utils import log_utils
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path / "data"))
+    monkeypatch.setattr(log_utils, "_session_log", None)
+    return tmp_path / "data"
+
+@pytest.fixture(scope="session")
+def qt_app():
+    from PySide6.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication([])
+
+@pytest.fixture
+def fake_core(monkeypatch, app_data):
+    """Factory for zju-connect command lines that run tests/fake_core with the given scenario"""
+    from utils.command_utils import build_zju_connect_args, CORE_PATH_ENV
+    from utils.port_utils import find_free_ports
+    monkeypatch.setenv(CORE_PATH_ENV, FAKE_CORE)
+
+    def make(scenario="normal", **env):
+        monkeypatch.setenv("FAKE_CORE_SCENARIO", scenario)
+        for name, value in env.items():
+            monkeypatch.setenv(f"FAKE_CORE_{name.upper()}", str(value))
+        http_port, socks_port = find_free_ports(2)
+        config = dict(CORE_CONFIG, http_bind=str(http_port), socks_bind=str(socks_port))
+        return build_zju_connect_args("student", "secret", config), http_port, socks_port
+    return make
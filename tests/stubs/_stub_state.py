@@ -0,0 +1,22 @@
+"""Shared helpers for the stub system tools: a JSON state file and a command log, both locked"""
+import fcntl
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+@contextmanager
+def locked_state():
+    """Yield the state dict from $STUB_STATE and write it back afterwards, holding a lock throughout"""
+    path = os.environ["STUB_STATE"]
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        yield state
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        log_path = os.environ.get("STUB_LOG")
+        if log_path:
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(sys.argv[1:]) + "\n")
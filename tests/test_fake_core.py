@@ -0,0 +1,167 @@
+import gzip
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PySide6.QtCore import QCoreApplication, QEvent
+
+from utils.set_proxy import CommandWorker, LOG_MAX_LINES_PER_SECOND
+from utils.output_utils import STATE_READY, STATE_STOPPED
+from utils.reconnect_utils import EXIT_STOPPED, EXIT_AUTH_FAILURE, EXIT_CRASH
+from utils.health_utils import probe_socks, probe_http
+
+class Run:
+    """A CommandWorker with everything it emitted recorded"""
+
+    def __init__(self, qt_app, command_args):
+        self.qt_app = qt_app
+        self.worker = CommandWorker(command_args, False)
+        self.output = []
+        self.states = []
+        self.progress = []
+        self.done = threading.Event()
+        self.worker.output.connect(self.output.append)
+        self.worker.state_changed.connect(self.states.append)
+        self.worker.stop_progress.connect(self.progress.append)
+        self.worker.finished.connect(self.done.set)
+        self.worker.start()
+
+    def wait_for(self, predicate, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            assert time.monotonic() < deadline, f"timed out; states {self.states}, progress {self.progress}"
+            self.qt_app.processEvents()
+            time.sleep(0.01)
+
+    def wait_finished(self, timeout=10.0):
+        self.wait_for(self.done.is_set, timeout)
+        self.worker.wait()
+        self.qt_app.processEvents()
+
+    def stop(self, timeout=2.0):
+        if not self.done.is_set():
+            self.worker.stop(timeout=timeout)
+            self.wait_finished()
+
+@pytest.fixture
+def run_core(qt_app, fake_core):
+    runs = []
+
+    def start(scenario="normal", **env):
+        command_args, http_port, socks_port = fake_core(scenario, **env)
+        run = Run(qt_app, command_args)
+        run.http_port, run.socks_port = http_port, socks_port
+        runs.append(run)
+        return run
+    yield start
+    for run in runs:
+        run.stop(timeout=0.5)
+        # Dispose of the worker the way connection_utils does, with its kill timer
+        run.worker.deleteLater()
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+@pytest.fixture
+def upstream():
+    """A local HTTP server standing in for a campus host"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b"campus"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def http_get(proxy_port, url):
+    with socket.create_connection(("127.0.0.1", proxy_port), timeout=5) as sock:
+        sock.sendall(f"GET {url} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode())
+        response = b""
+        while chunk := sock.recv(4096):
+            response += chunk
+    return response
+
+def test_reaches_ready_and_proxies(run_core, upstream):
+    run = run_core()
+    run.wait_for(lambda: STATE_READY in run.states)
+
+    assert probe_socks("127.0.0.1", run.socks_port, "127.0.0.1", upstream) > 0
+    assert probe_http("127.0.0.1", run.http_port, "127.0.0.1", upstream) > 0
+    response = http_get(run.http_port, f"http://127.0.0.1:{upstream}/")
+    assert response.startswith(b"HTTP/1.0 200") and response.endswith(b"campus")
+
+    run.stop()
+    assert run.worker.exit_reason == EXIT_STOPPED
+    assert run.worker.stop_latency < 1.0
+    assert run.states[-1] == STATE_STOPPED
+
+def test_slow_login_stays_authenticating(run_core):
+    run = run_core(login_delay=0.5)
+    run.wait_for(lambda: run.states)
+    assert STATE_READY not in run.states
+    run.wait_for(lambda: STATE_READY in run.states)
+
+def test_rejected_login_fails_fast(run_core):
+    run = run_core("auth_fail")
+    started = time.monotonic()
+    run.wait_finished()
+
+    assert run.worker.exit_reason == EXIT_AUTH_FAILURE
+    assert time.monotonic() - started < 2.0
+    assert STATE_READY not in run.states
+
+def test_crash_is_classified(run_core):
+    run = run_core("crash", crash_after=0.1)
+    run.wait_finished()
+
+    assert STATE_READY in run.states
+    assert run.worker.exit_reason == EXIT_CRASH
+    assert any("panic" in text for text in run.output)
+
+def test_stop_kills_a_core_that_ignores_terminate(run_core, upstream):
+    run = run_core("hang", ignore_term=1)
+    run.wait_for(lambda: STATE_READY in run.states)
+    with pytest.raises(OSError):
+        probe_socks("127.0.0.1", run.socks_port, "127.0.0.1", upstream, timeout=0.5)
+
+    run.stop(timeout=0.5)
+    assert run.worker.exit_reason == EXIT_STOPPED
+    assert any("killing" in text for text in run.progress)
+    assert 0.4 <= run.worker.stop_latency < 2.0
+
+def test_flood_is_rate_limited_but_logged(run_core, app_data):
+    lines = LOG_MAX_LINES_PER_SECOND * 5
+    run = run_core("flood", flood_lines=lines)
+    run.wait_for(lambda: STATE_READY in run.states)
+    last = f"packet {lines - 1} "
+    run.wait_for(lambda: any(last in line for line in list(run.worker.recent_lines)))
+    run.stop()
+
+    shown = sum(text.count("\n") + 1 for text in run.output)
+    assert shown < lines
+    assert any("lines suppressed" in text for text in run.output)
+    log_dir = app_data / "HITSZ Connect Verge" / "logs"
+    logged = 0
+    for name in os.listdir(log_dir):
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(log_dir / name, "rt", encoding="utf-8") as f:
+            logged += sum(1 for line in f if "debug: packet" in line)
+    assert logged == lines
+
+def test_undecodable_output_does_not_stall_the_worker(run_core):
+    run = run_core("bad_bytes")
+    run.wait_for(lambda: any("undecodable" in text for text in run.output))
+    assert any("�" in text for text in run.output)
+
+    run.stop()
+    assert run.worker.exit_reason == EXIT_STOPPED
@@ -0,0 +1,158 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import FAKE_CORE
+from utils.health_utils import probe_socks, probe_http, parse_target, LatencyWindow, HealthMonitor
+from utils.port_utils import find_free_ports
+
+@pytest.fixture
+def start_proxy():
+    """Run the fake zju-connect as a local stand-in proxy and return its HTTP and SOCKS ports"""
+    processes = []
+
+    def start(scenario="normal"):
+        http_port, socks_port = find_free_ports(2)
+        env = dict(os.environ, FAKE_CORE_SCENARIO=scenario, FAKE_CORE_LOGIN_DELAY="0")
+        process = subprocess.Popen([sys.executable, FAKE_CORE, "-http-bind", f"127.0.0.1:{http_port}",
+                                    "-socks-bind", f"127.0.0.1:{socks_port}"],
+                                   stdout=subprocess.PIPE, text=True, env=env)
+        processes.append(process)
+        for line in process.stdout:
+            if "VPN client started" in line:
+                break
+        return http_port, socks_port
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+@pytest.fixture
+def upstream():
+    """A TCP server that accepts connections, standing in for the internal probe target"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+
+    def accept():
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            client.close()
+    threading.Thread(target=accept, daemon=True).start()
+    yield server.getsockname()[1]
+    server.close()
+
+@pytest.fixture
+def closed_port():
+    return find_free_ports(1)[0]
+
+def test_parse_target():
+    assert parse_target("10.248.98.30:53") == ("10.248.98.30", 53)
+    assert parse_target(" jw.hitsz.edu.cn:443 ") == ("jw.hitsz.edu.cn", 443)
+    assert parse_target("10.248.98.30") == ("10.248.98.30", 53)
+    assert parse_target("10.248.98.30", default_port=80) == ("10.248.98.30", 80)
+
+def test_latency_window_percentiles():
+    window = LatencyWindow(size=101)
+    assert window.summary() == {50: None, 95: None, 99: None}
+    for ms in reversed(range(101)):
+        window.add(ms / 1000)
+    assert window.summary() == {50: 0.05, 95: 0.095, 99: 0.099}
+
+def test_latency_window_keeps_recent_samples():
+    window = LatencyWindow(size=11)
+    for ms in range(100):
+        window.add(ms / 1000)
+    assert len(window.samples) == 11
+    assert window.percentile(0) == 0.089
+    assert window.percentile(50) == 0.094
+
+def test_probes_through_local_proxy(start_proxy, upstream):
+    http_port, socks_port = start_proxy()
+    assert probe_socks("127.0.0.1", socks_port, "127.0.0.1", upstream) > 0
+    assert probe_http("127.0.0.1", http_port, "127.0.0.1", upstream) > 0
+
+def test_probes_fail_for_unreachable_target(start_proxy, closed_port):
+    http_port, socks_port = start_proxy()
+    with pytest.raises(OSError, match="SOCKS5 connect failed"):
+        probe_socks("127.0.0.1", socks_port, "127.0.0.1", closed_port)
+    with pytest.raises(OSError, match="HTTP proxy CONNECT failed"):
+        probe_http("127.0.0.1", http_port, "127.0.0.1", closed_port)
+
+def test_probes_fail_without_proxy(closed_port, upstream):
+    with pytest.raises(OSError):
+        probe_socks("127.0.0.1", closed_port, "127.0.0.1", upstream, timeout=1)
+    with pytest.raises(OSError):
+        probe_http("127.0.0.1", closed_port, "127.0.0.1", upstream, timeout=1)
+
+def test_probe_times_out_on_hung_proxy(start_proxy, upstream):
+    _, socks_port = start_proxy("hang")
+    with pytest.raises(OSError):
+        probe_socks("127.0.0.1", socks_port, "127.0.0.1", upstream, timeout=0.3)
+
+class ScriptedProbe:
+    """Returns the scripted results in turn, None meaning a failed probe, then keeps failing"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def __call__(self):
+        rtt = self.results.pop(0) if self.results else None
+        if rtt is None:
+            raise OSError("probe failed")
+        return rtt
+
+def run_monitor(probe, samples, **kwargs):
+    """Run a HealthMonitor until it has taken samples probes and return it with what it reported"""
+    seen = []
+    unhealthy = []
+    done = threading.Event()
+
+    def on_sample(rtt):
+        seen.append(rtt)
+        if len(seen) >= samples:
+            done.set()
+    monitor = HealthMonitor(probe, interval=0.01, on_sample=on_sample, on_unhealthy=unhealthy.append, **kwargs)
+    monitor.start()
+    assert done.wait(5)
+    monitor.stop()
+    monitor._thread.join(5)
+    return monitor, seen[:samples], unhealthy
+
+def test_monitor_reports_unhealthy_after_consecutive_failures():
+    monitor, seen, unhealthy = run_monitor(ScriptedProbe([0.01, 0.02, None, None, 0.03, None, None, None]), 8,
+                                           failure_threshold=3)
+    assert seen == [0.01, 0.02, None, None, 0.03, None, None, None]
+    assert unhealthy[0] == 3
+    assert list(monitor.latency.samples) == [0.01, 0.02, 0.03]
+
+def test_monitor_ignores_failures_during_startup_grace():
+    _, seen, unhealthy = run_monitor(ScriptedProbe([None] * 5 + [0.01]), 6, failure_threshold=3, startup_grace=60)
+    assert seen[-1] == 0.01
+    assert unhealthy == []
+
+def test_monitor_counts_failures_after_startup_grace():
+    _, _, unhealthy = run_monitor(ScriptedProbe([]), 3, failure_threshold=3, startup_grace=0)
+    assert unhealthy[0] == 3
+
+def test_monitor_detects_hung_proxy(start_proxy, upstream):
+    _, socks_port = start_proxy("hang")
+    probe = lambda: probe_socks("127.0.0.1", socks_port, "127.0.0.1", upstream, timeout=0.1)
+    _, seen, unhealthy = run_monitor(probe, 2, failure_threshold=2, startup_grace=0)
+    assert seen == [None, None]
+    assert unhealthy[0] == 2
+
+def test_monitor_clamps_failure_threshold():
+    monitor, _, unhealthy = run_monitor(ScriptedProbe([0.01] * 10), 3, failure_threshold=0)
+    assert monitor.failure_threshold == 1
+    assert unhealthy == []
+    _, _, unhealthy = run_monitor(ScriptedProbe([0.01]), 2, failure_threshold=-1)
+    assert unhealthy[0] == 1
@@ -0,0 +1,50 @@
+import threading
+import pytest
+from utils.output_utils import (OutputParser, OutputEvent, ConnectionStateMachine, EVENT_ERROR,
+                                EVENT_CONNECTION_ERROR, EVENT_KEEP_ALIVE, EVENT_TUNNEL_READY, EVENT_LOGIN_FAILED,
+                                EVENT_LISTENER_BOUND, STATE_READY, STATE_DEGRADED, STATE_STOPPED)
+
+@pytest.mark.parametrize("line, kind", [
+    ("dial tcp 10.1.1.1:22: i/o timeout", EVENT_CONNECTION_ERROR),
+    ("[ERROR] dial tcp 10.1.1.1:22: connection refused", EVENT_CONNECTION_ERROR),
+    ("socks5 handle error: EOF", EVENT_CONNECTION_ERROR),
+    ('Post "https://vpn.hitsz.edu.cn/": tls handshake timeout', EVENT_ERROR),
+    ("error: unexpected EOF", EVENT_ERROR),
+    ("keep alive: i/o timeout", EVENT_ERROR),
+    ("send keep alive packet", EVENT_KEEP_ALIVE),
+    ("Login failed: invalid password", EVENT_LOGIN_FAILED),
+    ("SOCKS5 server listening on 127.0.0.1:1080", EVENT_LISTENER_BOUND),
+])
+def test_parser_event_kinds(line, kind):
+    assert OutputParser().feed(line).kind == kind
+
+def test_parser_ignores_plain_lines():
+    assert OutputParser().feed("received 1024 bytes") is None
+
+def ready_machine(**kwargs):
+    transitions = []
+    machine = ConnectionStateMachine(lambda old, new, event: transitions.append(new), **kwargs)
+    machine.handle(OutputEvent(EVENT_TUNNEL_READY, ""))
+    return machine, transitions
+
+def test_connection_errors_do_not_degrade():
+    machine, _ = ready_machine()
+    machine.handle(OutputEvent(EVENT_CONNECTION_ERROR, ""))
+    assert machine.state == STATE_READY
+
+def test_degraded_tunnel_recovers_after_quiet_period():
+    recovered = threading.Event()
+    machine = ConnectionStateMachine(lambda old, new, event: new == STATE_READY and old == STATE_DEGRADED
+                                     and recovered.set(), recovery_quiet=0.05)
+    machine.handle(OutputEvent(EVENT_TUNNEL_READY, ""))
+    machine.handle(OutputEvent(EVENT_ERROR, ""))
+    assert machine.state == STATE_DEGRADED
+    assert recovered.wait(2.0)
+    assert machine.state == STATE_READY
+
+def test_stop_cancels_recovery():
+    machine, transitions = ready_machine(recovery_quiet=0.05)
+    machine.handle(OutputEvent(EVENT_ERROR, ""))
+    machine.stop()
+    threading.Event().wait(0.1)
+    assert transitions[-1] == STATE_STOPPED
@@ -0,0 +1,138 @@
+import ipaddress
+import json
+import os
+import random
+import shutil
+import subprocess
+import threading
+import urllib.request
+
+import pytest
+
+from utils import pac_utils
+from utils.pac_utils import RuleSet, PacServer
+
+NODE = shutil.which("node")
+
+def test_longest_domain_suffix_wins():
+    rules = RuleSet(["hitsz.edu.cn", "!vpn.hitsz.edu.cn", "portal.vpn.hitsz.edu.cn"])
+    assert rules.route("hitsz.edu.cn")
+    assert rules.route("jw.hitsz.edu.cn")
+    assert rules.route("JW.HITSZ.EDU.CN.")
+    assert not rules.route("vpn.hitsz.edu.cn")
+    assert not rules.route("a.vpn.hitsz.edu.cn")
+    assert rules.route("portal.vpn.hitsz.edu.cn")
+    assert rules.route("x.portal.vpn.hitsz.edu.cn")
+    # Rules match whole labels only
+    assert not rules.route("nothitsz.edu.cn")
+    assert not rules.route("edu.cn")
+
+def test_exception_rules_go_direct():
+    rules = RuleSet(["10.0.0.0/8", "!10.1.0.0/16", "!example.com", "www.example.com"])
+    assert rules.route("10.2.3.4")
+    assert not rules.route("10.1.3.4")
+    assert not rules.route("example.com")
+    assert not rules.route("cdn.example.com")
+    assert rules.route("www.example.com")
+
+def test_invalid_and_comment_lines_are_skipped():
+    rules = RuleSet(["# a comment", "", "   ", "hit.edu.cn  # trailing comment", "10.0.0.0/33",
+                     "not a rule", "bad_rule", "!", "192.168.1.1"])
+    assert rules.domains.count == 1
+    assert rules.networks.count == 1
+    assert rules.invalid == ["10.0.0.0/33", "not a rule", "bad_rule", "!"]
+    assert rules.route("www.hit.edu.cn")
+    assert rules.route("192.168.1.1")
+    assert not rules.route("192.168.1.2")
+
+def test_repeated_rules_are_counted_once_and_the_last_wins():
+    rules = RuleSet(["hit.edu.cn", "!hit.edu.cn", "10.0.0.0/8", "10.1.2.3/8"])
+    assert rules.domains.count == 1
+    assert rules.networks.count == 1
+    assert not rules.route("hit.edu.cn")
+
+def test_network_boundaries():
+    rules = RuleSet(["10.0.0.0/8", "!10.1.0.0/16", "172.16.0.0/12", "8.8.8.8/32"])
+    assert rules.route("10.0.0.0")
+    assert rules.route("10.255.255.255")
+    assert not rules.route("9.255.255.255")
+    assert not rules.route("11.0.0.0")
+    assert not rules.route("10.1.0.0")
+    assert not rules.route("10.1.255.255")
+    assert rules.route("10.0.255.255")
+    assert rules.route("10.2.0.0")
+    assert rules.route("172.16.0.0")
+    assert rules.route("172.31.255.255")
+    assert not rules.route("172.32.0.0")
+    assert not rules.route("172.15.255.255")
+    assert rules.route("8.8.8.8")
+    assert not rules.route("8.8.8.9")
+    everything = RuleSet(["0.0.0.0/0", "!255.255.255.255"])
+    assert everything.route("0.0.0.0")
+    assert everything.route("255.255.255.254")
+    assert not everything.route("255.255.255.255")
+
+def random_rules_and_hosts(seed=0, count=500):
+    """Overlapping domain and network rules with exceptions, and hosts on and around their edges"""
+    rng = random.Random(seed)
+    labels = ["a", "b", "c", "hit", "edu", "cn", "lib", "vpn", "www"]
+    rules, hosts = [], []
+    for _ in range(count):
+        domain = ".".join(rng.choice(labels) for _ in range(rng.randint(1, 4)))
+        rules.append(("!" if rng.random() < 0.3 else "") + domain)
+        hosts.append(".".join(rng.choice(labels) for _ in range(rng.randint(1, 5))))
+        length = rng.randint(0, 32)
+        network = rng.getrandbits(32) >> (32 - length) << (32 - length) if length else 0
+        rules.append(("!" if rng.random() < 0.3 else "") + f"{ipaddress.IPv4Address(network)}/{length}")
+        for address in (network, network - 1, network + (1 << (32 - length)) - 1, network + (1 << (32 - length)),
+                        rng.getrandbits(32)):
+            hosts.append(str(ipaddress.IPv4Address(address % (1 << 32))))
+    return rules, hosts
+
+@pytest.mark.skipif(NODE is None, reason="needs node to run the PAC script")
+def test_pac_script_agrees_with_route(tmp_path):
+    lines, hosts = random_rules_and_hosts()
+    rules = RuleSet(lines)
+    script = tmp_path / "check.js"
+    script.write_text(rules.to_pac(http_port=1080, socks_port=1081)
+                      + "var hosts = JSON.parse(require('fs').readFileSync(0, 'utf8'));\n"
+                        "console.log(JSON.stringify(hosts.map(function (h) { return FindProxyForURL('', h); })));\n",
+                      encoding="utf-8")
+    result = subprocess.run([NODE, str(script)], input=json.dumps(hosts), capture_output=True, text=True, check=True)
+    proxy = "PROXY 127.0.0.1:1080; SOCKS5 127.0.0.1:1081; SOCKS 127.0.0.1:1081"
+    expected = [proxy if rules.route(host) else "DIRECT" for host in hosts]
+    assert json.loads(result.stdout) == expected
+    assert proxy in expected and "DIRECT" in expected
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+def test_pac_server_reloads_changed_rules(tmp_path, monkeypatch):
+    monkeypatch.setattr(pac_utils, "RELOAD_INTERVAL", 0.05)
+    rules_path = tmp_path / "split_rules.txt"
+    rules_path.write_text("hit.edu.cn\n", encoding="utf-8")
+    reloaded = threading.Event()
+    server = PacServer(str(rules_path), socks_port=1081, on_reload=lambda _: reloaded.set())
+    server.start()
+    try:
+        first_url = server.url
+        assert '"hit.edu.cn": 1' in fetch(first_url)
+        assert '"SOCKS5 127.0.0.1:1081; SOCKS 127.0.0.1:1081"' in fetch(first_url)
+
+        rules_path.write_text("hit.edu.cn\n!lib.hit.edu.cn\n", encoding="utf-8")
+        # The file may change within the filesystem's timestamp resolution
+        mtime = os.path.getmtime(rules_path) + 1
+        os.utime(rules_path, (mtime, mtime))
+        assert reloaded.wait(5)
+        assert server.url != first_url
+        assert '"lib.hit.edu.cn": 0' in fetch(server.url)
+        assert not server.rules.route("lib.hit.edu.cn")
+
+        # Saving the file without changing the rules keeps the same script and URL
+        url = server.url
+        os.utime(rules_path, (mtime + 1, mtime + 1))
+        assert not server.reload()
+        assert server.url == url
+    finally:
+        server.stop()
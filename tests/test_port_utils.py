@@ -0,0 +1,39 @@
+import socket
+
+import pytest
+
+from utils.port_utils import is_port_free, preflight_ports, PortConflictError, InvalidPortError
+
+@pytest.fixture
+def busy_port():
+    """A port with a listener on it, as if another program had taken it"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    yield server.getsockname()[1]
+    server.close()
+
+def test_is_port_free(busy_port):
+    assert not is_port_free(busy_port)
+    assert not is_port_free(70000)
+
+def test_preflight_keeps_free_and_unset_ports():
+    chosen, messages = preflight_ports({"http": None, "socks": None}, auto_allocate=False)
+    assert chosen == {"http": None, "socks": None}
+    assert messages == []
+
+def test_preflight_replaces_busy_port(busy_port):
+    chosen, messages = preflight_ports({"http": busy_port, "socks": None})
+    assert chosen["http"] != busy_port and is_port_free(chosen["http"])
+    assert chosen["socks"] is None
+    assert messages == [f"HTTP port {busy_port} is in use, using {chosen['http']} instead"]
+
+def test_preflight_fails_fast_on_busy_port(busy_port):
+    with pytest.raises(PortConflictError, match=f"SOCKS5 port {busy_port}"):
+        preflight_ports({"http": None, "socks": busy_port}, auto_allocate=False)
+
+@pytest.mark.parametrize("port", [0, 65536, 70000])
+def test_preflight_rejects_out_of_range_port(port):
+    # Automatic selection would hide a setting that can never work
+    with pytest.raises(InvalidPortError, match=f"HTTP port {port}"):
+        preflight_ports({"http": port, "socks": None}, auto_allocate=True)
@@ -0,0 +1,119 @@
+import pytest
+from utils.proxy_backend import diff_state, GnomeProxyBackend, MacProxyBackend
+
+SCHEMA = "org.gnome.system.proxy"
+
+def gnome_state(mode="'none'", host="''", port="0"):
+    state = {SCHEMA: {"mode": mode, "autoconfig-url": "''"}}
+    for protocol in ("http", "https", "socks"):
+        state[f"{SCHEMA}.{protocol}"] = {"host": host, "port": port}
+    return state
+
+def mac_state(services=("Wi-Fi", "Ethernet")):
+    return {"services": list(services), "proxies": {}}
+
+def test_diff_state_keeps_only_changed_entries():
+    current = {"a": 1, "b": 2}
+    assert diff_state(current, {"a": 1, "b": 3, "c": 4}) == {"b": 3, "c": 4}
+    assert diff_state(current, dict(current)) == {}
+
+@pytest.fixture
+def gsettings(stub_tool):
+    return stub_tool("gsettings", gnome_state())
+
+def test_gnome_read_state_parses_every_key(gsettings):
+    state = GnomeProxyBackend(gsettings=gsettings.path).read_state()
+    assert state[(SCHEMA, "mode")] == "'none'"
+    assert state[(f"{SCHEMA}.socks", "port")] == "0"
+    assert len(state) == 8
+
+def test_gnome_enable_writes_only_changed_keys(gsettings):
+    gsettings.write_state(gnome_state(host="'127.0.0.1'"))
+    backend = GnomeProxyBackend(gsettings=gsettings.path)
+    changes = backend.enable("127.0.0.1", 1081, "127.0.0.1", 1080)
+    assert (f"{SCHEMA}.http", "host") not in changes
+    assert sorted(args[2] for args in gsettings.writes()) == ["mode", "port", "port", "port"]
+    state = gsettings.read_state()
+    assert state[SCHEMA]["mode"] == "'manual'"
+    assert state[f"{SCHEMA}.socks"]["port"] == "1080"
+
+def test_gnome_enable_twice_is_a_no_op(gsettings):
+    backend = GnomeProxyBackend(gsettings=gsettings.path)
+    backend.enable("127.0.0.1", 1081)
+    writes = len(gsettings.writes())
+    assert backend.enable("127.0.0.1", 1081) == {}
+    assert len(gsettings.writes()) == writes
+
+def test_gnome_disable_restores_previous_settings(gsettings):
+    before = gnome_state(mode="'manual'", host="'proxy.example.com'", port="3128")
+    gsettings.write_state(before)
+    backend = GnomeProxyBackend(gsettings=gsettings.path)
+    backend.enable("127.0.0.1", 1081, "127.0.0.1", 1080)
+    backend.disable()
+    assert gsettings.read_state() == before
+
+def test_gnome_disable_without_snapshot_turns_proxy_off(gsettings):
+    gsettings.write_state(gnome_state(mode="'manual'"))
+    GnomeProxyBackend(gsettings=gsettings.path).disable()
+    assert gsettings.read_state()[SCHEMA]["mode"] == "'none'"
+
+def test_gnome_snapshot_survives_a_crash(gsettings, tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.json")
+    before = gnome_state(mode="'auto'")
+    gsettings.write_state(before)
+    GnomeProxyBackend(snapshot_path, gsettings=gsettings.path).enable("127.0.0.1", 1081)
+    # A new process finds the snapshot left by the one that crashed while connected
+    GnomeProxyBackend(snapshot_path, gsettings=gsettings.path).disable()
+    assert gsettings.read_state() == before
+    assert not (tmp_path / "snapshot.json").exists()
+
+def test_gnome_pac_mode(gsettings):
+    GnomeProxyBackend(gsettings=gsettings.path).enable(pac_url="http://127.0.0.1:5000/proxy.pac")
+    state = gsettings.read_state()
+    assert state[SCHEMA]["mode"] == "'auto'"
+    assert state[SCHEMA]["autoconfig-url"] == "'http://127.0.0.1:5000/proxy.pac'"
+
+@pytest.fixture
+def networksetup(stub_tool):
+    return stub_tool("networksetup", mac_state())
+
+def test_mac_enable_sets_every_service(networksetup):
+    MacProxyBackend(networksetup=networksetup.path).enable("127.0.0.1", 1081, "127.0.0.1", 1080)
+    proxies = networksetup.read_state()["proxies"]
+    for service in ("Wi-Fi", "Ethernet"):
+        assert proxies[service]["web"] == {"enabled": True, "server": "127.0.0.1", "port": "1081"}
+        assert proxies[service]["socksfirewall"] == {"enabled": True, "server": "127.0.0.1", "port": "1080"}
+        assert proxies[service]["autoproxy"]["enabled"] is False
+
+def test_mac_enable_twice_is_a_no_op(networksetup):
+    backend = MacProxyBackend(networksetup=networksetup.path)
+    backend.enable("127.0.0.1", 1081, "127.0.0.1", 1080)
+    writes = len(networksetup.writes())
+    assert backend.enable("127.0.0.1", 1081, "127.0.0.1", 1080) == {}
+    assert len(networksetup.writes()) == writes
+
+def test_mac_disable_restores_previous_settings(networksetup):
+    state = mac_state()
+    state["proxies"] = {
+        "Wi-Fi": {"web": {"enabled": False, "server": "proxy.example.com", "port": "3128"}},
+        "Ethernet": {"web": {"enabled": True, "server": "proxy.example.com", "port": "3128"},
+                     "autoproxy": {"enabled": False, "server": "http://wpad/wpad.dat", "port": "0"}},
+    }
+    networksetup.write_state(state)
+    backend = MacProxyBackend(networksetup=networksetup.path)
+    before = {key: list(value) for key, value in backend.read_state().items()}
+    backend.enable("127.0.0.1", 1081, "127.0.0.1", 1080)
+    backend.disable()
+    after = backend.read_state()
+    for key in ("Wi-Fi", "web"), ("Ethernet", "web"), ("Ethernet", "autoproxy"):
+        assert after[key] == before[key]
+    # networksetup cannot clear a server, so proxies that had none are only switched back off
+    assert {key: value[0] for key, value in after.items()} == {key: value[0] for key, value in before.items()}
+
+def test_mac_pac_mode_turns_manual_proxies_off(networksetup):
+    backend = MacProxyBackend(networksetup=networksetup.path)
+    backend.enable("127.0.0.1", 1081)
+    backend.enable(pac_url="http://127.0.0.1:5000/proxy.pac")
+    proxies = networksetup.read_state()["proxies"]["Wi-Fi"]
+    assert proxies["autoproxy"] == {"enabled": True, "server": "http://127.0.0.1:5000/proxy.pac", "port": "0"}
+    assert proxies["web"]["enabled"] is False
@@ -0,0 +1,37 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from utils.startup_utils import STARTUP_BUDGET, STARTUP_CHECK_FLAG
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Loaded on first use only: the update check, the settings dialogs and their dependencies
+DEFERRED = ("requests", "packaging", "webbrowser", "utils.update_utils", "utils.advanced_panel",
+            "utils.advanced_panel_fluent")
+IMPORT_LINE = re.compile(r"^import time:\s+\d+ \|\s+\d+ \|\s*(\S+)$")
+
+def start_gui(script, home):
+    """Start script until its tray icon is shown and return its startup line and the modules it imported"""
+    env = dict(os.environ, HOME=str(home), XDG_CONFIG_HOME=str(home / ".config"),
+               XDG_DATA_HOME=str(home / ".local" / "share"), QT_QPA_PLATFORM="offscreen")
+    result = subprocess.run([sys.executable, "-X", "importtime", script, STARTUP_CHECK_FLAG], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    modules = {match.group(1) for match in map(IMPORT_LINE.match, result.stderr.splitlines()) if match}
+    startup = next((line for line in result.stdout.splitlines() if line.startswith("startup:")), None)
+    return result.returncode, startup, modules
+
+@pytest.mark.parametrize("script, deferred", [
+    ("main.py", DEFERRED + ("qfluentwidgets",)),
+    ("main_fluent.py", DEFERRED),
+])
+def test_startup_defers_imports_and_meets_budget(script, deferred, tmp_path):
+    returncode, startup, modules = start_gui(script, tmp_path)
+
+    assert startup is not None, f"{script} did not reach the tray icon"
+    assert "utils.tray_utils" in modules
+    loaded = [name for name in deferred if any(m == name or m.startswith(name + ".") for m in modules)]
+    assert loaded == [], f"{script} imports {loaded} on the startup path"
+    assert returncode == 0, f"{startup}, over the {STARTUP_BUDGET} s budget"
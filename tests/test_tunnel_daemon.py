@@ -0,0 +1,23 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from utils.tunnel_daemon import TunnelDaemon, get_state_path, read_state
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX file modes")
+def test_state_file_is_private_from_creation(app_data):
+    daemon = TunnelDaemon({"command_args": []})
+    old_umask = os.umask(0)
+    try:
+        # A stale world-readable file must not pass its mode on to the new one
+        with open(get_state_path(), "w", encoding="utf-8") as f:
+            f.write("{}")
+        os.chmod(get_state_path(), 0o666)
+        daemon._write_state(12345)
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(os.stat(get_state_path()).st_mode) == 0o600
+    assert read_state() == {"pid": os.getpid(), "port": 12345, "token": daemon.token}
+    assert os.listdir(os.path.dirname(get_state_path())) == [os.path.basename(get_state_path())]
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from utils.update_utils import fetch_latest_version, read_cache, is_newer
+
+ETAG = '"release-etag"'
+
+class ReleasesServer:
+    """Local stand-in for the GitHub releases API that honours If-None-Match"""
+
+    def __init__(self):
+        self.tag = "v1.2.0"
+        self.status = 200
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if server.status != 200:
+                    self.send_response(server.status)
+                    self.end_headers()
+                elif self.headers.get("If-None-Match") == ETAG:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    body = json.dumps({"tag_name": server.tag}).encode()
+                    self.send_response(200)
+                    self.send_header("ETag", ETAG)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/releases/latest"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+@pytest.fixture
+def releases():
+    server = ReleasesServer()
+    yield server
+    server.close()
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "update_cache.json")
+
+def test_first_check_fetches_and_caches(releases, cache_path):
+    assert fetch_latest_version(releases.url, cache_path) == "1.2.0"
+    cache = read_cache(cache_path)
+    assert cache["version"] == "1.2.0"
+    assert cache["etag"] == ETAG
+
+def test_fresh_cache_skips_the_network(releases, cache_path):
+    fetch_latest_version(releases.url, cache_path)
+    assert fetch_latest_version(releases.url, cache_path) == "1.2.0"
+    assert len(releases.requests) == 1
+
+def test_stale_cache_sends_conditional_request(releases, cache_path):
+    fetch_latest_version(releases.url, cache_path)
+    checked_at = read_cache(cache_path)["checked_at"]
+    time.sleep(0.01)
+    assert fetch_latest_version(releases.url, cache_path, ttl=0) == "1.2.0"
+    assert releases.requests[-1]["If-None-Match"] == ETAG
+    assert read_cache(cache_path)["checked_at"] > checked_at
+
+def test_force_still_uses_the_etag(releases, cache_path):
+    fetch_latest_version(releases.url, cache_path)
+    releases.tag = "v1.3.0"
+    # The stand-in answers 304 for a known ETag, so the cached version stands
+    assert fetch_latest_version(releases.url, cache_path, force=True) == "1.2.0"
+    assert len(releases.requests) == 2
+
+def test_server_error_raises(releases, cache_path):
+    releases.status = 500
+    with pytest.raises(requests.RequestException):
+        fetch_latest_version(releases.url, cache_path)
+
+def test_unexpected_body_raises(releases, cache_path):
+    releases.tag = None
+    with pytest.raises(requests.RequestException):
+        fetch_latest_version(releases.url, cache_path)
+
+def test_is_newer():
+    assert is_newer("1.3.0", "1.2.9")
+    assert not is_newer("1.2.0", "1.2.0")
+    assert not is_newer("not-a-version", "1.0.0")
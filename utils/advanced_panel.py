@@ -1,18 +1,23 @@
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QLabel, QLineEdit, QCheckBox, 
                               QPushButton, QHBoxLayout, QApplication, QTabWidget, QWidget)
-from PySide6.QtGui import QIcon
-from .config_utils import save_config, load_config
-from .startup_utils import set_launch_at_login, get_launch_at_login
+from PySide6.QtGui import QIcon, QDesktopServices
+from PySide6.QtCore import QUrl, Signal
+from .config_utils import save_config
+from .pac_utils import get_rules_path
+from .startup_utils import set_launch_at_login_async, peek_launch_at_login
 from platform import system
 if system() == "Darwin":
     from utils.macos_utils import hide_dock_icon
 from utils.common import get_resource_path, get_version
 
 VERSION = get_version()
-
 class AdvancedSettingsDialog(QDialog):
+    launch_at_login_probed = Signal(bool)
+
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._probe_pending = False
+        self.launch_at_login_probed.connect(self.show_launch_at_login)
         self.setWindowTitle("高级设置")
         self.setMinimumWidth(300)
         self.setup_ui()
@@ -30,6 +35,7 @@ class AdvancedSettingsDialog(QDialog):
         server_layout = QHBoxLayout()
         server_layout.addWidget(QLabel("VPN 服务端地址"))
         self.server_input = QLineEdit("vpn.hitsz.edu.cn")
+        self.server_input.setToolTip("可填写多个地址，用逗号分隔，如 host1, host2:8443")
         server_layout.addWidget(self.server_input)
         server_layout.addWidget(QLabel("端口"))
         self.port_input = QLineEdit("443")
@@ -62,6 +68,43 @@ class AdvancedSettingsDialog(QDialog):
         http_bind_layout.addWidget(self.http_bind_input)
         network_layout.addLayout(http_bind_layout)
 
+        # Metrics bind
+        metrics_bind_layout = QHBoxLayout()
+        metrics_bind_layout.addWidget(QLabel("指标监听端口"))
+        self.metrics_bind_input = QLineEdit()
+        self.metrics_bind_input.setPlaceholderText("留空则关闭")
+        self.metrics_bind_input.setToolTip("在 127.0.0.1 的该端口以 OpenMetrics 格式提供 /metrics，供 Prometheus 抓取")
+        metrics_bind_layout.addStretch()
+        metrics_bind_layout.addWidget(self.metrics_bind_input)
+        network_layout.addLayout(metrics_bind_layout)
+
+        # Stop timeout
+        stop_timeout_layout = QHBoxLayout()
+        stop_timeout_layout.addWidget(QLabel("断开超时（秒）"))
+        self.stop_timeout_input = QLineEdit()
+        self.stop_timeout_input.setPlaceholderText("5")
+        stop_timeout_layout.addStretch()
+        stop_timeout_layout.addWidget(self.stop_timeout_input)
+        network_layout.addLayout(stop_timeout_layout)
+
+        # Parallel tunnels
+        tunnels_layout = QHBoxLayout()
+        tunnels_layout.addWidget(QLabel("并行隧道数"))
+        self.tunnels_input = QLineEdit()
+        self.tunnels_input.setPlaceholderText("1")
+        self.tunnels_input.setToolTip("大于 1 时同时建立多条隧道，并在本地代理端口上分摊连接")
+        tunnels_layout.addStretch()
+        tunnels_layout.addWidget(self.tunnels_input)
+        network_layout.addLayout(tunnels_layout)
+
+        # Health check target
+        health_target_layout = QHBoxLayout()
+        health_target_layout.addWidget(QLabel("健康检查目标"))
+        self.health_target_input = QLineEdit()
+        self.health_target_input.setPlaceholderText("DNS 服务器:53")
+        health_target_layout.addWidget(self.health_target_input)
+        network_layout.addLayout(health_target_layout)
+
         # Proxy Control
         self.proxy_switch = QCheckBox("自动配置代理")
         network_layout.addWidget(self.proxy_switch)
@@ -70,6 +113,55 @@ class AdvancedSettingsDialog(QDialog):
         self.keep_alive_switch = QCheckBox("定时保活")
         network_layout.addWidget(self.keep_alive_switch)
 
+        # Adaptive keep-alive
+        self.adaptive_keep_alive_switch = QCheckBox("自适应保活")
+        self.adaptive_keep_alive_switch.setToolTip("由本程序在隧道空闲接近超时时发送保活；开启流量统计后，有流量时跳过保活")
+        network_layout.addWidget(self.adaptive_keep_alive_switch)
+
+        idle_timeout_layout = QHBoxLayout()
+        idle_timeout_layout.addWidget(QLabel("服务端空闲超时（秒）"))
+        self.idle_timeout_input = QLineEdit()
+        self.idle_timeout_input.setPlaceholderText("300")
+        self.idle_timeout_input.setToolTip("空闲达到一半时发送保活，失败后缩短间隔重试")
+        idle_timeout_layout.addStretch()
+        idle_timeout_layout.addWidget(self.idle_timeout_input)
+        network_layout.addLayout(idle_timeout_layout)
+
+        self.keep_alive_stats_label = QLabel()
+        network_layout.addWidget(self.keep_alive_stats_label)
+
+        # Auto reconnect
+        self.auto_reconnect_switch = QCheckBox("断线自动重连")
+        network_layout.addWidget(self.auto_reconnect_switch)
+
+        # Health check
+        self.health_check_switch = QCheckBox("健康检查")
+        network_layout.addWidget(self.health_check_switch)
+
+        # Auto port
+        self.auto_port_switch = QCheckBox("端口被占用时自动更换")
+        network_layout.addWidget(self.auto_port_switch)
+
+        # Traffic stats
+        self.traffic_stats_switch = QCheckBox("流量统计")
+        self.traffic_stats_switch.setToolTip("经本地中转统计代理流量，并在状态栏和托盘显示实时速率")
+        network_layout.addWidget(self.traffic_stats_switch)
+
+        # Split tunnel
+        split_tunnel_layout = QHBoxLayout()
+        self.split_tunnel_switch = QCheckBox("分流（仅校园网流量走代理）")
+        self.split_tunnel_switch.setToolTip("按分流规则生成 PAC 自动代理配置，规则修改后无需重新连接")
+        split_tunnel_layout.addWidget(self.split_tunnel_switch)
+        split_tunnel_layout.addStretch()
+        edit_rules_button = QPushButton("编辑规则")
+        edit_rules_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(get_rules_path())))
+        split_tunnel_layout.addWidget(edit_rules_button)
+        network_layout.addLayout(split_tunnel_layout)
+
+        # Prefetch
+        self.prefetch_switch = QCheckBox("预解析服务器地址")
+        network_layout.addWidget(self.prefetch_switch)
+
         # Debug-dump
         self.debug_dump_switch = QCheckBox("调试模式")
         network_layout.addWidget(self.debug_dump_switch)
@@ -82,7 +174,6 @@ class AdvancedSettingsDialog(QDialog):
 
         # Startup Control
         self.startup_switch = QCheckBox("开机启动")
-        self.startup_switch.setChecked(get_launch_at_login())
         general_layout.addWidget(self.startup_switch)
 
         # Silent mode
@@ -97,6 +188,10 @@ class AdvancedSettingsDialog(QDialog):
         self.check_update_switch = QCheckBox("启动时检查更新")
         general_layout.addWidget(self.check_update_switch)
 
+        # Keep the tunnel running after quitting
+        self.detached_tunnel_switch = QCheckBox("退出后保持连接")
+        general_layout.addWidget(self.detached_tunnel_switch)
+
         # Hide dock icon option (only for macOS)
         if system() == "Darwin":
             self.hide_dock_icon_switch = QCheckBox("隐藏 Dock 图标")
@@ -132,9 +227,22 @@ class AdvancedSettingsDialog(QDialog):
             'silent_mode': self.silent_mode_switch.isChecked(),
             'check_update': self.check_update_switch.isChecked(),
             'keep_alive': self.keep_alive_switch.isChecked(),
+            'adaptive_keep_alive': self.adaptive_keep_alive_switch.isChecked(),
+            'idle_timeout': self.idle_timeout_input.text(),
             'debug_dump': self.debug_dump_switch.isChecked(),
             'http_bind': self.http_bind_input.text(),
             'socks_bind': self.socks_bind_input.text(),
+            'metrics_bind': self.metrics_bind_input.text(),
+            'stop_timeout': self.stop_timeout_input.text(),
+            'auto_reconnect': self.auto_reconnect_switch.isChecked(),
+            'health_check': self.health_check_switch.isChecked(),
+            'health_target': self.health_target_input.text(),
+            'prefetch': self.prefetch_switch.isChecked(),
+            'detached_tunnel': self.detached_tunnel_switch.isChecked(),
+            'tunnels': self.tunnels_input.text(),
+            'auto_port': self.auto_port_switch.isChecked(),
+            'traffic_stats': self.traffic_stats_switch.isChecked(),
+            'split_tunnel': self.split_tunnel_switch.isChecked(),
         }
         
         if system() == "Darwin":
@@ -142,7 +250,7 @@ class AdvancedSettingsDialog(QDialog):
             
         return settings
     
-    def set_settings(self, server, port, dns, proxy, connect_startup, silent_mode, check_update, hide_dock_icon=False, keep_alive=False, debug_dump=False, http_bind='', socks_bind=''):
+    def set_settings(self, server, port, dns, proxy, connect_startup, silent_mode, check_update, hide_dock_icon=False, keep_alive=False, debug_dump=False, http_bind='', socks_bind='', stop_timeout='5', auto_reconnect=True, health_check=False, health_target='', prefetch=False, detached_tunnel=False, tunnels='1', auto_port=True, traffic_stats=False, split_tunnel=False, metrics_bind='', adaptive_keep_alive=False, idle_timeout='300'):
         """Set dialog values from main window values"""
         self.server_input.setText(server)
         self.port_input.setText(port)
@@ -154,32 +262,72 @@ class AdvancedSettingsDialog(QDialog):
         if system() == "Darwin":
             self.hide_dock_icon_switch.setChecked(hide_dock_icon)
         self.keep_alive_switch.setChecked(keep_alive)
+        self.adaptive_keep_alive_switch.setChecked(adaptive_keep_alive)
+        self.idle_timeout_input.setText(idle_timeout)
         self.debug_dump_switch.setChecked(debug_dump)
         self.http_bind_input.setText(http_bind)
         self.socks_bind_input.setText(socks_bind)
+        self.metrics_bind_input.setText(metrics_bind)
+        self.stop_timeout_input.setText(stop_timeout)
+        self.auto_reconnect_switch.setChecked(auto_reconnect)
+        self.health_check_switch.setChecked(health_check)
+        self.health_target_input.setText(health_target)
+        self.prefetch_switch.setChecked(prefetch)
+        self.tunnels_input.setText(tunnels)
+        self.auto_port_switch.setChecked(auto_port)
+        self.traffic_stats_switch.setChecked(traffic_stats)
+        self.split_tunnel_switch.setChecked(split_tunnel)
+        self.detached_tunnel_switch.setChecked(detached_tunnel)
+        self.load_launch_at_login()
+
+    def set_keep_alive_stats(self, stats):
+        """Show what adaptive keep-alive has done since the app started"""
+        self.keep_alive_stats_label.setText(
+            f"已发送 {stats.pings} 次保活，跳过 {stats.skipped} 次，避免 {stats.drops_avoided} 次空闲断开")
+
+    def load_launch_at_login(self):
+        """Fill in the login item state now if it is known, or once its background probe finishes"""
+        if self._probe_pending:
+            return
+        value = peek_launch_at_login(self._on_launch_at_login_probed)
+        if value is None:
+            # Disabled until the probe reports, so accept() cannot overwrite a state it never read
+            self._probe_pending = True
+            self.startup_switch.setEnabled(False)
+        else:
+            self.show_launch_at_login(value)
+
+    def _on_launch_at_login_probed(self, value):
+        # Called on the probe thread; the queued signal carries the value to the GUI thread
+        try:
+            self.launch_at_login_probed.emit(value)
+        except RuntimeError:
+            # The dialog was released while the probe ran
+            pass
+
+    def show_launch_at_login(self, value):
+        self._probe_pending = False
+        self.startup_switch.setEnabled(True)
+        self.startup_switch.setChecked(value)
 
     def accept(self):
         """Save settings before closing"""
-        current_config = load_config()
-        settings = self.get_settings()
-
-        settings['username'] = current_config.get('username', '')
-        settings['password'] = current_config.get('password', '')
-        settings['remember'] = current_config.get('remember', False)
-        
-        save_config(settings)
-        set_launch_at_login(enable=self.startup_switch.isChecked())
+        # Only the keys that changed are written, so credentials are left as they are
+        save_config(self.get_settings())
+        if self.startup_switch.isEnabled():
+            set_launch_at_login_async(self.startup_switch.isChecked())
         
         if system() == "Darwin":
             hide_dock_icon(self.hide_dock_icon_switch.isChecked())
             
             from .menu_utils import setup_menubar
+            from .tray_utils import show_panel
             main_window = self.parent()
             main_window.hide_dock_icon = self.hide_dock_icon_switch.isChecked()
-            setup_menubar(main_window, VERSION)
-
-            main_window.show()
-            main_window.raise_()
+            if main_window.output_text is not None:
+                setup_menubar(main_window, VERSION)
+            # Builds the panel, menu bar included, if it is not built yet
+            show_panel(main_window)
             
             icon_path = get_resource_path("assets/icon.icns")
 
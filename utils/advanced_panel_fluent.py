@@ -1,10 +1,12 @@
-from qfluentwidgets import (LineEdit, BodyLabel, SwitchButton, PushButton, 
+from qfluentwidgets import (LineEdit, BodyLabel, CaptionLabel, SwitchButton, PushButton, 
                           FluentIcon, Pivot)
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QWidget,
                               QStackedWidget)
-from PySide6.QtCore import Qt
-from .config_utils import save_config, load_config
-from .startup_utils import set_launch_at_login, get_launch_at_login
+from PySide6.QtCore import Qt, QUrl, Signal
+from PySide6.QtGui import QDesktopServices
+from .config_utils import save_config
+from .pac_utils import get_rules_path
+from .startup_utils import set_launch_at_login_async, peek_launch_at_login
 
 class NetworkSettingsWidget(QWidget):
     def __init__(self, parent=None):
@@ -20,6 +22,7 @@ class NetworkSettingsWidget(QWidget):
         server_layout.addWidget(BodyLabel('VPN 服务端地址'))
         self.server_input = LineEdit(self)
         self.server_input.setPlaceholderText('vpn.hitsz.edu.cn')
+        self.server_input.setToolTip('可填写多个地址，用逗号分隔，如 host1, host2:8443')
         server_layout.addWidget(self.server_input)
         server_layout.addWidget(BodyLabel('端口'))
         self.port_input = LineEdit(self)
@@ -55,7 +58,47 @@ class NetworkSettingsWidget(QWidget):
         http_bind_layout.addStretch()
         http_bind_layout.addWidget(self.http_bind_input)
         layout.addLayout(http_bind_layout)
+
+        # Metrics bind
+        metrics_bind_layout = QHBoxLayout()
+        metrics_bind_layout.addWidget(BodyLabel('指标监听端口'))
+        self.metrics_bind_input = LineEdit(self)
+        self.metrics_bind_input.setFixedWidth(80)
+        self.metrics_bind_input.setPlaceholderText('留空则关闭')
+        self.metrics_bind_input.setToolTip('在 127.0.0.1 的该端口以 OpenMetrics 格式提供 /metrics，供 Prometheus 抓取')
+        metrics_bind_layout.addStretch()
+        metrics_bind_layout.addWidget(self.metrics_bind_input)
+        layout.addLayout(metrics_bind_layout)
+
+        # Stop timeout
+        stop_timeout_layout = QHBoxLayout()
+        stop_timeout_layout.addWidget(BodyLabel('断开超时（秒）'))
+        self.stop_timeout_input = LineEdit(self)
+        self.stop_timeout_input.setFixedWidth(80)
+        self.stop_timeout_input.setPlaceholderText('5')
+        stop_timeout_layout.addStretch()
+        stop_timeout_layout.addWidget(self.stop_timeout_input)
+        layout.addLayout(stop_timeout_layout)
+
+        # Parallel tunnels
+        tunnels_layout = QHBoxLayout()
+        tunnels_layout.addWidget(BodyLabel('并行隧道数'))
+        self.tunnels_input = LineEdit(self)
+        self.tunnels_input.setFixedWidth(80)
+        self.tunnels_input.setPlaceholderText('1')
+        self.tunnels_input.setToolTip('大于 1 时同时建立多条隧道，并在本地代理端口上分摊连接')
+        tunnels_layout.addStretch()
+        tunnels_layout.addWidget(self.tunnels_input)
+        layout.addLayout(tunnels_layout)
         
+        # Health check target
+        health_target_layout = QHBoxLayout()
+        health_target_layout.addWidget(BodyLabel('健康检查目标'))
+        self.health_target_input = LineEdit(self)
+        self.health_target_input.setPlaceholderText('DNS 服务器:53')
+        health_target_layout.addWidget(self.health_target_input)
+        layout.addLayout(health_target_layout)
+
         # Proxy Control
         proxy_layout = QHBoxLayout()
         proxy_layout.addWidget(BodyLabel('自动配置代理'))
@@ -71,6 +114,82 @@ class NetworkSettingsWidget(QWidget):
         self.keep_alive_switch = SwitchButton(self)
         keep_alive_layout.addWidget(self.keep_alive_switch)
         layout.addLayout(keep_alive_layout)
+
+        # Adaptive keep-alive
+        adaptive_keep_alive_layout = QHBoxLayout()
+        adaptive_keep_alive_label = BodyLabel('自适应保活')
+        adaptive_keep_alive_label.setToolTip('由本程序在隧道空闲接近超时时发送保活；开启流量统计后，有流量时跳过保活')
+        adaptive_keep_alive_layout.addWidget(adaptive_keep_alive_label)
+        adaptive_keep_alive_layout.addStretch()
+        self.adaptive_keep_alive_switch = SwitchButton(self)
+        adaptive_keep_alive_layout.addWidget(self.adaptive_keep_alive_switch)
+        layout.addLayout(adaptive_keep_alive_layout)
+
+        idle_timeout_layout = QHBoxLayout()
+        idle_timeout_layout.addWidget(BodyLabel('服务端空闲超时（秒）'))
+        self.idle_timeout_input = LineEdit(self)
+        self.idle_timeout_input.setFixedWidth(80)
+        self.idle_timeout_input.setPlaceholderText('300')
+        self.idle_timeout_input.setToolTip('空闲达到一半时发送保活，失败后缩短间隔重试')
+        idle_timeout_layout.addStretch()
+        idle_timeout_layout.addWidget(self.idle_timeout_input)
+        layout.addLayout(idle_timeout_layout)
+
+        self.keep_alive_stats_label = CaptionLabel(self)
+        layout.addWidget(self.keep_alive_stats_label)
+
+        # Auto reconnect
+        auto_reconnect_layout = QHBoxLayout()
+        auto_reconnect_layout.addWidget(BodyLabel('断线自动重连'))
+        auto_reconnect_layout.addStretch()
+        self.auto_reconnect_switch = SwitchButton(self)
+        auto_reconnect_layout.addWidget(self.auto_reconnect_switch)
+        layout.addLayout(auto_reconnect_layout)
+
+        # Health check
+        health_check_layout = QHBoxLayout()
+        health_check_layout.addWidget(BodyLabel('健康检查'))
+        health_check_layout.addStretch()
+        self.health_check_switch = SwitchButton(self)
+        health_check_layout.addWidget(self.health_check_switch)
+        layout.addLayout(health_check_layout)
+
+        # Auto port
+        auto_port_layout = QHBoxLayout()
+        auto_port_layout.addWidget(BodyLabel('端口被占用时自动更换'))
+        auto_port_layout.addStretch()
+        self.auto_port_switch = SwitchButton(self)
+        auto_port_layout.addWidget(self.auto_port_switch)
+        layout.addLayout(auto_port_layout)
+
+        # Traffic stats
+        traffic_stats_layout = QHBoxLayout()
+        traffic_stats_layout.addWidget(BodyLabel('流量统计'))
+        traffic_stats_layout.addStretch()
+        self.traffic_stats_switch = SwitchButton(self)
+        self.traffic_stats_switch.setToolTip('经本地中转统计代理流量，并在状态栏和托盘显示实时速率')
+        traffic_stats_layout.addWidget(self.traffic_stats_switch)
+        layout.addLayout(traffic_stats_layout)
+
+        # Split tunnel
+        split_tunnel_layout = QHBoxLayout()
+        split_tunnel_layout.addWidget(BodyLabel('分流（仅校园网流量走代理）'))
+        split_tunnel_layout.addStretch()
+        edit_rules_button = PushButton('编辑规则', self)
+        edit_rules_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(get_rules_path())))
+        split_tunnel_layout.addWidget(edit_rules_button)
+        self.split_tunnel_switch = SwitchButton(self)
+        self.split_tunnel_switch.setToolTip('按分流规则生成 PAC 自动代理配置，规则修改后无需重新连接')
+        split_tunnel_layout.addWidget(self.split_tunnel_switch)
+        layout.addLayout(split_tunnel_layout)
+
+        # Prefetch
+        prefetch_layout = QHBoxLayout()
+        prefetch_layout.addWidget(BodyLabel('预解析服务器地址'))
+        prefetch_layout.addStretch()
+        self.prefetch_switch = SwitchButton(self)
+        prefetch_layout.addWidget(self.prefetch_switch)
+        layout.addLayout(prefetch_layout)
         
         # Debug dump
         debug_dump_layout = QHBoxLayout()
@@ -96,7 +215,6 @@ class GeneralSettingsWidget(QWidget):
         launch_layout.addWidget(BodyLabel('开机启动'))
         launch_layout.addStretch()
         self.startup_switch = SwitchButton(self)
-        self.startup_switch.setChecked(get_launch_at_login())
         launch_layout.addWidget(self.startup_switch)
         layout.addLayout(launch_layout)
         
@@ -123,12 +241,24 @@ class GeneralSettingsWidget(QWidget):
         self.check_update_switch = SwitchButton(self)
         check_update_layout.addWidget(self.check_update_switch)
         layout.addLayout(check_update_layout)
+
+        # Keep the tunnel running after quitting
+        detached_tunnel_layout = QHBoxLayout()
+        detached_tunnel_layout.addWidget(BodyLabel('退出后保持连接'))
+        detached_tunnel_layout.addStretch()
+        self.detached_tunnel_switch = SwitchButton(self)
+        detached_tunnel_layout.addWidget(self.detached_tunnel_switch)
+        layout.addLayout(detached_tunnel_layout)
         
         layout.addStretch()
 
 class AdvancedSettingsDialog(QDialog):
+    launch_at_login_probed = Signal(bool)
+
     def __init__(self, parent=None):
         super().__init__(parent)
+        self._probe_pending = False
+        self.launch_at_login_probed.connect(self.show_launch_at_login)
         self.setWindowTitle('高级设置')
         self.setMinimumWidth(400)
         self.setup_ui()
@@ -191,12 +321,25 @@ class AdvancedSettingsDialog(QDialog):
             'silent_mode': self.general_settings.silent_mode_switch.isChecked(),
             'check_update': self.general_settings.check_update_switch.isChecked(),
             'keep_alive': self.network_settings.keep_alive_switch.isChecked(),
+            'adaptive_keep_alive': self.network_settings.adaptive_keep_alive_switch.isChecked(),
+            'idle_timeout': self.network_settings.idle_timeout_input.text(),
             'debug_dump': self.network_settings.debug_dump_switch.isChecked(),
             'http_bind': self.network_settings.http_bind_input.text(),
             'socks_bind': self.network_settings.socks_bind_input.text(),
+            'metrics_bind': self.network_settings.metrics_bind_input.text(),
+            'stop_timeout': self.network_settings.stop_timeout_input.text(),
+            'auto_reconnect': self.network_settings.auto_reconnect_switch.isChecked(),
+            'health_check': self.network_settings.health_check_switch.isChecked(),
+            'health_target': self.network_settings.health_target_input.text(),
+            'prefetch': self.network_settings.prefetch_switch.isChecked(),
+            'detached_tunnel': self.general_settings.detached_tunnel_switch.isChecked(),
+            'tunnels': self.network_settings.tunnels_input.text(),
+            'auto_port': self.network_settings.auto_port_switch.isChecked(),
+            'traffic_stats': self.network_settings.traffic_stats_switch.isChecked(),
+            'split_tunnel': self.network_settings.split_tunnel_switch.isChecked(),
         }
     
-    def set_settings(self, server, port, dns, proxy, connect_startup, silent_mode, check_update, keep_alive=False, debug_dump=False, http_bind='', socks_bind=''):
+    def set_settings(self, server, port, dns, proxy, connect_startup, silent_mode, check_update, keep_alive=False, debug_dump=False, http_bind='', socks_bind='', stop_timeout='5', auto_reconnect=True, health_check=False, health_target='', prefetch=False, detached_tunnel=False, tunnels='1', auto_port=True, traffic_stats=False, split_tunnel=False, metrics_bind='', adaptive_keep_alive=False, idle_timeout='300'):
         """Set dialog values from main window values"""
         self.network_settings.server_input.setText(server)
         self.network_settings.port_input.setText(port)
@@ -206,19 +349,58 @@ class AdvancedSettingsDialog(QDialog):
         self.general_settings.silent_mode_switch.setChecked(silent_mode)
         self.general_settings.check_update_switch.setChecked(check_update)
         self.network_settings.keep_alive_switch.setChecked(keep_alive)
+        self.network_settings.adaptive_keep_alive_switch.setChecked(adaptive_keep_alive)
+        self.network_settings.idle_timeout_input.setText(idle_timeout)
         self.network_settings.debug_dump_switch.setChecked(debug_dump)
         self.network_settings.http_bind_input.setText(http_bind)
         self.network_settings.socks_bind_input.setText(socks_bind)
+        self.network_settings.metrics_bind_input.setText(metrics_bind)
+        self.network_settings.stop_timeout_input.setText(stop_timeout)
+        self.network_settings.auto_reconnect_switch.setChecked(auto_reconnect)
+        self.network_settings.health_check_switch.setChecked(health_check)
+        self.network_settings.health_target_input.setText(health_target)
+        self.network_settings.prefetch_switch.setChecked(prefetch)
+        self.network_settings.tunnels_input.setText(tunnels)
+        self.network_settings.auto_port_switch.setChecked(auto_port)
+        self.network_settings.traffic_stats_switch.setChecked(traffic_stats)
+        self.network_settings.split_tunnel_switch.setChecked(split_tunnel)
+        self.general_settings.detached_tunnel_switch.setChecked(detached_tunnel)
+        self.load_launch_at_login()
 
-    def accept(self):
-        """Save settings before closing"""
-        current_config = load_config()
-        settings = self.get_settings()
+    def set_keep_alive_stats(self, stats):
+        """Show what adaptive keep-alive has done since the app started"""
+        self.network_settings.keep_alive_stats_label.setText(
+            f"已发送 {stats.pings} 次保活，跳过 {stats.skipped} 次，避免 {stats.drops_avoided} 次空闲断开")
+
+    def load_launch_at_login(self):
+        """Fill in the login item state now if it is known, or once its background probe finishes"""
+        if self._probe_pending:
+            return
+        value = peek_launch_at_login(self._on_launch_at_login_probed)
+        if value is None:
+            # Disabled until the probe reports, so accept() cannot overwrite a state it never read
+            self._probe_pending = True
+            self.general_settings.startup_switch.setEnabled(False)
+        else:
+            self.show_launch_at_login(value)
+
+    def _on_launch_at_login_probed(self, value):
+        # Called on the probe thread; the queued signal carries the value to the GUI thread
+        try:
+            self.launch_at_login_probed.emit(value)
+        except RuntimeError:
+            # The dialog was released while the probe ran
+            pass
 
-        settings['username'] = current_config.get('username', '')
-        settings['password'] = current_config.get('password', '')
-        settings['remember'] = current_config.get('remember', False)
+    def show_launch_at_login(self, value):
+        self._probe_pending = False
+        self.general_settings.startup_switch.setEnabled(True)
+        self.general_settings.startup_switch.setChecked(value)
 
-        save_config(settings)
-        set_launch_at_login(enable=self.general_settings.startup_switch.isChecked())
+    def accept(self):
+        """Save settings before closing"""
+        # Only the keys that changed are written, so credentials are left as they are
+        save_config(self.get_settings())
+        if self.general_settings.startup_switch.isEnabled():
+            set_launch_at_login_async(self.general_settings.startup_switch.isChecked())
         super().accept()
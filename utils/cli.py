@@ -0,0 +1,158 @@
+"""Headless command line entry point: python -m utils.cli {run,start,stop,status,logs}
+
+Runs zju-connect without importing Qt, reusing the GUI's settings, command building,
+proxy backends and reconnect policy. Settings come from the GUI's settings file
+(on Linux) or --config, and can be overridden with flags.
+"""
+import os
+import sys
+import json
+import signal
+import getpass
+import argparse
+import threading
+from .config_utils import load_config, IniSettings
+from .command_utils import build_zju_connect_args, mask_credentials
+from .reconnect_utils import ReconnectSupervisor, EXIT_STOPPED
+from .proxy_backend import get_proxy_backend
+from .tunnel_daemon import TunnelDaemon, launch_daemon, wait_for_daemon, find_running_daemon, send_request
+
+PASSWORD_ENV = "HITSZ_CONNECT_PASSWORD"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.cli", description="HITSZ Connect Verge without a GUI")
+    parser.add_argument("command", choices=["run", "start", "stop", "status", "logs"],
+                        help="run in the foreground, start/stop a background daemon, show its status or follow its logs")
+    parser.add_argument("--config", help="settings file in QSettings INI format (default: the GUI's settings on Linux)")
+    parser.add_argument("--username")
+    parser.add_argument("--password", help=f"prefer the {PASSWORD_ENV} environment variable")
+    parser.add_argument("--server")
+    parser.add_argument("--port")
+    parser.add_argument("--dns")
+    parser.add_argument("--socks-bind")
+    parser.add_argument("--http-bind")
+    parser.add_argument("--proxy", action=argparse.BooleanOptionalAction, default=None,
+                        help="configure the system proxy")
+    parser.add_argument("--auto-reconnect", action=argparse.BooleanOptionalAction, default=None)
+    return parser.parse_args(argv)
+
+def resolve_config(args):
+    """Merge the settings file with command line overrides"""
+    config = load_config(IniSettings(args.config))
+    for key in ("server", "port", "dns", "socks_bind", "http_bind", "proxy", "auto_reconnect"):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+
+    username = args.username or config['username']
+    password = args.password or os.environ.get(PASSWORD_ENV) or config['password']
+    if not username:
+        username = input("Username: ")
+    if not password:
+        password = getpass.getpass("Password: ")
+    return config, username, password
+
+def tunnel_config(config, command_args):
+    """Build the configuration TunnelDaemon expects"""
+    proxy = None
+    if config['proxy'] and config['http_bind']:
+        socks_port = int(config['socks_bind']) if config['socks_bind'] else None
+        proxy = ["127.0.0.1", int(config['http_bind']), "127.0.0.1", socks_port]
+    return {
+        "command_args": command_args,
+        "proxy": proxy,
+        "keep_proxy_on_failure": config['auto_reconnect'],
+    }
+
+def run_foreground(config, command_args):
+    """Run the tunnel in this process, restarting it after unexpected exits"""
+    daemon_config = dict(tunnel_config(config, command_args), supervised=True)
+    supervisor = ReconnectSupervisor()
+    stop_event = threading.Event()
+    current = {}
+
+    def handle_signal(*_):
+        stop_event.set()
+        if current.get("daemon"):
+            current["daemon"].stop(5.0, EXIT_STOPPED)
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        while not stop_event.is_set():
+            current["daemon"] = TunnelDaemon(daemon_config, echo=sys.stdout)
+            current["daemon"].run()
+            exit_reason = current["daemon"].exit_reason
+            delay = supervisor.next_delay(exit_reason) if config['auto_reconnect'] else None
+            if stop_event.is_set() or delay is None:
+                print(f"zju-connect exited ({exit_reason})", flush=True)
+                break
+            print(f"zju-connect exited unexpectedly ({exit_reason}), reconnecting in {delay:.1f}s", flush=True)
+            if stop_event.wait(delay):
+                break
+            recovery_time = supervisor.record_started()
+            print(f"Restarting zju-connect (restart #{supervisor.restart_count}, down for {recovery_time:.1f}s)",
+                  flush=True)
+    finally:
+        # A proxy kept for a restart that is not going to happen still needs restoring
+        if daemon_config["proxy"]:
+            get_proxy_backend().disable()
+    return 0
+
+def start_daemon(config, command_args):
+    if find_running_daemon():
+        print("A tunnel daemon is already running", file=sys.stderr)
+        return 1
+    process = launch_daemon(tunnel_config(config, command_args))
+    state = wait_for_daemon(process.pid)
+    if state is None:
+        print("Tunnel daemon did not start", file=sys.stderr)
+        return 1
+    print(f"Tunnel daemon started (pid {state['pid']})")
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command in ("stop", "status", "logs"):
+        state = find_running_daemon()
+        if state is None:
+            print("No tunnel daemon is running")
+            return 1 if args.command != "status" else 0
+        if args.command == "status":
+            print(f"Tunnel daemon running (pid {state['pid']})")
+        elif args.command == "stop":
+            send_request(state, {"cmd": "stop", "timeout": 5.0}).close()
+            print("Stop requested")
+        else:
+            follow_logs(state)
+        return 0
+
+    config, username, password = resolve_config(args)
+    command_args = build_zju_connect_args(username, password, config)
+    print(f"Running command: {mask_credentials(command_args)}", flush=True)
+    if args.command == "run":
+        return run_foreground(config, command_args)
+    return start_daemon(config, command_args)
+
+def follow_logs(state):
+    """Print the daemon's recent output and follow it until the tunnel exits or Ctrl-C"""
+    sock = send_request(state, {"cmd": "attach"})
+    sock.settimeout(None)
+    try:
+        for raw in sock.makefile("r", encoding="utf-8"):
+            message = json.loads(raw)
+            if message["type"] == "history":
+                for line in message["lines"]:
+                    print(line)
+            elif message["type"] == "output":
+                print(message["text"], flush=True)
+            elif message["type"] == "exit":
+                print(f"zju-connect exited ({message['reason']})")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
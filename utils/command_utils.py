@@ -0,0 +1,74 @@
+import os
+import sys
+import shlex
+from platform import system
+from .endpoint_utils import parse_endpoints
+
+CORE_PATH_ENV = "HITSZ_CONNECT_CORE"  # run another zju-connect build, or a stand-in, instead of the bundled one
+
+def get_core_path():
+    """Get the path of the bundled zju-connect executable, unless overridden by the environment"""
+    if os.environ.get(CORE_PATH_ENV):
+        return os.environ[CORE_PATH_ENV]
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    if system() == "Windows":
+        return os.path.join(base_path, "core", "zju-connect.exe")
+    command = os.path.join(base_path, "core", "zju-connect")
+    if os.path.exists(command):
+        os.chmod(command, 0o755)
+    return command
+
+def build_zju_connect_args(username, password, config):
+    """Build the zju-connect command line from credentials and a config dict as returned by load_config"""
+    # With several endpoints the worker picks one at connect time; start from the first
+    endpoints = parse_endpoints(config['server'], config['port']) or [(config['server'], config['port'])]
+    server_address, port = endpoints[0]
+
+    command_args = [
+        get_core_path(),
+        "-server", shlex.quote(server_address),
+        "-port", shlex.quote(str(port)),
+        "-zju-dns-server", shlex.quote(config['dns']),
+        "-username", shlex.quote(username),
+        "-password", shlex.quote(password)
+    ]
+
+    if config['http_bind']:
+        command_args.extend(["-http-bind", shlex.quote("127.0.0.1:" + config['http_bind'])])
+
+    if config['socks_bind']:
+        command_args.extend(["-socks-bind", shlex.quote("127.0.0.1:" + config['socks_bind'])])
+
+    if not config['keep_alive']:
+        command_args.append("-disable-keep-alive")
+
+    if config['debug_dump']:
+        command_args.append("-debug-dump")
+
+    command_args.append("-disable-zju-config")
+    command_args.append("-disable-zju-dns")
+    command_args.append("-skip-domain-resource")
+    return command_args
+
+def mask_credentials(command_args):
+    """Return the command line as a string with the username and password hidden"""
+    debug_command = list(command_args)
+    for flag in ("-username", "-password"):
+        debug_command[debug_command.index(flag) + 1] = "********"
+    return ' '.join(debug_command)
+
+def apply_binds(command_args, http_port=None, socks_port=None):
+    """Return a copy of the zju-connect arguments listening on other local ports"""
+    command_args = list(command_args)
+    for flag, port in (("-http-bind", http_port), ("-socks-bind", socks_port)):
+        if port is None:
+            continue
+        if flag in command_args:
+            command_args[command_args.index(flag) + 1] = f"127.0.0.1:{port}"
+        else:
+            command_args[1:1] = [flag, f"127.0.0.1:{port}"]
+    return command_args
@@ -14,3 +14,15 @@ def get_version():
     version_file = get_resource_path('.app-version')
     with open(version_file, 'r') as f:
         return f.read().strip()
+
+def get_app_data_dir():
+    """Get the per-user application data directory, creating it if needed"""
+    if sys.platform == "win32":
+        base_path = os.environ.get("APPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base_path = os.path.expanduser("~/Library/Application Support")
+    else:
+        base_path = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    path = os.path.join(base_path, "HITSZ Connect Verge")
+    os.makedirs(path, exist_ok=True)
+    return path
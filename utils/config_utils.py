@@ -1,59 +1,180 @@
-from PySide6.QtCore import QSettings
-from .startup_utils import get_launch_at_login
+import os
+import atexit
+import threading
+import configparser
+
+def get_settings():
+    """Get the app's QSettings; Qt is only imported when the GUI actually needs it"""
+    from PySide6.QtCore import QSettings
+    return QSettings("Kowyo", "HITSZ Connect Verge")
+
+class IniSettings:
+    """Read-only, Qt-free view of a QSettings INI file, for use without a GUI.
+
+    On Linux this is the same file the GUI writes its settings to.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or self.default_path()
+        self.parser = configparser.ConfigParser(interpolation=None)
+        self.parser.optionxform = str
+        self.parser.read(self.path, encoding="utf-8")
+
+    @staticmethod
+    def default_path():
+        config_home = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+        return os.path.join(config_home, "Kowyo", "HITSZ Connect Verge.conf")
+
+    def value(self, key, default=None):
+        if not self.parser.has_option("General", key):
+            return default
+        value = self.parser.get("General", key)
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        return value
+
+CONFIG_SCHEMA = {
+    'username': '',
+    'password': '',
+    'remember': False,
+    'server': 'vpn.hitsz.edu.cn',
+    'port': '443',
+    'dns': '10.248.98.30',
+    'proxy': True,
+    'connect_startup': False,
+    'silent_mode': False,
+    'check_update': True,
+    'hide_dock_icon': False,
+    'keep_alive': True,
+    'adaptive_keep_alive': False,
+    'idle_timeout': '300',
+    'debug_dump': False,
+    'socks_bind': '1080',
+    'http_bind': '1081',
+    'stop_timeout': '5',
+    'auto_reconnect': True,
+    'health_check': False,
+    'health_target': '',
+    'health_interval': '10',
+    'health_failures': '3',
+    'prefetch': False,
+    'detached_tunnel': False,
+    'tunnels': '1',
+    'auto_port': True,
+    'traffic_stats': False,
+    'split_tunnel': False,
+    'metrics_bind': '',
+}
+
+# Window attributes that differ from their config key
+WINDOW_ATTRIBUTES = {
+    'server': 'server_address',
+    'dns': 'dns_server',
+}
+
+WRITE_DELAY = 0.5  # seconds to wait for more changes before writing them out
+
+def coerce_value(key, value):
+    """Convert a stored value to the type of the key's default"""
+    if isinstance(CONFIG_SCHEMA[key], bool):
+        return value if isinstance(value, bool) else str(value).lower() == 'true'
+    return '' if value is None else str(value)
 
 def save_config(config):
-    """Save config using QSettings"""
-    settings = QSettings("Kowyo", "HITSZ Connect Verge")
-    for key, value in config.items():
-        settings.setValue(key, value)
-    settings.sync()
-
-def load_config():
-    """Load config from QSettings"""
-    settings = QSettings("Kowyo", "HITSZ Connect Verge")
-    default_config = {
-        'username': '',
-        'password': '',
-        'remember': False,
-        'server': 'vpn.hitsz.edu.cn',
-        'port': '443',
-        'dns': '10.248.98.30',
-        'proxy': True,
-        'launch_at_login': get_launch_at_login(),
-        'connect_startup': False,
-        'silent_mode': False,
-        'check_update': True,
-        'hide_dock_icon': False,
-        'keep_alive': True,
-        'debug_dump': False,
-        'socks_bind': '1080',
-        'http_bind': '1081',
-    }
+    """Save config through the shared config store"""
+    get_config_store().update(config)
+
+def load_config(settings=None):
+    """Load config from QSettings, or from another object with the same value() method"""
+    if settings is None:
+        settings = get_settings()
+    default_config = dict(CONFIG_SCHEMA)
     
     # Load values from QSettings, falling back to defaults if not found
     for key in default_config.keys():
-        value = settings.value(key, default_config[key])
-        if isinstance(default_config[key], bool):
-            value = str(value).lower() == 'true'
-        default_config[key] = value
+        default_config[key] = coerce_value(key, settings.value(key, default_config[key]))
     
     return default_config
 
+class ConfigStore:
+    """The app's config, read once and kept in memory.
+
+    set() and update() change values immediately, notify listeners, and mark the
+    keys dirty; dirty keys are written out together after WRITE_DELAY seconds on a
+    background thread, so frequent saves never block the GUI on disk I/O.
+    """
+
+    def __init__(self, settings_factory=get_settings, delay=WRITE_DELAY):
+        self.settings_factory = settings_factory
+        self.delay = delay
+        self.values = load_config(settings_factory())
+        self.dirty = set()
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+
+    def get(self, key):
+        return self.values[key]
+
+    def subscribe(self, callback):
+        """Call callback(key, value) whenever a value changes"""
+        self.listeners.append(callback)
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, config):
+        changed = {}
+        with self._lock:
+            for key, value in config.items():
+                if key not in CONFIG_SCHEMA:
+                    continue
+                value = coerce_value(key, value)
+                if self.values.get(key) != value:
+                    self.values[key] = value
+                    self.dirty.add(key)
+                    changed[key] = value
+            if changed and self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        for key, value in changed.items():
+            for callback in self.listeners:
+                callback(key, value)
+
+    def flush(self):
+        """Write the dirty keys now"""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending = {key: self.values[key] for key in self.dirty}
+                self.dirty.clear()
+            if not pending:
+                return
+            # A QSettings object per flush, since flushes may run on different threads
+            settings = self.settings_factory()
+            for key, value in pending.items():
+                settings.setValue(key, value)
+            settings.sync()
+
+_store = None
+
+def get_config_store():
+    global _store
+    if _store is None:
+        _store = ConfigStore()
+        atexit.register(_store.flush)
+    return _store
+
 def load_settings(self):
-    """Load advanced settings from QSettings"""
-    config = load_config()
-    self.username = config['username']
-    self.password = config['password']
-    self.remember = config['remember']
-    self.server_address = config['server']
-    self.port = config['port']
-    self.dns_server = config['dns']
-    self.proxy = config['proxy']
-    self.connect_startup = config['connect_startup']
-    self.silent_mode = config['silent_mode']
-    self.check_update = config['check_update']
-    self.hide_dock_icon = config['hide_dock_icon']
-    self.keep_alive = config['keep_alive']
-    self.debug_dump = config['debug_dump']
-    self.http_bind = config['http_bind']
-    self.socks_bind = config['socks_bind']
+    """Load advanced settings from the config store and keep the window's copies in sync"""
+    def apply(key, value):
+        setattr(self, WINDOW_ATTRIBUTES.get(key, key), value)
+
+    store = get_config_store()
+    for key, value in store.values.items():
+        apply(key, value)
+    store.subscribe(apply)
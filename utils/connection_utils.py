@@ -1,108 +1,478 @@
-import os
-import sys
-from platform import system
-import shlex
 import gc
-from .set_proxy import CommandWorker
-from qfluentwidgets import FluentIcon
+import time
+import threading
+from PySide6.QtCore import QTimer
+from functools import partial
+from .set_proxy import (CommandWorker, DaemonWorker, MultiTunnelWorker, HealthWorker, DEFAULT_STOP_TIMEOUT,
+                        apply_system_proxy, get_proxy_settings)
+from .reconnect_utils import ReconnectSupervisor, EXIT_AUTH_FAILURE, EXIT_HANG, EXIT_NETWORK_ERROR, RETRYABLE_EXITS
+from .health_utils import probe_socks, probe_http, parse_target
+from .keepalive_utils import KeepAliveScheduler, DEFAULT_IDLE_TIMEOUT
+from .endpoint_utils import parse_endpoints, get_endpoint_history
+from .prefetch_utils import Prefetcher
+from .tunnel_daemon import find_running_daemon
+from .command_utils import build_zju_connect_args, mask_credentials
+from .port_utils import preflight_ports, is_valid_port, PortConflictError, InvalidPortError
+from .metrics_utils import TrafficSampler, format_rate
+from .output_utils import STATE_CONNECTING, STATE_AUTHENTICATING, STATE_READY, STATE_DEGRADED
+from .trace_utils import span
+from .telemetry_utils import get_telemetry, MetricsServer
+from .log_utils import append_output, init_log_view
+from .credential_utils import get_credentials
+
+MAX_TUNNELS = 8
+
+# Status text and whether the tunnel counts as up, per connection state
+STATE_STATUS = {
+    STATE_CONNECTING: ("正在连接", False),
+    STATE_AUTHENTICATING: ("正在登录", False),
+    STATE_READY: ("已连接", True),
+    STATE_DEGRADED: ("连接异常", True),
+}
 
 def handle_output(window, text):
-    """Handle output text from the worker"""
-    window.output_text.append(text)
+    """Handle a batch of output lines from the worker in a single append"""
+    append_output(window, text)
+
+def set_connect_checked(window, checked):
+    """Check or uncheck the connect toggle; the tray action is the source of truth, the panel button follows it"""
+    window.connect_action.setChecked(checked)
+
+def update_status(window, text, running):
+    """Update the status label and, in the fluent UI, the status icon"""
+    window.status_text = text
+    window.status_running = running
+    if getattr(window, 'status_label', None) is None:
+        return
+    window.status_label.setText(f"状态: {text}")
+    if getattr(window, 'status_icon', None) is not None:
+        # Only the fluent UI has a status icon, so only it pays for importing the widget library
+        from qfluentwidgets import FluentIcon
+        window.status_icon.setIcon(FluentIcon.ACCEPT_MEDIUM if running else FluentIcon.CANCEL_MEDIUM)
+
+def restore_panel_state(window):
+    """Bring a freshly built panel up to date with the log, status and connection state kept on the window"""
+    init_log_view(window.output_text, getattr(window, 'log_lines', None) or ())
+    update_status(window, getattr(window, 'status_text', "未连接"), getattr(window, 'status_running', False))
+    window.status_label.setToolTip(getattr(window, 'status_tooltip', ""))
+    window.rate_label.setText(getattr(window, 'rate_text', ""))
+    window.connect_button.setChecked(window.connect_action.isChecked())
+
+def handle_state_changed(window, state):
+    """Reflect the worker's connection state; stopping is reported by handle_connection_finished"""
+    if state in STATE_STATUS and window.worker and not window.worker.is_stopping():
+        update_status(window, *STATE_STATUS[state])
+
+def get_supervisor(window):
+    """Get the reconnect supervisor and its timer, creating them on first use"""
+    if getattr(window, 'supervisor', None) is None:
+        window.supervisor = ReconnectSupervisor()
+        window.reconnect_timer = QTimer(window)
+        window.reconnect_timer.setSingleShot(True)
+        window.reconnect_timer.timeout.connect(lambda: reconnect(window))
+    return window.supervisor
+
+def restore_proxy_async():
+    """Restore the system proxy off the GUI thread; the thread is joined at interpreter exit"""
+    threading.Thread(target=apply_system_proxy, args=(False,)).start()
+
+def get_stop_timeout(window):
+    try:
+        return float(window.stop_timeout)
+    except ValueError:
+        return DEFAULT_STOP_TIMEOUT
+
+def get_idle_timeout(window):
+    try:
+        return max(10.0, float(window.idle_timeout))
+    except ValueError:
+        return DEFAULT_IDLE_TIMEOUT
+
+def wants_adaptive_keep_alive(window):
+    """Whether adaptive keep-alive is turned on and could apply; a detached tunnel must outlive the app"""
+    return window.keep_alive and window.adaptive_keep_alive and not window.detached_tunnel
+
+def uses_adaptive_keep_alive(window):
+    """Whether the app schedules keep-alive instead of zju-connect, which needs a listener to ping through"""
+    return wants_adaptive_keep_alive(window) and get_keep_alive_probe(window) is not None
+
+def get_tunnel_probe(window, target):
+    """A function that opens a connection to target through the tunnel's local listener, or None"""
+    target_host, target_port = parse_target(target)
+    http_host, http_port, socks_host, socks_port = get_proxy_settings(window)
+    if socks_port:
+        return partial(probe_socks, socks_host, socks_port, target_host, target_port)
+    if http_port:
+        return partial(probe_http, http_host, http_port, target_host, target_port)
+    return None
+
+def get_keep_alive_probe(window):
+    target = (window.health_target or window.dns_server).strip()
+    try:
+        return get_tunnel_probe(window, target) if target else None
+    except ValueError:
+        return None
+
+def start_keep_alive(window):
+    """Ping through the tunnel when it has been idle for long enough that the server could drop it.
+
+    Started with the worker rather than on ready, since zju-connect runs with its own keep-alive off.
+    """
+    if (not wants_adaptive_keep_alive(window) or getattr(window, 'keep_alive_scheduler', None)
+            or isinstance(window.worker, DaemonWorker)):
+        return
+    probe = get_keep_alive_probe(window)
+    if probe is None:
+        handle_output(window, "No usable keep-alive target or local listener, zju-connect keeps its own keep-alive")
+        return
+    # Traffic is only visible when the relay is already in the data path for traffic stats or
+    # parallel tunnels; otherwise pings go out on the fixed schedule rather than adding the relay
+    relay = getattr(window.worker, 'relay', None)
+    activity = (lambda: sum(relay.traffic()[:2])) if relay else None
+    window.keep_alive_scheduler = KeepAliveScheduler(probe, get_idle_timeout(window), activity,
+                                                     get_telemetry().keepalive)
+    window.keep_alive_scheduler.start()
+
+def stop_keep_alive(window):
+    if getattr(window, 'keep_alive_scheduler', None):
+        window.keep_alive_scheduler.stop()
+        window.keep_alive_scheduler = None
+
+def start_health_check(window):
+    """Probe the tunnel through its local listener and restart zju-connect when it stops responding"""
+    if not window.health_check:
+        return
+    target = (window.health_target or window.dns_server).strip()
+    if not target:
+        # An empty host never answers, so every probe would fail and restart the tunnel
+        handle_output(window, "No health check target or DNS server set, health check disabled")
+        return
+    try:
+        interval = float(window.health_interval)
+        failure_threshold = max(1, int(window.health_failures))
+        probe = get_tunnel_probe(window, target)
+    except ValueError:
+        handle_output(window, "Invalid health check settings, health check disabled")
+        return
+    if probe is None:
+        handle_output(window, "No local proxy listener to probe through, health check disabled")
+        return
+
+    window.health_worker = HealthWorker(probe, interval, failure_threshold)
+    window.health_worker.sample.connect(lambda rtt: handle_health_sample(window, rtt))
+    window.health_worker.unhealthy.connect(lambda failures: handle_unhealthy(window, failures))
+    window.health_worker.start()
+
+def stop_health_check(window):
+    if getattr(window, 'health_worker', None):
+        window.health_worker.stop()
+        window.health_worker.sample.disconnect()
+        window.health_worker.unhealthy.disconnect()
+        window.health_worker.deleteLater()
+        window.health_worker = None
+
+def handle_health_sample(window, rtt):
+    """Show the rolling tunnel latency percentiles on the status label"""
+    if not getattr(window, 'health_worker', None):
+        return
+    update_status_tooltip(window)
+
+def update_status_tooltip(window):
+    """Show latency percentiles and, with parallel tunnels, the state of each tunnel"""
+    lines = []
+    if getattr(window, 'health_worker', None):
+        summary = window.health_worker.monitor.latency.summary()
+        if summary[50] is None:
+            lines.append("延迟: 未知")
+        else:
+            lines.append("延迟 p50/p95/p99: " + "/".join(f"{summary[p] * 1000:.0f}" for p in (50, 95, 99)) + " ms")
+    if getattr(window, 'keep_alive_scheduler', None):
+        stats = window.keep_alive_scheduler.stats
+        lines.append(f"保活: 已发送 {stats.pings} 次，跳过 {stats.skipped} 次，避免断开 {stats.drops_avoided} 次")
+    sampler = getattr(window, 'traffic_sampler', None)
+    if sampler and sampler.connections.count:
+        lines.append(f"连接数: {sampler.connections.latest():.0f}，峰值下行: {format_rate(sampler.down_rate.peak())}")
+    relay = getattr(window.worker, 'relay', None)
+    if relay and len(relay.backends) > 1:
+        for tunnel in relay.snapshot():
+            state = "正常" if tunnel['healthy'] else ("已退出" if not tunnel['alive'] else "异常")
+            lines.append(f"隧道 {tunnel['index'] + 1}: {state}，{tunnel['active']} 个连接")
+    window.status_tooltip = "\n".join(lines)
+    if getattr(window, 'status_label', None) is not None:
+        window.status_label.setToolTip(window.status_tooltip)
+
+def start_tunnel_status(window):
+    """Sample traffic and refresh the per-tunnel state once a second while the relay is running"""
+    if not hasattr(window.worker, 'relay'):
+        return
+    window.traffic_sampler = TrafficSampler(window.worker.relay)
+    window.tunnel_status_timer = QTimer(window)
+    window.tunnel_status_timer.timeout.connect(lambda: refresh_tunnel_status(window))
+    window.tunnel_status_timer.start(1000)
+
+def refresh_tunnel_status(window):
+    window.traffic_sampler.sample()
+    if window.traffic_sampler.up_rate.count:
+        rate = (f"↑ {format_rate(window.traffic_sampler.up_rate.latest())}  "
+                f"↓ {format_rate(window.traffic_sampler.down_rate.latest())}")
+        window.rate_text = rate
+        if getattr(window, 'rate_label', None) is not None:
+            window.rate_label.setText(rate)
+        if getattr(window, 'tray_icon', None):
+            window.tray_icon.setToolTip(f"HITSZ Connect Verge\n{rate}")
+    update_status_tooltip(window)
+
+def stop_tunnel_status(window):
+    if getattr(window, 'tunnel_status_timer', None):
+        window.tunnel_status_timer.stop()
+        window.tunnel_status_timer.deleteLater()
+        window.tunnel_status_timer = None
+        window.traffic_sampler = None
+        window.rate_text = ""
+        if getattr(window, 'rate_label', None) is not None:
+            window.rate_label.clear()
+        if getattr(window, 'tray_icon', None):
+            window.tray_icon.setToolTip("HITSZ Connect Verge")
+
+def handle_unhealthy(window, failures):
+    """Restart a tunnel that is alive but no longer forwarding traffic"""
+    if window.worker and window.worker.isRunning() and not window.worker.is_stopping():
+        handle_output(window, f"Tunnel health check failed {failures} times in a row, restarting zju-connect")
+        window.worker.state_machine.degrade()
+        window.worker.stop(timeout=get_stop_timeout(window), reason=EXIT_HANG)
 
 def handle_connection_finished(window):
     """Handle connection finished event with proper cleanup"""
+    stop_health_check(window)
+    stop_keep_alive(window)
+    stop_tunnel_status(window)
+    exit_reason = None
+    kept_proxy = False
     if window.worker:
+        # finished is emitted at the very end of run(), so this wait is effectively instant
+        window.worker.wait()
+        exit_reason = window.worker.exit_reason
+        if exit_reason in (EXIT_NETWORK_ERROR, EXIT_HANG) and len(window.worker.endpoints) > 1:
+            # Fail over: the next restart prefers the other endpoints
+            get_endpoint_history().demote(*window.worker.endpoint)
+        kept_proxy = (window.worker.proxy_enabled and window.worker.keep_proxy_on_failure
+                      and exit_reason in RETRYABLE_EXITS)
         window.worker.output.disconnect()
+        window.worker.stop_progress.disconnect()
+        window.worker.state_changed.disconnect()
         window.worker.finished.disconnect()
         window.worker.deleteLater()
         window.worker = None
         gc.collect()
 
-    window.status_label.setText("状态: 未连接")
-    if hasattr(window, 'status_icon'):
-        window.status_icon.setIcon(FluentIcon.CANCEL_MEDIUM)
-    if hasattr(window, 'connect_button'):
-        window.connect_button.setChecked(False)
+    if window.auto_reconnect and not getattr(window, 'quitting', False):
+        supervisor = get_supervisor(window)
+        delay = supervisor.next_delay(exit_reason)
+        if delay is not None:
+            handle_output(window, f"zju-connect exited unexpectedly ({exit_reason}), "
+                                  f"reconnecting in {delay:.1f}s (attempt {supervisor.attempt})")
+            window.reconnect_timer.start(int(delay * 1000))
+            update_status(window, "正在重连", False)
+            return
+        if exit_reason == EXIT_AUTH_FAILURE:
+            handle_output(window, "Login failed, not reconnecting")
+
+    if kept_proxy:
+        restore_proxy_async()
+
+    update_status(window, "未连接", False)
+    set_connect_checked(window, False)
+
+    if getattr(window, 'quitting', False):
+        window.quit_app()
+
+def reconnect(window):
+    """Restart zju-connect after an unexpected exit"""
+    if window.worker:
+        return
+    if not getattr(window, 'command_args', None):
+        # Attached to a tunnel started by an earlier session, so rebuild the command
+        window.command_args = build_command_args(window)
+    spawn_worker(window, window.command_args)
+    get_telemetry().reconnects += 1
+    recovery_time = get_supervisor(window).record_started()
+    if recovery_time is not None:
+        handle_output(window, f"Reconnected after {recovery_time:.1f}s "
+                              f"(restart #{window.supervisor.restart_count})")
+
+def update_metrics_server(window):
+    """Serve metrics on localhost at the configured port, restarting the server when the port changes"""
+    try:
+        port = int(window.metrics_bind) if window.metrics_bind else None
+    except ValueError:
+        port = 0
+    if port is not None and not is_valid_port(port):
+        # bind() raises OverflowError rather than OSError past 65535, which would crash the window's setup
+        handle_output(window, f"Invalid metrics port: {window.metrics_bind}")
+        port = None
+    server = getattr(window, 'metrics_server', None)
+    if server and server.port == port:
+        return
+    if server:
+        server.stop()
+        window.metrics_server = None
+    if port is None:
+        return
+    server = MetricsServer(get_telemetry(), port)
+    try:
+        server.start()
+    except (OSError, OverflowError) as e:
+        handle_output(window, f"Could not serve metrics on port {port}: {e}")
+        return
+    window.metrics_server = server
+    handle_output(window, f"Serving metrics at http://127.0.0.1:{port}/metrics")
+
+def start_prefetch(window):
+    """Race the server endpoints in the background while the app is idle and prefetching is on"""
+    window.prefetcher = Prefetcher(
+        get_endpoints=lambda: parse_endpoints(window.server_address, window.port),
+        is_idle=lambda: window.prefetch and window.worker is None
+    )
+    window.prefetcher.start()
 
 def start_connection(window):
     """Start VPN connection"""
+    if window.worker and window.worker.is_stopping():
+        update_status(window, "正在断开", False)
+        set_connect_checked(window, False)
+        return
+
     if window.worker and window.worker.isRunning():
-        window.status_label.setText("状态: 正在运行")
-        if hasattr(window, 'status_icon'):
-            window.status_icon.setIcon(FluentIcon.ACCEPT_MEDIUM)
+        update_status(window, *STATE_STATUS.get(window.worker.state_machine.state, STATE_STATUS[STATE_CONNECTING]))
         return
 
-    username = window.username_input.text()
-    password = window.password_input.text()
-    server_address = window.server_address
-    port = window.port
-    dns_server_address = window.dns_server
+    with span("start_connection"):
+        with span("check_ports"):
+            port_problem = check_ports(window)
+        if port_problem:
+            set_connect_checked(window, False)
+            update_status(window, port_problem, False)
+            return
 
-    if getattr(sys, 'frozen', False):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
-    if system() == "Windows":
-        command = os.path.join(base_path, "core", "zju-connect.exe")
+        with span("build_command_args"):
+            window.command_args = build_command_args(window)
+        with span("spawn_worker"):
+            spawn_worker(window, window.command_args)
+    supervisor = get_supervisor(window)
+    supervisor.reset()
+    supervisor.record_started()
+
+def check_ports(window):
+    """Check the proxy ports before zju-connect spends seconds logging in, switching or failing fast.
+
+    Returns None when connecting can go ahead, otherwise the status to show.
+    """
+    window.bound_ports = None
+    configured = {}
+    for kind, value in (("http", window.http_bind), ("socks", window.socks_bind)):
+        configured[kind] = int(value) if str(value).isdigit() else None
+
+    start = time.perf_counter()
+    try:
+        bound_ports, messages = preflight_ports(configured, window.auto_port)
+    except InvalidPortError as e:
+        handle_output(window, f"Cannot connect, proxy port {e}. Pick a port from 1 to 65535 in the advanced settings.")
+        return "端口无效"
+    except PortConflictError as e:
+        handle_output(window, f"Cannot connect, proxy port {e} (checked in {(time.perf_counter() - start) * 1000:.1f} ms). "
+                              "Free the port, pick another one in the advanced settings, "
+                              "or turn on automatic port selection.")
+        return "端口被占用"
+    for message in messages:
+        handle_output(window, message)
+    window.bound_ports = bound_ports
+    return None
+
+def build_command_args(window):
+    """Build the zju-connect command line from the window's credentials and settings"""
+    _, http_port, _, socks_port = get_proxy_settings(window)
+    config = {
+        'server': window.server_address,
+        'port': window.port,
+        'dns': window.dns_server,
+        'http_bind': str(http_port) if http_port else '',
+        'socks_bind': str(socks_port) if socks_port else '',
+        # With adaptive keep-alive the app sends the pings, so zju-connect's fixed ones are turned off
+        'keep_alive': window.keep_alive and not uses_adaptive_keep_alive(window),
+        'debug_dump': window.debug_dump,
+    }
+    command_args = build_zju_connect_args(*get_credentials(window), config)
+    handle_output(window, f"Running command: {mask_credentials(command_args)}\n")
+    return command_args
+
+def get_tunnel_count(window):
+    try:
+        return min(MAX_TUNNELS, max(1, int(window.tunnels)))
+    except ValueError:
+        return 1
+
+def spawn_worker(window, command_args):
+    """Start a worker for command_args, in a detached daemon if enabled, and wire it to the window"""
+    kwargs = dict(command_args=command_args, proxy_enabled=window.proxy, window=window,
+                  keep_proxy_on_failure=window.auto_reconnect,
+                  endpoints=parse_endpoints(window.server_address, window.port),
+                  prefetcher=getattr(window, 'prefetcher', None) if window.prefetch else None,
+                  split_tunnel=window.split_tunnel)
+    tunnels = get_tunnel_count(window)
+    if window.detached_tunnel:
+        # DaemonWorker takes no split_tunnel argument
+        split_tunnel = kwargs.pop('split_tunnel')
+        if tunnels > 1 or window.traffic_stats or split_tunnel:
+            handle_output(window, "Parallel tunnels, traffic stats and split tunneling are not supported "
+                                  "with a detached tunnel")
+        window.worker = DaemonWorker(**kwargs)
+    elif tunnels > 1 or window.traffic_stats:
+        window.worker = MultiTunnelWorker(tunnels=tunnels, **kwargs)
     else:
-        command = os.path.join(base_path, "core", "zju-connect")
-        if os.path.exists(command):
-            os.chmod(command, 0o755)
-
-    command_args = [
-        command,
-        "-server", shlex.quote(server_address),
-        "-port", shlex.quote(str(port)),
-        "-zju-dns-server", shlex.quote(dns_server_address),
-        "-username", shlex.quote(username),
-        "-password", shlex.quote(password)
-    ]
-    
-    if window.http_bind:
-        command_args.extend(["-http-bind", shlex.quote("127.0.0.1:" + window.http_bind)])
-    
-    if window.socks_bind:
-        command_args.extend(["-socks-bind", shlex.quote("127.0.0.1:" + window.socks_bind)])
-
-    if not window.keep_alive:
-        command_args.append("-disable-keep-alive")
-    
-    if window.debug_dump:
-        command_args.append("-debug-dump")
-
-    command_args.append("-disable-zju-config")
-    command_args.append("-disable-zju-dns")
-    command_args.append("-skip-domain-resource")
-    
-    debug_command = command_args.copy()
-    username_index = debug_command.index("-username") + 1
-    debug_command[username_index] = "********"
-    pwd_index = debug_command.index("-password") + 1
-    debug_command[pwd_index] = "********"
-    window.output_text.append(f"Running command: {' '.join(debug_command)}\n")
-
-    window.worker = CommandWorker(command_args=command_args, proxy_enabled=window.proxy, window=window)
+        window.worker = CommandWorker(**kwargs)
+    start_worker(window)
+
+def attach_tunnel(window):
+    """Attach to a tunnel daemon left running by an earlier session, if there is one"""
+    state = find_running_daemon()
+    if state is None:
+        return False
+    window.worker = DaemonWorker(proxy_enabled=window.proxy, window=window,
+                                 keep_proxy_on_failure=window.auto_reconnect, state=state)
+    start_worker(window)
+    get_supervisor(window).reset()
+    handle_output(window, f"Attached to running tunnel (pid {state['pid']})")
+    set_connect_checked(window, True)
+    return True
+
+def start_worker(window):
+    """Wire window.worker to the window and start it"""
     window.worker.output.connect(lambda text: handle_output(window, text))
+    window.worker.stop_progress.connect(lambda text: handle_output(window, text))
+    window.worker.state_changed.connect(lambda state: handle_state_changed(window, state))
     window.worker.finished.connect(lambda: handle_connection_finished(window))
     window.worker.start()
+    start_health_check(window)
+    start_keep_alive(window)
+    start_tunnel_status(window)
 
-    window.status_label.setText("状态: 正在运行")
-    if hasattr(window, 'status_icon'):
-        window.status_icon.setIcon(FluentIcon.ACCEPT_MEDIUM)
+    update_status(window, *STATE_STATUS[STATE_CONNECTING])
 
 def stop_connection(window):
-    """Stop VPN connection with proper cleanup"""
-    if window.worker:
-        window.worker.stop()
-        window.worker.wait()
-        window.worker.output.disconnect()
-        window.worker.finished.disconnect()
-        window.worker.deleteLater()
-        window.worker = None
-        gc.collect()
+    """Request the VPN connection to stop; cleanup happens in handle_connection_finished"""
+    if window.worker and window.worker.isRunning():
+        with span("stop_connection"):
+            stop_health_check(window)
+            stop_keep_alive(window)
+            window.worker.stop(timeout=get_stop_timeout(window))
+        update_status(window, "正在断开", False)
+        return
+
+    if getattr(window, 'reconnect_timer', None) and window.reconnect_timer.isActive():
+        # The last worker kept the system proxy for the restart that is now cancelled
+        window.reconnect_timer.stop()
+        window.supervisor.reset()
+        if window.proxy:
+            restore_proxy_async()
 
-    window.status_label.setText("状态: 未连接")
-    if hasattr(window, 'status_icon'):
-        window.status_icon.setIcon(FluentIcon.CANCEL_MEDIUM)
+    update_status(window, "未连接", False)
@@ -1,15 +1,25 @@
-from .config_utils import load_config, save_config
+from .config_utils import get_config_store
+from .trace_utils import span
+
+def get_credentials(window):
+    """Username and password from the panel, or the values kept on the window while the panel is not built"""
+    if getattr(window, 'username_input', None) is not None:
+        return window.username_input.text(), window.password_input.text()
+    return window.username, window.password
 
 def save_credentials(window):
-    config = load_config()
-    
+    """Record the credentials in the config store; it writes them out in the background"""
+    if getattr(window, 'remember_cb', None) is None:
+        # Without the panel nothing could have been edited
+        return
     if window.remember_cb.isChecked():
-        config['username'] = window.username_input.text()
-        config['password'] = window.password_input.text()
-        config['remember'] = True
+        config = {
+            'username': window.username_input.text(),
+            'password': window.password_input.text(),
+            'remember': True,
+        }
     else:
-        config['username'] = ''
-        config['password'] = ''
-        config['remember'] = False
-    
-    save_config(config)
+        config = {'username': '', 'password': '', 'remember': False}
+
+    with span("save_credentials"):
+        get_config_store().update(config)
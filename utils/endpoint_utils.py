@@ -0,0 +1,157 @@
+import os
+import json
+import socket
+import ssl
+import threading
+import time
+from .common import get_app_data_dir
+
+HISTORY_FILE = "endpoints.json"
+HISTORY_WEIGHT = 0.3  # weight of the newest sample in the moving average
+RACE_STAGGER = 0.25  # seconds between starting successive attempts
+RACE_TIMEOUT = 3.0
+DEMOTE_SECONDS = 300.0
+
+def parse_endpoints(server, default_port):
+    """Parse a comma-separated list of host[:port] entries into (host, port) tuples"""
+    endpoints = []
+    for entry in server.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, sep, port = entry.rpartition(":")
+        if sep and port.isdigit() and not host.endswith(":"):
+            endpoints.append((host.strip("[]"), int(port)))
+        else:
+            endpoints.append((entry.strip("[]"), int(default_port) if str(default_port).isdigit() else default_port))
+    return endpoints
+
+def endpoint_key(host, port):
+    return f"{host}:{port}"
+
+def check_endpoint(host, port, timeout=RACE_TIMEOUT):
+    """Time a TCP connect plus TLS handshake to an endpoint, in seconds"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    start = time.perf_counter()
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=host):
+            pass
+    return time.perf_counter() - start
+
+class EndpointHistory:
+    """Moving-average latency per endpoint, persisted so the ordering carries over between sessions"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.latency = {}
+        self.demoted_until = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.latency = {key: float(value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            self.latency = {}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.latency, f)
+        except OSError:
+            pass
+
+    def record(self, host, port, latency):
+        """Record a successful check, or a failed one when latency is None"""
+        key = endpoint_key(host, port)
+        if latency is None:
+            latency = RACE_TIMEOUT * 2
+        with self._lock:
+            previous = self.latency.get(key)
+            self.latency[key] = latency if previous is None else previous + HISTORY_WEIGHT * (latency - previous)
+            self._save()
+
+    def demote(self, host, port, seconds=DEMOTE_SECONDS):
+        """Move an endpoint to the back of the order for a while after it degraded"""
+        with self._lock:
+            self.demoted_until[endpoint_key(host, port)] = time.monotonic() + seconds
+
+    def is_demoted(self, host, port):
+        return self.demoted_until.get(endpoint_key(host, port), 0) > time.monotonic()
+
+    def ordered(self, endpoints):
+        """Sort endpoints best first: not demoted, then by average latency, unknown ones first"""
+        return sorted(endpoints, key=lambda e: (self.is_demoted(*e), self.latency.get(endpoint_key(*e), 0.0)))
+
+_history = None
+
+def get_endpoint_history():
+    global _history
+    if _history is None:
+        _history = EndpointHistory(os.path.join(get_app_data_dir(), HISTORY_FILE))
+    return _history
+
+def race_endpoints(endpoints, history=None, timeout=RACE_TIMEOUT, stagger=RACE_STAGGER):
+    """Check endpoints concurrently, happy-eyeballs style, and return the best reachable one.
+
+    Attempts start in history order, one every stagger seconds. As soon as one endpoint
+    answers, the fastest answer so far wins unless it is demoted; attempts still in flight
+    keep updating the history.
+    Returns (endpoint, latency), or (None, None) when nothing answered within timeout.
+    """
+    history = history or get_endpoint_history()
+    ordered = history.ordered(endpoints)
+    results = {}
+    done = threading.Condition()
+
+    def attempt(endpoint, delay):
+        time.sleep(delay)
+        try:
+            latency = check_endpoint(*endpoint, timeout=timeout)
+        except OSError:
+            latency = None
+        history.record(*endpoint, latency)
+        with done:
+            results[endpoint] = latency
+            done.notify_all()
+
+    for index, endpoint in enumerate(ordered):
+        threading.Thread(target=attempt, args=(endpoint, index * stagger), daemon=True).start()
+
+    def winner():
+        reachable = [e for e in ordered if results.get(e) is not None]
+        preferred = [e for e in reachable if not history.is_demoted(*e)]
+        if preferred:
+            return min(preferred, key=results.get)
+        # Only fall back to a demoted endpoint once every attempt has finished
+        if reachable and len(results) == len(ordered):
+            return min(reachable, key=results.get)
+        return None
+
+    deadline = time.monotonic() + timeout + stagger * len(ordered)
+    with done:
+        while True:
+            endpoint = winner()
+            if endpoint or len(results) == len(ordered):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done.wait(remaining)
+    if endpoint is None:
+        return None, None
+    return endpoint, results[endpoint]
+
+def apply_endpoint(command_args, host, port):
+    """Return a copy of the zju-connect arguments pointed at another server endpoint"""
+    command_args = list(command_args)
+    command_args[command_args.index("-server") + 1] = host
+    command_args[command_args.index("-port") + 1] = str(port)
+    return command_args
@@ -0,0 +1,125 @@
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+def probe_socks(proxy_host, proxy_port, target_host, target_port, timeout=5.0):
+    """Open a connection to target through a SOCKS5 proxy and return the round-trip time in seconds"""
+    start = time.perf_counter()
+    with socket.create_connection((proxy_host, proxy_port), timeout=timeout) as sock:
+        sock.sendall(b"\x05\x01\x00")
+        if _recv_exact(sock, 2) != b"\x05\x00":
+            raise OSError("SOCKS5 proxy refused the handshake")
+        host = target_host.encode("idna")
+        sock.sendall(b"\x05\x01\x00\x03" + bytes([len(host)]) + host + struct.pack("!H", target_port))
+        reply = _recv_exact(sock, 4)
+        if reply[1] != 0:
+            raise OSError(f"SOCKS5 connect failed with code {reply[1]}")
+        address_length = {1: 4, 3: None, 4: 16}.get(reply[3])
+        if address_length is None:
+            address_length = _recv_exact(sock, 1)[0]
+        _recv_exact(sock, address_length + 2)
+    return time.perf_counter() - start
+
+def probe_http(proxy_host, proxy_port, target_host, target_port, timeout=5.0):
+    """Open a CONNECT tunnel to target through an HTTP proxy and return the round-trip time in seconds"""
+    start = time.perf_counter()
+    with socket.create_connection((proxy_host, proxy_port), timeout=timeout) as sock:
+        target = f"{target_host}:{target_port}"
+        sock.sendall(f"CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n".encode())
+        status_line = sock.recv(1024).split(b"\r\n", 1)[0]
+        parts = status_line.split()
+        if len(parts) < 2 or parts[1] != b"200":
+            raise OSError(f"HTTP proxy CONNECT failed: {status_line.decode(errors='replace')}")
+    return time.perf_counter() - start
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise OSError("Proxy closed the connection")
+        data += chunk
+    return data
+
+def parse_target(target, default_port=53):
+    """Split a host[:port] string into (host, port)"""
+    host, _, port = target.strip().rpartition(":")
+    if not host:
+        return port, default_port
+    return host, int(port)
+
+class LatencyWindow:
+    """Rolling window of round-trip times with percentile queries"""
+
+    def __init__(self, size=100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, rtt):
+        self.samples.append(rtt)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self):
+        return {p: self.percentile(p) for p in (50, 95, 99)}
+
+class HealthMonitor:
+    """Probe the tunnel periodically on a background thread and report when it stops responding.
+
+    on_sample(rtt) is called with the round-trip time in seconds, or None for a failed probe.
+    on_unhealthy(failures) is called once failure_threshold probes in a row have failed;
+    a threshold below 1 counts as 1, so a successful probe never reports the tunnel unhealthy.
+    Both callbacks run on the monitor thread.
+    """
+
+    def __init__(self, probe, interval=10.0, failure_threshold=3, startup_grace=60.0,
+                 on_sample=None, on_unhealthy=None):
+        self.probe = probe
+        self.interval = interval
+        self.failure_threshold = max(1, failure_threshold)
+        self.startup_grace = startup_grace
+        self.on_sample = on_sample
+        self.on_unhealthy = on_unhealthy
+        self.latency = LatencyWindow()
+        self.failures = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        started = time.monotonic()
+        healthy_once = False
+        while not self._stop_event.wait(self.interval):
+            try:
+                rtt = self.probe()
+            except OSError:
+                rtt = None
+            if self._stop_event.is_set():
+                return
+
+            if rtt is not None:
+                healthy_once = True
+                self.failures = 0
+                self.latency.add(rtt)
+            elif healthy_once or time.monotonic() - started >= self.startup_grace:
+                # Failures while zju-connect is still logging in do not count
+                self.failures += 1
+
+            if self.on_sample:
+                self.on_sample(rtt)
+            if self.failures >= self.failure_threshold:
+                self.failures = 0
+                if self.on_unhealthy:
+                    self.on_unhealthy(self.failure_threshold)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+DEFAULT_IDLE_TIMEOUT = 300.0  # seconds the server keeps an idle session
+PING_FRACTION = 0.5    # ping once the tunnel has been idle for this share of the timeout
+CHECK_FRACTION = 0.25  # look at the traffic counters this often while pings are not due
+RETRY_FRACTION = 0.05  # retry a failed ping this often, so several attempts fit before the timeout
+MIN_INTERVAL = 2.0
+
+class KeepAliveStats:
+    """Keep-alive counters; the scheduler thread writes them and readers only look"""
+
+    def __init__(self):
+        self.pings = 0
+        self.failures = 0
+        self.skipped = 0
+        self.drops_avoided = 0
+        self.idle_timeout = 0.0  # 0 while the app is not scheduling keep-alive
+
+class KeepAliveScheduler:
+    """Keep an idle tunnel alive from a background thread with as few pings as the idle timeout allows.
+
+    ping() sends traffic through the tunnel and raises OSError on failure. activity() returns
+    a counter that grows with real traffic, such as the relay's byte count, or is None when
+    traffic cannot be observed; pings are then sent on a fixed schedule.
+    """
+
+    def __init__(self, ping, idle_timeout=DEFAULT_IDLE_TIMEOUT, activity=None, stats=None):
+        self.ping = ping
+        self.idle_timeout = idle_timeout
+        self.activity = activity
+        self.stats = stats or KeepAliveStats()
+        self.ping_after = idle_timeout * PING_FRACTION
+        self.check_interval = max(MIN_INTERVAL, idle_timeout * CHECK_FRACTION)
+        self.retry_interval = max(MIN_INTERVAL, idle_timeout * RETRY_FRACTION)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.stats.idle_timeout = self.idle_timeout
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.stats.idle_timeout = 0.0
+
+    def _read_activity(self):
+        return self.activity() if self.activity else None
+
+    def _run(self):
+        now = time.monotonic()
+        last_check = last_active = last_traffic = last_due = now
+        counter = self._read_activity()
+        pinged = False   # a ping has succeeded since the last real traffic
+        avoided = False  # this idle stretch has been counted as a drop avoided
+        failed = False
+        delay = self.ping_after if counter is None else self.check_interval
+        while not self._stop_event.wait(delay):
+            now = time.monotonic()
+            total = self._read_activity()
+            if total is not None and total != counter:
+                if now - last_due >= self.ping_after:
+                    # A fixed schedule would have pinged by now
+                    self.stats.skipped += 1
+                    last_due = now
+                counter = total
+                # The traffic happened some time since the last check; assume the earliest
+                last_active = last_traffic = last_check
+                pinged = avoided = failed = False
+            last_check = now
+
+            if now - last_active >= self.ping_after:
+                try:
+                    self.ping()
+                except OSError:
+                    self.stats.failures += 1
+                    failed = True
+                else:
+                    if self._stop_event.is_set():
+                        return
+                    self.stats.pings += 1
+                    pinged, failed = True, False
+                    last_check = last_active = last_due = time.monotonic()
+                    # The ping's own bytes are not traffic to react to
+                    counter = self._read_activity()
+
+            if pinged and not avoided and last_check - last_traffic >= self.idle_timeout:
+                # Without the pings the server would have dropped this idle session by now
+                self.stats.drops_avoided += 1
+                avoided = True
+
+            delay = self._next_delay(time.monotonic() - last_active, failed, counter is None)
+
+    def _next_delay(self, idle, failed, blind):
+        """Seconds until the next check: soon after a failure, at the ping deadline otherwise"""
+        if failed:
+            return self.retry_interval
+        until_ping = max(MIN_INTERVAL, self.ping_after - idle)
+        return until_ping if blind else min(self.check_interval, until_ping)
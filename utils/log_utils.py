@@ -0,0 +1,101 @@
+import os
+import gzip
+import shutil
+import threading
+from collections import deque
+from .common import get_app_data_dir
+
+LOG_PANE_MAX_LINES = 5000
+LOG_FILE_NAME = "session.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+class SessionLog:
+    """Append-only session log, rotated by size into gzip-compressed backups"""
+
+    def __init__(self, log_dir, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, LOG_FILE_NAME)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _backup_path(self, index):
+        return f"{self.path}.{index}.gz"
+
+    def write_lines(self, lines):
+        """Append lines to the current log file, rotating it when it grows too large"""
+        if not lines:
+            return
+        data = "\n".join(line.rstrip("\n") for line in lines) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(self.log_dir, exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(data)
+                self._file.flush()
+                if self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except OSError:
+                pass
+
+    def _rotate(self):
+        """Shift older backups and compress the current file into the first slot"""
+        self._file.close()
+        self._file = None
+
+        oldest = self._backup_path(self.backup_count)
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(self._backup_path(index)):
+                os.replace(self._backup_path(index), self._backup_path(index + 1))
+
+        with open(self.path, "rb") as src, gzip.open(self._backup_path(1), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(self.path)
+
+    def export(self, dest_path):
+        """Stream every backup, oldest first, followed by the current file into dest_path"""
+        with self._lock:
+            if self._file:
+                self._file.flush()
+            with open(dest_path, "wb") as dst:
+                for index in range(self.backup_count, 0, -1):
+                    if os.path.exists(self._backup_path(index)):
+                        with gzip.open(self._backup_path(index), "rb") as src:
+                            shutil.copyfileobj(src, dst)
+                if os.path.exists(self.path):
+                    with open(self.path, "rb") as src:
+                        shutil.copyfileobj(src, dst)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+_session_log = None
+
+def get_session_log():
+    """Get the shared session log under the app data directory"""
+    global _session_log
+    if _session_log is None:
+        _session_log = SessionLog(os.path.join(get_app_data_dir(), "logs"))
+    return _session_log
+
+def init_log_view(text_edit, lines=()):
+    """Bound the log pane so old lines are discarded once it is full, and fill it with lines logged so far"""
+    text_edit.document().setMaximumBlockCount(LOG_PANE_MAX_LINES)
+    if lines:
+        text_edit.setPlainText("\n".join(lines))
+
+def append_output(window, text):
+    """Append text to the log pane, keeping recent lines on the window for a pane that is built later"""
+    if getattr(window, 'log_lines', None) is None:
+        window.log_lines = deque(maxlen=LOG_PANE_MAX_LINES)
+    window.log_lines.extend(text.split("\n"))
+    if getattr(window, 'output_text', None) is not None:
+        window.output_text.append(text)
@@ -1,10 +1,8 @@
-from PySide6.QtWidgets import QMessageBox, QDialog, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QMessageBox, QMainWindow, QMenuBar
-from PySide6.QtGui import QGuiApplication, QKeySequence
-import requests
-from packaging import version
-import webbrowser
+from PySide6.QtWidgets import QMessageBox, QDialog, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QMessageBox, QMainWindow, QMenuBar, QFileDialog
+from PySide6.QtGui import QKeySequence
 from PySide6.QtCore import Qt
-from .advanced_panel import AdvancedSettingsDialog
+from .log_utils import get_session_log, append_output
+from .trace_utils import get_tracer
 from platform import system
 if system() == "Darwin":
     from utils.macos_utils import hide_dock_icon
@@ -26,7 +24,8 @@ def setup_menubar(window: QMainWindow, version):
     
     # Help Menu
     about_menu = menubar.addMenu("帮助")
-    about_menu.addAction("复制日志").triggered.connect(lambda: copy_log(window))  # Changed text and function
+    about_menu.addAction("导出日志").triggered.connect(lambda: export_log(window))
+    about_menu.addAction("导出连接耗时").triggered.connect(lambda: export_trace(window))
     about_menu.addAction("检查更新").triggered.connect(lambda: check_for_updates(window, version))
     about_menu.addAction("关于").triggered.connect(lambda: show_about(window, version))
 
@@ -39,77 +38,114 @@ def show_about(window, version):
     QMessageBox.about(window, "关于 HITSZ Connect Verge", about_text)
 
 
-def copy_log(window):
-    """Copy log text to clipboard directly"""
-    QGuiApplication.clipboard().setText(window.output_text.toPlainText())
-    QMessageBox.information(window, "复制日志", "日志已复制到剪贴板")
+def export_log(window):
+    """Stream the full session log history into a file chosen by the user"""
+    path, _ = QFileDialog.getSaveFileName(window, "导出日志", "hitsz-connect-verge.log", "Log Files (*.log *.txt)")
+    if not path:
+        return
+    try:
+        get_session_log().export(path)
+        QMessageBox.information(window, "导出日志", "日志已导出")
+    except OSError:
+        QMessageBox.warning(window, "导出日志", "日志导出失败")
+
+def export_trace(window):
+    """Write the recorded connect/stop timing spans as a Chrome trace or JSON lines file"""
+    path, _ = QFileDialog.getSaveFileName(window, "导出连接耗时", "hitsz-connect-verge-trace.json",
+                                          "Chrome Trace (*.json);;JSON Lines (*.jsonl)")
+    if not path:
+        return
+    try:
+        get_tracer().export(path)
+        QMessageBox.information(window, "导出连接耗时", "连接耗时已导出")
+    except OSError:
+        QMessageBox.warning(window, "导出连接耗时", "连接耗时导出失败")
 
 def check_for_updates(parent, current_version, startup=False):
     """
-    Check for updates and show appropriate dialog.
+    Check for updates in the background and show the result when it arrives.
     
     Args:
         parent: Parent widget for dialogs
         current_version: Current version string
+        startup: Report the result in the log instead of a dialog, and trust a recent cached answer
     """
-    try:
-        response = requests.get(
-            "https://api.github.com/repos/kowyo/hitsz-connect-verge/releases/latest",
-            timeout=5
+    from .update_utils import UpdateWorker
+
+    if getattr(parent, 'update_worker', None) is not None:
+        return
+    parent.update_worker = UpdateWorker(current_version, force=not startup)
+    parent.update_worker.result.connect(
+        lambda latest, newer: show_update_result(parent, current_version, latest, newer, startup)
+    )
+    parent.update_worker.failed.connect(lambda: show_update_failed(parent, startup))
+    parent.update_worker.finished.connect(lambda: finish_update_check(parent))
+    parent.update_worker.start()
+
+def finish_update_check(parent):
+    parent.update_worker.deleteLater()
+    parent.update_worker = None
+
+def show_update_result(parent, current_version, latest_version, newer, startup):
+    """Show the download dialog if a newer release exists"""
+    import webbrowser
+
+    if newer:
+        dialog = QDialog(parent)
+        dialog.setWindowTitle("检查更新")
+        dialog.setMinimumWidth(300)
+
+        layout = QVBoxLayout()
+        layout.setSpacing(15)
+        layout.setContentsMargins(20, 20, 20, 20)
+
+        message = f"""<div style='text-align: center;'>
+        <h3 style='margin-bottom: 15px;'>发现新版本！</h3>
+        <p>当前版本：{current_version}</p>
+        <p>最新版本：{latest_version}</p>
+        </div>"""
+        message_label = QLabel(message)
+        message_label.setTextFormat(Qt.RichText)
+        layout.addWidget(message_label)
+
+        button_layout = QHBoxLayout()
+        button_layout.setSpacing(10)
+
+        download_button = QPushButton("下载更新")
+        download_button.clicked.connect(
+            lambda: webbrowser.open("https://github.com/kowyo/hitsz-connect-verge/releases/latest")
         )
-        response.raise_for_status()
-        latest_version = response.json()["tag_name"].lstrip('v')
-
-        if version.parse(latest_version) > version.parse(current_version):
-            dialog = QDialog(parent)
-            dialog.setWindowTitle("检查更新")
-            dialog.setMinimumWidth(300)
-
-            layout = QVBoxLayout()
-            layout.setSpacing(15)
-            layout.setContentsMargins(20, 20, 20, 20)
-
-            message = f"""<div style='text-align: center;'>
-            <h3 style='margin-bottom: 15px;'>发现新版本！</h3>
-            <p>当前版本：{current_version}</p>
-            <p>最新版本：{latest_version}</p>
-            </div>"""
-            message_label = QLabel(message)
-            message_label.setTextFormat(Qt.RichText)
-            layout.addWidget(message_label)
-
-            button_layout = QHBoxLayout()
-            button_layout.setSpacing(10)
-
-            download_button = QPushButton("下载更新")
-            download_button.clicked.connect(
-                lambda: webbrowser.open("https://github.com/kowyo/hitsz-connect-verge/releases/latest")
-            )
-            button_layout.addWidget(download_button)
-
-            close_button = QPushButton("关闭")
-            close_button.clicked.connect(dialog.close)
-            button_layout.addWidget(close_button)
-
-            layout.addLayout(button_layout)
-            dialog.setLayout(layout)
-            dialog.finished.connect(dialog.deleteLater)
-            dialog.exec()
-        else:
-            if not startup:
-                QMessageBox.information(parent, "检查更新", "当前已是最新版本！")
-            else:
-                parent.output_text.append("App is up to date.\n")
-
-    except requests.RequestException:
-        if not startup:
-            QMessageBox.warning(parent, "检查更新", "检查更新失败，请检查网络连接。")
-        else:
-            parent.output_text.append("Failed to check for updates. Please check your network connection.\n")
+        button_layout.addWidget(download_button)
+
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(dialog.close)
+        button_layout.addWidget(close_button)
+
+        layout.addLayout(button_layout)
+        dialog.setLayout(layout)
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.exec()
+    elif not startup:
+        QMessageBox.information(parent, "检查更新", "当前已是最新版本！")
+    else:
+        append_output(parent, "App is up to date.\n")
+
+def show_update_failed(parent, startup):
+    if not startup:
+        QMessageBox.warning(parent, "检查更新", "检查更新失败，请检查网络连接。")
+    else:
+        append_output(parent, "Failed to check for updates. Please check your network connection.\n")
 
 def show_advanced_settings(window):
-    """Show advanced settings dialog with proper cleanup"""
-    dialog = AdvancedSettingsDialog(window)
+    """Show the advanced settings dialog, built on first use and reused afterwards"""
+    from .advanced_panel import AdvancedSettingsDialog
+    from .connection_utils import update_metrics_server
+    from .telemetry_utils import get_telemetry
+
+    dialog = getattr(window, 'advanced_dialog', None)
+    if dialog is None:
+        # set_settings refills it from the in-memory settings on every open
+        dialog = window.advanced_dialog = AdvancedSettingsDialog(window)
     dialog.set_settings(
         window.server_address,
         window.port,
@@ -122,8 +158,22 @@ def show_advanced_settings(window):
         window.keep_alive,
         window.debug_dump,
         window.http_bind,
-        window.socks_bind
+        window.socks_bind,
+        window.stop_timeout,
+        window.auto_reconnect,
+        window.health_check,
+        window.health_target,
+        window.prefetch,
+        window.detached_tunnel,
+        window.tunnels,
+        window.auto_port,
+        window.traffic_stats,
+        window.split_tunnel,
+        window.metrics_bind,
+        window.adaptive_keep_alive,
+        window.idle_timeout
     )
+    dialog.set_keep_alive_stats(get_telemetry().keepalive)
     
     if dialog.exec():
         settings = dialog.get_settings()
@@ -139,5 +189,19 @@ def show_advanced_settings(window):
         window.debug_dump = settings['debug_dump']
         window.http_bind = settings['http_bind']
         window.socks_bind = settings['socks_bind']
+        window.stop_timeout = settings['stop_timeout']
+        window.auto_reconnect = settings['auto_reconnect']
+        window.health_check = settings['health_check']
+        window.health_target = settings['health_target']
+        window.prefetch = settings['prefetch']
+        window.detached_tunnel = settings['detached_tunnel']
+        window.tunnels = settings['tunnels']
+        window.auto_port = settings['auto_port']
+        window.traffic_stats = settings['traffic_stats']
+        window.split_tunnel = settings['split_tunnel']
+        window.metrics_bind = settings['metrics_bind']
+        window.adaptive_keep_alive = settings['adaptive_keep_alive']
+        window.idle_timeout = settings['idle_timeout']
+        update_metrics_server(window)
         if system() == "Darwin":
             hide_dock_icon(window.hide_dock_icon)
\ No newline at end of file
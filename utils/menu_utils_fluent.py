@@ -1,10 +1,8 @@
-import requests
-from packaging import version
-import webbrowser
 from qfluentwidgets import (CommandBar, Action,
                           FluentIcon, TransparentPushButton, TransparentDropDownPushButton, RoundMenu, MessageBox, Dialog)
-from PySide6.QtGui import QGuiApplication
-from .advanced_panel_fluent import AdvancedSettingsDialog  # Update this import
+from PySide6.QtWidgets import QFileDialog
+from .log_utils import get_session_log, append_output
+from .trace_utils import get_tracer
 
 def setup_menubar(window, version):
     """Set up the command bar instead of traditional menu bar"""
@@ -21,7 +19,8 @@ def setup_menubar(window, version):
     help_button.setFixedHeight(34)
     help_menu = RoundMenu(parent=window)
     help_menu.addActions([
-        Action(FluentIcon.COPY, '复制日志', triggered=lambda: copy_log(window)),
+        Action(FluentIcon.SAVE_AS, '导出日志', triggered=lambda: export_log(window)),
+        Action(FluentIcon.STOP_WATCH, '导出连接耗时', triggered=lambda: export_trace(window)),
         Action(FluentIcon.UPDATE, '检查更新', triggered=lambda: check_for_updates(window, version)),
         Action(FluentIcon.INFO, '关于', triggered=lambda: show_about(window, version))
     ])
@@ -37,50 +36,83 @@ def show_about(window, version):
     <p>Author: <a href="https://github.com/kowyo">Kowyo</a></p> '''
     Dialog("关于 HITSZ Connect Verge", about_text, parent=window).exec()
 
-def copy_log(window):
-    """Copy log text to clipboard directly"""
-    QGuiApplication.clipboard().setText(window.output_text.toPlainText())
-    MessageBox("复制日志", "日志已复制到剪贴板", parent=window).exec()
+def export_log(window):
+    """Stream the full session log history into a file chosen by the user"""
+    path, _ = QFileDialog.getSaveFileName(window, "导出日志", "hitsz-connect-verge.log", "Log Files (*.log *.txt)")
+    if not path:
+        return
+    try:
+        get_session_log().export(path)
+        MessageBox("导出日志", "日志已导出", parent=window).exec()
+    except OSError:
+        MessageBox("导出日志", "日志导出失败", parent=window).exec()
+
+def export_trace(window):
+    """Write the recorded connect/stop timing spans as a Chrome trace or JSON lines file"""
+    path, _ = QFileDialog.getSaveFileName(window, "导出连接耗时", "hitsz-connect-verge-trace.json",
+                                          "Chrome Trace (*.json);;JSON Lines (*.jsonl)")
+    if not path:
+        return
+    try:
+        get_tracer().export(path)
+        MessageBox("导出连接耗时", "连接耗时已导出", parent=window).exec()
+    except OSError:
+        MessageBox("导出连接耗时", "连接耗时导出失败", parent=window).exec()
 
 def check_for_updates(parent, current_version, startup=False):
     """
-    Check for updates and show appropriate dialog.
+    Check for updates in the background and show the result when it arrives.
     
     Args:
         parent: Parent widget for dialogs
         current_version: Current version string
+        startup: Report the result in the log instead of a dialog, and trust a recent cached answer
     """
-    try:
-        response = requests.get(
-            "https://api.github.com/repos/kowyo/hitsz-connect-verge/releases/latest",
-            timeout=5
-        )
-        response.raise_for_status()
-        latest_version = response.json()["tag_name"].lstrip('v')
-        
-        if version.parse(latest_version) > version.parse(current_version):
-            title = "检查更新"
-            message = f"发现新版本 {latest_version}，是否前往下载？"
-            dialog = MessageBox(title, message, parent=parent)
-            if dialog.exec():
-                webbrowser.open("https://github.com/kowyo/hitsz-connect-verge/releases/latest/")
-            else:
-                return
-        else:
-            if not startup:
-                MessageBox("检查更新", "当前已是最新版本。", parent=parent).exec()
-            else:
-                parent.output_text.append("App is up to date.\n")
-            
-    except requests.RequestException:
-        if not startup:
-            MessageBox("检查更新", "检查更新失败，请检查网络连接。", parent=parent).exec()
-        else:
-            parent.output_text.append("Failed to check for updates. Please check your network connection.\n")
+    from .update_utils import UpdateWorker
+
+    if getattr(parent, 'update_worker', None) is not None:
+        return
+    parent.update_worker = UpdateWorker(current_version, force=not startup)
+    parent.update_worker.result.connect(lambda latest, newer: show_update_result(parent, latest, newer, startup))
+    parent.update_worker.failed.connect(lambda: show_update_failed(parent, startup))
+    parent.update_worker.finished.connect(lambda: finish_update_check(parent))
+    parent.update_worker.start()
+
+def finish_update_check(parent):
+    parent.update_worker.deleteLater()
+    parent.update_worker = None
+
+def show_update_result(parent, latest_version, newer, startup):
+    """Offer the download if a newer release exists"""
+    import webbrowser
+
+    if newer:
+        title = "检查更新"
+        message = f"发现新版本 {latest_version}，是否前往下载？"
+        dialog = MessageBox(title, message, parent=parent)
+        if dialog.exec():
+            webbrowser.open("https://github.com/kowyo/hitsz-connect-verge/releases/latest/")
+    elif not startup:
+        MessageBox("检查更新", "当前已是最新版本。", parent=parent).exec()
+    else:
+        append_output(parent, "App is up to date.\n")
+
+def show_update_failed(parent, startup):
+    if not startup:
+        MessageBox("检查更新", "检查更新失败，请检查网络连接。", parent=parent).exec()
+    else:
+        append_output(parent, "Failed to check for updates. Please check your network connection.\n")
 
 def show_advanced_settings(window):
-    """Show advanced settings dialog with proper cleanup"""
-    dialog = AdvancedSettingsDialog(window)
+    """Show the advanced settings dialog, built on first use and reused afterwards"""
+    from .advanced_panel_fluent import AdvancedSettingsDialog
+    from .connection_utils import update_metrics_server
+    from .telemetry_utils import get_telemetry
+
+    dialog = getattr(window, 'advanced_dialog', None)
+    if dialog is None:
+        # set_settings refills it from the in-memory settings on every open
+        dialog = window.advanced_dialog = AdvancedSettingsDialog(window)
     dialog.set_settings(
         window.server_address,
         window.port,
@@ -92,8 +124,22 @@ def show_advanced_settings(window):
         window.keep_alive,
         window.debug_dump,
         window.http_bind,
-        window.socks_bind
+        window.socks_bind,
+        window.stop_timeout,
+        window.auto_reconnect,
+        window.health_check,
+        window.health_target,
+        window.prefetch,
+        window.detached_tunnel,
+        window.tunnels,
+        window.auto_port,
+        window.traffic_stats,
+        window.split_tunnel,
+        window.metrics_bind,
+        window.adaptive_keep_alive,
+        window.idle_timeout
     )
+    dialog.set_keep_alive_stats(get_telemetry().keepalive)
     
     if dialog.exec():
         settings = dialog.get_settings()
@@ -108,3 +154,17 @@ def show_advanced_settings(window):
         window.debug_dump = settings['debug_dump']
         window.http_bind = settings['http_bind']
         window.socks_bind = settings['socks_bind']
+        window.stop_timeout = settings['stop_timeout']
+        window.auto_reconnect = settings['auto_reconnect']
+        window.health_check = settings['health_check']
+        window.health_target = settings['health_target']
+        window.prefetch = settings['prefetch']
+        window.detached_tunnel = settings['detached_tunnel']
+        window.tunnels = settings['tunnels']
+        window.auto_port = settings['auto_port']
+        window.traffic_stats = settings['traffic_stats']
+        window.split_tunnel = settings['split_tunnel']
+        window.metrics_bind = settings['metrics_bind']
+        window.adaptive_keep_alive = settings['adaptive_keep_alive']
+        window.idle_timeout = settings['idle_timeout']
+        update_metrics_server(window)
@@ -0,0 +1,65 @@
+import time
+from array import array
+
+HISTORY_SECONDS = 300
+
+class RingBuffer:
+    """Fixed-size series of floats in a preallocated array; the oldest sample is overwritten"""
+
+    def __init__(self, size):
+        self.data = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.index = 0
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def latest(self):
+        return self.data[self.index - 1] if self.count else None
+
+    def values(self):
+        """Samples oldest first"""
+        if self.count < self.size:
+            return self.data[:self.count]
+        return self.data[self.index:] + self.data[:self.index]
+
+    def peak(self):
+        return max(self.values()) if self.count else None
+
+class TrafficSampler:
+    """Turn the relay's byte counters into per-second rates kept in ring buffers.
+
+    sample() is called periodically from the GUI; each call costs one pass over the
+    connections that are open at that moment and allocates nothing per connection.
+    """
+
+    def __init__(self, relay, size=HISTORY_SECONDS):
+        self.relay = relay
+        self.up_rate = RingBuffer(size)
+        self.down_rate = RingBuffer(size)
+        self.connections = RingBuffer(size)
+        self._last = None
+
+    def sample(self):
+        now = time.monotonic()
+        up, down, active = self.relay.traffic()
+        if self._last is not None:
+            last_time, last_up, last_down = self._last
+            elapsed = now - last_time
+            if elapsed > 0:
+                self.up_rate.append((up - last_up) / elapsed)
+                self.down_rate.append((down - last_down) / elapsed)
+                self.connections.append(active)
+        self._last = (now, up, down)
+
+def format_rate(rate):
+    """Format bytes per second for display"""
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if rate < 1024:
+            return f"{rate:.0f} {unit}" if unit == "B/s" else f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB/s"
@@ -0,0 +1,152 @@
+import re
+import threading
+from .reconnect_utils import AUTH_FAILURE_PATTERN, NETWORK_ERROR_PATTERN
+
+EVENT_LOGIN_STARTED = "login_started"
+EVENT_LOGIN_SUCCEEDED = "login_succeeded"
+EVENT_LOGIN_FAILED = "login_failed"
+EVENT_TUNNEL_READY = "tunnel_ready"
+EVENT_LISTENER_BOUND = "listener_bound"
+EVENT_KEEP_ALIVE = "keep_alive"
+EVENT_ERROR = "error"
+EVENT_CONNECTION_ERROR = "connection_error"
+
+STATE_CONNECTING = "connecting"
+STATE_AUTHENTICATING = "authenticating"
+STATE_READY = "ready"
+STATE_DEGRADED = "degraded"
+STATE_STOPPED = "stopped"
+
+# One alternation per event; the combined pattern finds the event in a single pass over the line
+EVENT_PATTERNS = (
+    (EVENT_LOGIN_FAILED, AUTH_FAILURE_PATTERN.pattern),
+    (EVENT_LOGIN_SUCCEEDED, r"login succe|logged in|login ok|auth(entication)? succe"),
+    (EVENT_LOGIN_STARTED, r"\blog(ging)? ?in(to)?\b|start(ing)? login"),
+    (EVENT_LISTENER_BOUND, r"(?P<listener>socks5?|http)\b[^\n]*?(listen|serv|start)[^\n]*?:(?P<port>\d+)"),
+    (EVENT_TUNNEL_READY, r"vpn client started|tunnel (is )?(ready|established)|client started"),
+    (EVENT_KEEP_ALIVE, r"keep[- ]?alive"),
+    (EVENT_ERROR, NETWORK_ERROR_PATTERN.pattern + r"|\berror\b|\bpanic\b"),
+)
+EVENT_KINDS = frozenset(kind for kind, _ in EVENT_PATTERNS)
+# Errors about a single proxied connection, such as a dial to an unreachable campus host; they say
+# nothing about the tunnel itself
+CONNECTION_ERROR_PATTERN = re.compile(r"\bdial (tcp|udp)\b|\b(tcp|udp) (connection|request)\b|\bproxy\b|\bsocks5?\b|\bhttp\b",
+                                      re.IGNORECASE)
+RECOVERY_QUIET = 30.0  # seconds without tunnel errors after which a degraded tunnel counts as ready again
+# Every event pattern contains one of these words; checking for them first is much
+# cheaper than the full pattern, and lets uneventful lines through almost for free
+TRIGGER_WORDS = ("log", "auth", "passw", "username", "invalid", "incorrect", "socks", "http", "started",
+                 "tunnel", "keep", "error", "panic", "eof", "timeout", "refused", "reset", "host",
+                 "unreachable", "broken", "tls")
+
+class OutputEvent:
+    __slots__ = ("kind", "line", "listener", "port")
+
+    def __init__(self, kind, line, listener=None, port=None):
+        self.kind = kind
+        self.line = line
+        self.listener = listener
+        self.port = port
+
+class OutputParser:
+    """Turn zju-connect output lines into OutputEvents as they arrive.
+
+    Lines are screened for trigger words before the full pattern runs once over
+    them; lines that mean nothing (the vast majority) produce no event objects.
+    """
+
+    def __init__(self):
+        self.pattern = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in EVENT_PATTERNS),
+                                  re.IGNORECASE)
+        self.trigger = re.compile("|".join(TRIGGER_WORDS))
+        self.error = re.compile(dict(EVENT_PATTERNS)[EVENT_ERROR], re.IGNORECASE)
+        self.events = 0
+
+    def feed(self, line):
+        """Return the event in line, or None"""
+        if self.trigger.search(line.lower()) is None:
+            return None
+        match = self.pattern.search(line)
+        if match is None:
+            return None
+        self.events += 1
+        kind = match.lastgroup
+        if kind not in EVENT_KINDS:
+            # lastgroup is an inner group; find which event it belongs to
+            kind = next(k for k, _ in EVENT_PATTERNS if match.group(k) is not None)
+        if kind == EVENT_LISTENER_BOUND:
+            return OutputEvent(kind, line, match.group("listener").lower(), int(match.group("port")))
+        if kind == EVENT_ERROR and CONNECTION_ERROR_PATTERN.search(line):
+            kind = EVENT_CONNECTION_ERROR
+        elif kind == EVENT_KEEP_ALIVE and self.error.search(line):
+            # A failed keep-alive is a tunnel error, not a sign of recovery
+            kind = EVENT_ERROR
+        return OutputEvent(kind, line)
+
+class ConnectionStateMachine:
+    """Connection state driven by output events: connecting, authenticating, ready, degraded, stopped.
+
+    Only tunnel-level errors degrade a ready tunnel, and it recovers once recovery_quiet seconds
+    pass without another one, since zju-connect may never log a keep-alive or login line again.
+    on_transition(old_state, new_state, event) is called on every change, from whichever
+    thread fed the event or from the recovery timer.
+    """
+
+    TRANSITIONS = {
+        STATE_CONNECTING: {EVENT_LOGIN_STARTED: STATE_AUTHENTICATING, EVENT_LOGIN_SUCCEEDED: STATE_AUTHENTICATING,
+                           EVENT_TUNNEL_READY: STATE_READY, EVENT_LISTENER_BOUND: STATE_READY,
+                           EVENT_LOGIN_FAILED: STATE_STOPPED},
+        STATE_AUTHENTICATING: {EVENT_TUNNEL_READY: STATE_READY, EVENT_LISTENER_BOUND: STATE_READY,
+                               EVENT_LOGIN_FAILED: STATE_STOPPED},
+        STATE_READY: {EVENT_ERROR: STATE_DEGRADED, EVENT_LOGIN_FAILED: STATE_STOPPED},
+        STATE_DEGRADED: {EVENT_KEEP_ALIVE: STATE_READY, EVENT_TUNNEL_READY: STATE_READY,
+                         EVENT_LOGIN_SUCCEEDED: STATE_READY, EVENT_LOGIN_FAILED: STATE_STOPPED},
+        STATE_STOPPED: {},
+    }
+
+    def __init__(self, on_transition=None, recovery_quiet=RECOVERY_QUIET):
+        self.state = STATE_CONNECTING
+        self.on_transition = on_transition
+        self.recovery_quiet = recovery_quiet
+        self._lock = threading.Lock()
+        self._recovery_timer = None
+
+    def handle(self, event):
+        """Apply an event; returns the new state if it changed, otherwise None"""
+        new_state = self._move(self.TRANSITIONS[self.state].get(event.kind), event)
+        if event.kind == EVENT_ERROR and self.state == STATE_DEGRADED:
+            self._arm_recovery()
+        return new_state
+
+    def _arm_recovery(self):
+        """(Re)start the countdown to ready; each further tunnel error pushes it back"""
+        if self._recovery_timer:
+            self._recovery_timer.cancel()
+        self._recovery_timer = threading.Timer(self.recovery_quiet, self._recover)
+        self._recovery_timer.daemon = True
+        self._recovery_timer.start()
+
+    def _recover(self):
+        if self.state == STATE_DEGRADED:
+            self._move(STATE_READY, None)
+
+    def degrade(self):
+        """Mark a ready tunnel as degraded, e.g. after failed health probes"""
+        if self.state == STATE_READY:
+            return self._move(STATE_DEGRADED, None)
+        return None
+
+    def stop(self):
+        if self._recovery_timer:
+            self._recovery_timer.cancel()
+        return self._move(STATE_STOPPED, None)
+
+    def _move(self, new_state, event):
+        with self._lock:
+            old_state = self.state
+            if new_state is None or new_state == old_state:
+                return None
+            self.state = new_state
+        if self.on_transition:
+            self.on_transition(old_state, new_state, event)
+        return new_state
@@ -0,0 +1,269 @@
+import os
+import json
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .common import get_app_data_dir
+
+RULES_FILE = "split_rules.txt"
+RELOAD_INTERVAL = 2.0  # seconds between checks of the rules file
+DEFAULT_RULES = """# Split tunneling rules: matching traffic goes through the VPN, everything else goes direct.
+# One rule per line:
+#   hitsz.edu.cn      a domain and all its subdomains
+#   10.0.0.0/8        an IPv4 network (an address without /len is a single host)
+#   !vpn.hitsz.edu.cn an exception that goes direct; the most specific rule wins
+# Changes are picked up automatically while connected.
+hitsz.edu.cn
+hit.edu.cn
+10.0.0.0/8
+!vpn.hitsz.edu.cn
+"""
+
+_MISSING = object()
+
+class DomainTrie:
+    """Suffix trie over domain labels, matched from the top-level domain down"""
+
+    def __init__(self):
+        self.root = {}
+        self.count = 0
+
+    def add(self, domain, value):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if "" not in node:
+            self.count += 1
+        node[""] = value  # "" is never a label, so it marks the end of a rule
+
+    def match(self, host):
+        """Return the value of the longest rule that host is or falls under, or None"""
+        node = self.root
+        found = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get("", found)
+        return found
+
+    def items(self, node=None, suffix=()):
+        """Yield (domain, value) for every rule"""
+        node = self.root if node is None else node
+        for label, child in node.items():
+            if label == "":
+                yield ".".join(reversed(suffix)), child
+            else:
+                yield from self.items(child, suffix + (label,))
+
+class NetworkTree:
+    """Binary radix tree over IPv4 address bits for longest-prefix matching"""
+
+    def __init__(self):
+        self.root = [None, None, _MISSING]
+        self.count = 0
+
+    def add(self, network, value):
+        node = self.root
+        address = int(network.network_address)
+        for bit in range(network.prefixlen):
+            branch = (address >> (31 - bit)) & 1
+            if node[branch] is None:
+                node[branch] = [None, None, _MISSING]
+            node = node[branch]
+        if node[2] is _MISSING:
+            self.count += 1
+        node[2] = value
+
+    def match(self, address):
+        """Return the value of the longest prefix containing address (an int), or None"""
+        node = self.root
+        found = None if node[2] is _MISSING else node[2]
+        for bit in range(32):
+            node = node[(address >> (31 - bit)) & 1]
+            if node is None:
+                break
+            if node[2] is not _MISSING:
+                found = node[2]
+        return found
+
+    def items(self, node=None, address=0, depth=0):
+        """Yield (network, value) for every rule"""
+        node = self.root if node is None else node
+        if node[2] is not _MISSING:
+            yield ipaddress.IPv4Network((address << (32 - depth) if depth else 0, depth)), node[2]
+        for branch in (0, 1):
+            if node[branch] is not None:
+                yield from self.items(node[branch], (address << 1) | branch, depth + 1)
+
+class RuleSet:
+    """Compiled split tunneling rules; route(host) says whether host goes through the VPN"""
+
+    def __init__(self, lines=()):
+        self.domains = DomainTrie()
+        self.networks = NetworkTree()
+        self.invalid = []
+        for line in lines:
+            self.add(line)
+
+    def add(self, line):
+        rule = line.split("#", 1)[0].strip().lower()
+        if not rule:
+            return
+        value = not rule.startswith("!")
+        rule = rule.lstrip("!").strip()
+        try:
+            self.networks.add(ipaddress.IPv4Network(rule, strict=False), value)
+        except ValueError:
+            if rule.replace("-", "").replace(".", "").isalnum():
+                self.domains.add(rule.strip("."), value)
+            else:
+                self.invalid.append(line.strip())
+
+    def route(self, host):
+        """True to use the VPN, False to go direct"""
+        host = host.lower().rstrip(".")
+        try:
+            return bool(self.networks.match(int(ipaddress.IPv4Address(host))))
+        except ValueError:
+            return bool(self.domains.match(host))
+
+    def to_pac(self, http_port=None, socks_port=None):
+        """Render the rules as a PAC script.
+
+        Domains become a map probed once per label suffix, networks one map per prefix
+        length probed longest first, so lookups in the browser stay independent of the
+        number of rules. Host names are not resolved, matching rules only apply to
+        addresses written literally.
+        """
+        proxies = []
+        if http_port:
+            proxies.append(f"PROXY 127.0.0.1:{http_port}")
+        if socks_port:
+            proxies.append(f"SOCKS5 127.0.0.1:{socks_port}; SOCKS 127.0.0.1:{socks_port}")
+        proxy = "; ".join(proxies) or "DIRECT"
+
+        domains = {domain: 1 if value else 0 for domain, value in self.domains.items()}
+        by_length = {}
+        for network, value in self.networks.items():
+            by_length.setdefault(network.prefixlen, {})[str(int(network.network_address) >> (32 - network.prefixlen))
+                                                       if network.prefixlen else "0"] = 1 if value else 0
+        networks = sorted(by_length.items(), reverse=True)
+        return PAC_TEMPLATE % {
+            "proxy": json.dumps(proxy),
+            "domains": json.dumps(domains),
+            "networks": json.dumps([[32 - length, table] for length, table in networks]),
+        }
+
+PAC_TEMPLATE = """var PROXY = %(proxy)s;
+var DOMAINS = %(domains)s;
+var NETWORKS = %(networks)s;
+
+function FindProxyForURL(url, host) {
+    host = host.toLowerCase();
+    var m = /^(\\d+)\\.(\\d+)\\.(\\d+)\\.(\\d+)$/.exec(host);
+    if (m) {
+        var address = ((+m[1]) * 16777216) + ((+m[2]) * 65536) + ((+m[3]) * 256) + (+m[4]);
+        for (var i = 0; i < NETWORKS.length; i++) {
+            var key = String(Math.floor(address / Math.pow(2, NETWORKS[i][0])));
+            if (NETWORKS[i][1].hasOwnProperty(key)) {
+                return NETWORKS[i][1][key] ? PROXY : "DIRECT";
+            }
+        }
+        return "DIRECT";
+    }
+    var labels = host.split(".");
+    for (var j = 0; j < labels.length; j++) {
+        var suffix = labels.slice(j).join(".");
+        if (DOMAINS.hasOwnProperty(suffix)) {
+            return DOMAINS[suffix] ? PROXY : "DIRECT";
+        }
+    }
+    return "DIRECT";
+}
+"""
+
+def get_rules_path():
+    """Path of the user's rules file, created with the default rules on first use"""
+    path = os.path.join(get_app_data_dir(), RULES_FILE)
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(DEFAULT_RULES)
+    return path
+
+class PacServer:
+    """Serve the PAC script for the current rules on a local port and reload it when the rules file changes.
+
+    The URL carries a version that changes on every reload, so re-registering it makes
+    the system fetch the new script instead of a cached one.
+    """
+
+    def __init__(self, rules_path, http_port=None, socks_port=None, on_reload=None):
+        self.rules_path = rules_path
+        self.http_port = http_port
+        self.socks_port = socks_port
+        self.on_reload = on_reload
+        self.rules = None
+        self.version = 0
+        self.pac = b""
+        self._mtime = None
+        self._server = None
+        self._stop_event = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/proxy.pac?v={self.version}"
+
+    def start(self):
+        self.reload()
+        pac_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = pac_server.pac
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ns-proxy-autoconfig")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reload(self):
+        """Recompile the rules file; returns True if the PAC script changed"""
+        try:
+            self._mtime = os.path.getmtime(self.rules_path)
+            with open(self.rules_path, "r", encoding="utf-8") as f:
+                rules = RuleSet(f)
+        except OSError:
+            return False
+        pac = rules.to_pac(self.http_port, self.socks_port).encode()
+        if pac == self.pac:
+            return False
+        self.rules = rules
+        self.pac = pac
+        self.version += 1
+        return True
+
+    def _watch(self):
+        while not self._stop_event.wait(RELOAD_INTERVAL):
+            try:
+                mtime = os.path.getmtime(self.rules_path)
+            except OSError:
+                continue
+            if mtime != self._mtime and self.reload() and self.on_reload and not self._stop_event.is_set():
+                self.on_reload(self)
@@ -0,0 +1,67 @@
+import socket
+from platform import system
+
+PORT_NAMES = {"http": "HTTP", "socks": "SOCKS5"}
+
+class PortConflictError(Exception):
+    """A configured proxy port is taken and no alternative may be chosen"""
+
+class InvalidPortError(PortConflictError):
+    """A configured proxy port is outside 1-65535, so nothing could listen on it"""
+
+def is_valid_port(port):
+    return 1 <= port <= 65535
+
+def is_port_free(port, host="127.0.0.1"):
+    """Check whether a TCP listener could bind host:port right now"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if system() != "Windows":
+            # Match how zju-connect listens, so a port in TIME_WAIT still counts as free
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        return True
+    except (OSError, OverflowError):
+        return False
+    finally:
+        sock.close()
+
+def find_free_ports(count, host="127.0.0.1"):
+    """Ask the OS for count distinct free TCP ports on host"""
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind((host, 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def preflight_ports(ports, auto_allocate=True, host="127.0.0.1"):
+    """Check the configured proxy ports before zju-connect is started.
+
+    ports maps "http"/"socks" to a configured port or None. Returns the ports to use
+    and a list of messages describing any substitutions. Busy ports are replaced by
+    free ones when auto_allocate is set, otherwise PortConflictError is raised.
+    Ports outside 1-65535 raise InvalidPortError either way.
+    """
+    chosen = {}
+    messages = []
+    invalid = [kind for kind, port in ports.items() if port is not None and not is_valid_port(port)]
+    if invalid:
+        raise InvalidPortError("out of range 1-65535: "
+                               + ", ".join(f"{PORT_NAMES[kind]} port {ports[kind]}" for kind in invalid))
+    busy = [kind for kind, port in ports.items() if port and not is_port_free(port, host)]
+    if busy and not auto_allocate:
+        raise PortConflictError("in use by another program: "
+                                + ", ".join(f"{PORT_NAMES[kind]} port {ports[kind]}" for kind in busy))
+    replacements = find_free_ports(len(busy), host)
+    for kind, port in ports.items():
+        if kind in busy:
+            chosen[kind] = replacements.pop()
+            messages.append(f"{PORT_NAMES[kind]} port {port} is in use, using {chosen[kind]} instead")
+        else:
+            chosen[kind] = port
+    return chosen, messages
@@ -0,0 +1,60 @@
+import threading
+import time
+from .endpoint_utils import race_endpoints
+
+DEFAULT_TTL = 300.0  # seconds a race result is trusted for
+PREFETCH_INTERVAL = 60.0
+
+class Prefetcher:
+    """Race the server endpoints in the background so connecting can skip the race.
+
+    get_endpoints returns the current endpoint list; is_idle returns False while connected
+    or when prefetching is turned off, in which case a round is skipped. With a single
+    endpoint there is no race to skip, so nothing is prefetched.
+    """
+
+    def __init__(self, get_endpoints, is_idle, interval=PREFETCH_INTERVAL, ttl=DEFAULT_TTL):
+        self.get_endpoints = get_endpoints
+        self.is_idle = is_idle
+        self.interval = interval
+        self.ttl = ttl
+        self.best_endpoint = None
+        self.best_checked_at = 0.0
+        self._stop_event = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if self.is_idle():
+                try:
+                    self.refresh()
+                except (OSError, ValueError):
+                    pass
+            self._stop_event.wait(self.interval)
+
+    def refresh(self):
+        """Race the endpoints and remember the best reachable one"""
+        endpoints = self.get_endpoints()
+        if len(endpoints) < 2:
+            return
+        endpoint, _ = race_endpoints(endpoints)
+        if endpoint:
+            self.best_endpoint = endpoint
+            self.best_checked_at = time.monotonic()
+
+    def take(self, endpoints):
+        """Return (endpoint, seconds since it was checked) for a fresh prefetch of endpoints, or None.
+
+        zju-connect resolves the host and makes its own TLS handshake, so what connecting
+        skips is the endpoint race; benchmarks/bench_prefetch.py measures the difference.
+        """
+        endpoint = self.best_endpoint
+        age = time.monotonic() - self.best_checked_at
+        if len(endpoints) < 2 or endpoint not in endpoints or age > self.ttl:
+            return None
+        return endpoint, age
@@ -0,0 +1,274 @@
+import os
+import json
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from platform import system
+from .common import get_app_data_dir
+
+SNAPSHOT_FILE = "proxy_snapshot.json"
+
+def diff_state(current, desired):
+    """Return the entries of desired whose value differs from current"""
+    return {key: value for key, value in desired.items() if current.get(key) != value}
+
+def run_parallel(commands):
+    """Run a list of command sequences in parallel, each sequence in order"""
+    def run_sequence(sequence):
+        for command in sequence:
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if not commands:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(commands), 8)) as executor:
+        list(executor.map(run_sequence, commands))
+
+class ProxyBackend(ABC):
+    """Read the system proxy state once, apply only what differs and restore the previous state on disable"""
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path
+        self.snapshot = self._load_snapshot()
+
+    @abstractmethod
+    def read_state(self):
+        """Return the current proxy settings as a dict of setting key to value"""
+
+    @abstractmethod
+    def desired_state(self, current, http_host, http_port, socks_host=None, socks_port=None):
+        """Return the settings that point the system proxy at the tunnel"""
+
+    @abstractmethod
+    def pac_state(self, current, pac_url):
+        """Return the settings that make the system use the PAC script at pac_url"""
+
+    @abstractmethod
+    def disabled_state(self, current):
+        """Return the settings that turn the proxy off, used when there is no snapshot"""
+
+    @abstractmethod
+    def apply_state(self, changes, current):
+        """Write the changed settings in as few commands as possible"""
+
+    def enable(self, http_host=None, http_port=None, socks_host=None, socks_port=None, pac_url=None):
+        """Point the system proxy at the tunnel, or at a PAC script if pac_url is given, remembering what was there before"""
+        current = self.read_state()
+        if self.snapshot is None:
+            self.snapshot = current
+            self._save_snapshot()
+        if pac_url:
+            desired = self.pac_state(current, pac_url)
+        else:
+            desired = self.desired_state(current, http_host, http_port, socks_host, socks_port)
+        changes = diff_state(current, desired)
+        self.apply_state(changes, current)
+        return changes
+
+    def disable(self):
+        """Restore the state captured by enable, or turn the proxy off if there is none"""
+        current = self.read_state()
+        desired = self.snapshot if self.snapshot is not None else self.disabled_state(current)
+        changes = diff_state(current, desired)
+        self.apply_state(changes, current)
+        self.snapshot = None
+        self._save_snapshot()
+        return changes
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                return {tuple(key): value for key, value in json.load(f)}
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save_snapshot(self):
+        """Persist the snapshot so a crash while connected can still be undone on next launch"""
+        if not self.snapshot_path:
+            return
+        try:
+            if self.snapshot is None:
+                if os.path.exists(self.snapshot_path):
+                    os.remove(self.snapshot_path)
+            else:
+                with open(self.snapshot_path, "w", encoding="utf-8") as f:
+                    json.dump([[list(key), value] for key, value in self.snapshot.items()], f)
+        except OSError:
+            pass
+
+class GnomeProxyBackend(ProxyBackend):
+    """Proxy backend for GNOME using gsettings"""
+    SCHEMA = "org.gnome.system.proxy"
+
+    def __init__(self, snapshot_path=None, gsettings="gsettings"):
+        self.gsettings = gsettings
+        super().__init__(snapshot_path)
+
+    def read_state(self):
+        """Read every proxy key with a single gsettings call, values in GVariant text form"""
+        result = subprocess.run([self.gsettings, "list-recursively", self.SCHEMA],
+                                capture_output=True, text=True)
+        state = {}
+        for line in result.stdout.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3:
+                state[(parts[0], parts[1])] = parts[2]
+        return state
+
+    def desired_state(self, current, http_host, http_port, socks_host=None, socks_port=None):
+        desired = {(self.SCHEMA, "mode"): "'manual'"}
+        for protocol in ["http", "https"]:
+            desired[(f"{self.SCHEMA}.{protocol}", "host")] = f"'{http_host}'"
+            desired[(f"{self.SCHEMA}.{protocol}", "port")] = str(http_port)
+        if socks_host and socks_port:
+            desired[(f"{self.SCHEMA}.socks", "host")] = f"'{socks_host}'"
+            desired[(f"{self.SCHEMA}.socks", "port")] = str(socks_port)
+        return desired
+
+    def pac_state(self, current, pac_url):
+        return {(self.SCHEMA, "mode"): "'auto'", (self.SCHEMA, "autoconfig-url"): f"'{pac_url}'"}
+
+    def disabled_state(self, current):
+        return {(self.SCHEMA, "mode"): "'none'"}
+
+    def apply_state(self, changes, current):
+        run_parallel([[[self.gsettings, "set", schema, key, value]] for (schema, key), value in changes.items()])
+
+class MacProxyBackend(ProxyBackend):
+    """Proxy backend for macOS using networksetup"""
+    KINDS = {
+        "web": ("-getwebproxy", "-setwebproxy", "-setwebproxystate"),
+        "secureweb": ("-getsecurewebproxy", "-setsecurewebproxy", "-setsecurewebproxystate"),
+        "socksfirewall": ("-getsocksfirewallproxy", "-setsocksfirewallproxy", "-setsocksfirewallproxystate"),
+        "autoproxy": ("-getautoproxyurl", "-setautoproxyurl", "-setautoproxystate"),
+    }
+
+    def __init__(self, snapshot_path=None, networksetup="networksetup"):
+        self.networksetup = networksetup
+        super().__init__(snapshot_path)
+
+    def list_services(self):
+        output = subprocess.check_output([self.networksetup, '-listallnetworkservices']).decode().split('\n')[1:]
+        return [s for s in output if s and not s.startswith('*')]
+
+    def _read_proxy(self, service, kind):
+        result = subprocess.run([self.networksetup, self.KINDS[kind][0], service], capture_output=True, text=True)
+        fields = dict(line.split(": ", 1) for line in result.stdout.splitlines() if ": " in line)
+        if kind == "autoproxy":
+            url = fields.get("URL", "")
+            return [fields.get("Enabled") == "Yes", "" if url == "(null)" else url, ""]
+        return [fields.get("Enabled") == "Yes", fields.get("Server", ""), fields.get("Port", "0")]
+
+    def read_state(self):
+        """Read every service's proxies in parallel"""
+        keys = [(service, kind) for service in self.list_services() for kind in self.KINDS]
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(keys), 8)) as executor:
+            values = executor.map(lambda key: self._read_proxy(*key), keys)
+            return dict(zip(keys, values))
+
+    def desired_state(self, current, http_host, http_port, socks_host=None, socks_port=None):
+        desired = {}
+        for service in {service for service, _ in current}:
+            desired[(service, "web")] = [True, http_host, str(http_port)]
+            desired[(service, "secureweb")] = [True, http_host, str(http_port)]
+            if socks_host and socks_port:
+                desired[(service, "socksfirewall")] = [True, socks_host, str(socks_port)]
+            if (service, "autoproxy") in current:
+                desired[(service, "autoproxy")] = [False] + current[(service, "autoproxy")][1:]
+        return desired
+
+    def pac_state(self, current, pac_url):
+        # Manual proxies win over the PAC script, so they are turned off while it is in use
+        desired = {key: [False, server, port] for key, (_, server, port) in current.items()}
+        for service in {service for service, _ in current}:
+            desired[(service, "autoproxy")] = [True, pac_url, ""]
+        return desired
+
+    def disabled_state(self, current):
+        return {key: [False, server, port] for key, (_, server, port) in current.items()}
+
+    def apply_state(self, changes, current):
+        commands = []
+        for (service, kind), (enabled, server, port) in changes.items():
+            _, set_flag, state_flag = self.KINDS[kind]
+            sequence = []
+            if server and [server, port] != current.get((service, kind), [False, "", "0"])[1:]:
+                # Setting the server also turns the proxy on; the auto proxy URL has no port
+                sequence.append([self.networksetup, set_flag, service, server] + ([port] if port else []))
+                if not enabled:
+                    sequence.append([self.networksetup, state_flag, service, "off"])
+            else:
+                sequence.append([self.networksetup, state_flag, service, "on" if enabled else "off"])
+            commands.append(sequence)
+        run_parallel(commands)
+
+class WindowsProxyBackend(ProxyBackend):
+    """Proxy backend for Windows using the Internet Settings registry key"""
+    KEY_PATH = r'Software\Microsoft\Windows\CurrentVersion\Internet Settings'
+
+    def read_state(self):
+        import winreg as reg
+
+        state = {}
+        with reg.OpenKey(reg.HKEY_CURRENT_USER, self.KEY_PATH, 0, reg.KEY_READ) as internet_settings:
+            for name in ("ProxyEnable", "ProxyServer"):
+                try:
+                    state[("", name)] = reg.QueryValueEx(internet_settings, name)[0]
+                except FileNotFoundError:
+                    pass
+            # Always present so that restoring a snapshot without a PAC script removes ours
+            try:
+                state[("", "AutoConfigURL")] = reg.QueryValueEx(internet_settings, "AutoConfigURL")[0]
+            except FileNotFoundError:
+                state[("", "AutoConfigURL")] = ""
+        return state
+
+    def desired_state(self, current, http_host, http_port, socks_host=None, socks_port=None):
+        return {("", "ProxyEnable"): 1, ("", "ProxyServer"): f"{http_host}:{http_port}", ("", "AutoConfigURL"): ""}
+
+    def pac_state(self, current, pac_url):
+        return {("", "ProxyEnable"): 0, ("", "AutoConfigURL"): pac_url}
+
+    def disabled_state(self, current):
+        return {("", "ProxyEnable"): 0}
+
+    def apply_state(self, changes, current):
+        if not changes:
+            return
+
+        import winreg as reg
+        import ctypes
+
+        with reg.OpenKey(reg.HKEY_CURRENT_USER, self.KEY_PATH, 0, reg.KEY_ALL_ACCESS) as internet_settings:
+            for (_, name), value in changes.items():
+                if name == "AutoConfigURL" and not value:
+                    try:
+                        reg.DeleteValue(internet_settings, name)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                value_type = reg.REG_DWORD if name == "ProxyEnable" else reg.REG_SZ
+                reg.SetValueEx(internet_settings, name, 0, value_type, value)
+
+        # Refresh system proxy settings
+        ctypes.windll.Wininet.InternetSetOptionW(0, 37, 0, 0)
+        ctypes.windll.Wininet.InternetSetOptionW(0, 39, 0, 0)
+
+_backend = None
+
+def get_proxy_backend():
+    """Get the proxy backend for the current platform, or None if unsupported"""
+    global _backend
+    if _backend is None:
+        backends = {
+            "Windows": WindowsProxyBackend,
+            "Darwin": MacProxyBackend,
+            "Linux": GnomeProxyBackend,
+        }
+        backend_class = backends.get(system())
+        if backend_class:
+            _backend = backend_class(snapshot_path=os.path.join(get_app_data_dir(), SNAPSHOT_FILE))
+    return _backend
@@ -0,0 +1,82 @@
+import re
+import time
+import random
+from collections import deque
+
+EXIT_STOPPED = "stopped"
+EXIT_AUTH_FAILURE = "auth"
+EXIT_NETWORK_ERROR = "network"
+EXIT_CRASH = "crash"
+EXIT_HANG = "hang"
+EXIT_DETACHED = "detached"
+
+RETRYABLE_EXITS = (EXIT_NETWORK_ERROR, EXIT_CRASH, EXIT_HANG)
+
+AUTH_FAILURE_PATTERN = re.compile(
+    r"login failed|invalid (username|password)|wrong password|auth(entication)? failed|"
+    r"incorrect (username|password)|too many login",
+    re.IGNORECASE)
+NETWORK_ERROR_PATTERN = re.compile(
+    r"i/o timeout|connection refused|connection reset|no such host|network is unreachable|"
+    r"no route to host|broken pipe|tls handshake|unexpected eof|\beof\b",
+    re.IGNORECASE)
+
+def classify_exit(returncode, lines):
+    """Classify why zju-connect exited from its return code and its last output lines"""
+    if returncode is None:
+        return None
+    for line in reversed(lines):
+        if AUTH_FAILURE_PATTERN.search(line):
+            return EXIT_AUTH_FAILURE
+    for line in reversed(lines):
+        if NETWORK_ERROR_PATTERN.search(line):
+            return EXIT_NETWORK_ERROR
+    return EXIT_CRASH
+
+class ReconnectSupervisor:
+    """Decide when to restart zju-connect after an unexpected exit, with capped exponential backoff and jitter"""
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, max_attempts=0, stable_after=30.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts  # 0 means retry forever
+        self.stable_after = stable_after
+        self.attempt = 0
+        self.restart_count = 0
+        self.recovery_times = deque(maxlen=100)
+        self.down_since = None
+        self.started_at = None
+
+    def reset(self):
+        """Forget the current outage, e.g. when the user connects or disconnects manually"""
+        self.attempt = 0
+        self.down_since = None
+
+    def record_started(self):
+        """Record that zju-connect has been (re)started; returns the time it took to recover, if any"""
+        now = time.monotonic()
+        self.started_at = now
+        if self.down_since is None:
+            return None
+        recovery_time = now - self.down_since
+        self.recovery_times.append(recovery_time)
+        self.down_since = None
+        return recovery_time
+
+    def next_delay(self, exit_reason):
+        """Return the delay before the next restart, or None if zju-connect should stay down"""
+        if exit_reason not in RETRYABLE_EXITS:
+            return None
+
+        now = time.monotonic()
+        if self.started_at is not None and now - self.started_at >= self.stable_after:
+            self.attempt = 0
+        if self.max_attempts and self.attempt >= self.max_attempts:
+            return None
+
+        if self.down_since is None:
+            self.down_since = now
+        delay = min(self.max_delay, self.base_delay * (2 ** self.attempt))
+        self.attempt += 1
+        self.restart_count += 1
+        return random.uniform(delay / 2, delay)
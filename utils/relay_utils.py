@@ -0,0 +1,177 @@
+import socket
+import threading
+import time
+from platform import system
+
+CONNECT_TIMEOUT = 2.0
+FAILURE_COOLDOWN = 10.0  # seconds a tunnel is skipped after a failed connect
+LATENCY_WEIGHT = 0.3
+BUFFER_SIZE = 64 * 1024
+
+class RelayBackend:
+    """One tunnel behind the relay: its local ports and connection accounting"""
+
+    def __init__(self, index, ports):
+        self.index = index
+        self.ports = ports  # {"socks": port, "http": port}
+        self.alive = True
+        self.active = 0
+        self.total = 0
+        self.failures = 0
+        self.latency = None
+        self.down_until = 0.0
+
+    def healthy(self, now):
+        return self.alive and self.down_until <= now
+
+class Relay:
+    """Local SOCKS5/HTTP listener that forwards each new connection to one of several tunnels.
+
+    The relay works at the TCP level: zju-connect behind it still speaks the proxy
+    protocol, so a connection is simply handed to the tunnel with the fewest active
+    connections, ties going to the one that accepted connections fastest. A tunnel
+    that refuses a connection is skipped for FAILURE_COOLDOWN seconds.
+    """
+
+    def __init__(self, listen_ports, backends, host="127.0.0.1"):
+        self.listen_ports = listen_ports  # {"socks": port, "http": port}
+        self.backends = backends
+        self.host = host
+        self._servers = []
+        self._lock = threading.Lock()
+        # [bytes up, bytes down] per open connection, keyed by id; each counter has a single
+        # writer (its pipe thread), so updating it needs no lock
+        self._flows = {}
+        self._closed_up = 0
+        self._closed_down = 0
+
+    def start(self):
+        for kind, port in self.listen_ports.items():
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if system() == "Windows":
+                # SO_REUSEADDR would let Windows bind a port another process is listening on
+                server.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+            else:
+                server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, port))
+            server.listen(128)
+            self._servers.append(server)
+            threading.Thread(target=self._accept, args=(server, kind), daemon=True).start()
+
+    def close(self):
+        for server in self._servers:
+            try:
+                server.close()
+            except OSError:
+                pass
+        self._servers = []
+
+    def set_alive(self, index, alive):
+        with self._lock:
+            self.backends[index].alive = alive
+
+    def pick(self, exclude=()):
+        """Choose the healthy tunnel with the fewest active connections, or None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy(now) and b.index not in exclude]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: (b.active, b.latency or 0.0))
+            backend.active += 1
+            return backend
+
+    def snapshot(self):
+        """Per-tunnel state for display"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "index": b.index,
+                "healthy": b.healthy(now),
+                "alive": b.alive,
+                "active": b.active,
+                "total": b.total,
+                "failures": b.failures,
+                "latency": b.latency,
+            } for b in self.backends]
+
+    def traffic(self):
+        """Total bytes relayed up and down so far, and the number of open connections"""
+        with self._lock:
+            flows = list(self._flows.values())
+            up, down = self._closed_up, self._closed_down
+        for flow in flows:
+            up += flow[0]
+            down += flow[1]
+        return up, down, len(flows)
+
+    def _accept(self, server, kind):
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(client, kind), daemon=True).start()
+
+    def _connect(self, kind):
+        """Connect to a tunnel, falling through to the next one on failure"""
+        tried = set()
+        while True:
+            backend = self.pick(tried)
+            if backend is None:
+                return None, None
+            tried.add(backend.index)
+            start = time.perf_counter()
+            try:
+                upstream = socket.create_connection((self.host, backend.ports[kind]), timeout=CONNECT_TIMEOUT)
+            except OSError:
+                with self._lock:
+                    backend.active -= 1
+                    backend.failures += 1
+                    backend.down_until = time.monotonic() + FAILURE_COOLDOWN
+                continue
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                backend.total += 1
+                backend.latency = elapsed if backend.latency is None else \
+                    backend.latency + LATENCY_WEIGHT * (elapsed - backend.latency)
+            upstream.settimeout(None)
+            return backend, upstream
+
+    def _handle(self, client, kind):
+        backend, upstream = self._connect(kind)
+        if backend is None:
+            client.close()
+            return
+        flow = [0, 0]
+        with self._lock:
+            self._flows[id(flow)] = flow
+        try:
+            forward = threading.Thread(target=self._pipe, args=(client, upstream, flow, 0), daemon=True)
+            forward.start()
+            self._pipe(upstream, client, flow, 1)
+            forward.join()
+        finally:
+            client.close()
+            upstream.close()
+            with self._lock:
+                backend.active -= 1
+                del self._flows[id(flow)]
+                self._closed_up += flow[0]
+                self._closed_down += flow[1]
+
+    def _pipe(self, source, destination, flow, direction):
+        """Copy one direction of a connection until it is closed, counting the bytes"""
+        try:
+            while True:
+                data = source.recv(BUFFER_SIZE)
+                if not data:
+                    break
+                destination.sendall(data)
+                flow[direction] += len(data)
+        except OSError:
+            pass
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
@@ -1,15 +1,39 @@
+import json
+import socket
 import subprocess
+import threading
+import queue
+import time
+from collections import deque
 from platform import system
 
-from PySide6.QtCore import QThread, Signal
+from PySide6.QtCore import QObject, QThread, QTimer, Signal
+from .log_utils import get_session_log
+from .proxy_backend import get_proxy_backend
+from .reconnect_utils import classify_exit, EXIT_STOPPED, EXIT_DETACHED, EXIT_AUTH_FAILURE, RETRYABLE_EXITS
+from .health_utils import HealthMonitor
+from .endpoint_utils import race_endpoints, apply_endpoint
+from .tunnel_daemon import launch_daemon, wait_for_daemon, send_request
+from .relay_utils import Relay, RelayBackend
+from .port_utils import find_free_ports
+from .command_utils import apply_binds
+from .output_utils import (OutputParser, ConnectionStateMachine, STATE_CONNECTING, STATE_AUTHENTICATING, STATE_READY,
+                           STATE_STOPPED, EVENT_LOGIN_FAILED)
+from .pac_utils import PacServer, get_rules_path
+from .trace_utils import span, get_tracer
+from .telemetry_utils import get_telemetry
 if system() == "Windows":
     from subprocess import CREATE_NO_WINDOW
 
 def get_proxy_settings(window):
-    """Get proxy settings from window HTTP and SOCKS binds"""
+    """Get proxy settings from window HTTP and SOCKS binds, preferring the ports chosen at connect time"""
     http_host, http_port = "127.0.0.1", None
     socks_host, socks_port = "127.0.0.1", None
     
+    bound_ports = getattr(window, 'bound_ports', None)
+    if bound_ports:
+        return http_host, bound_ports.get("http"), socks_host, bound_ports.get("socks")
+
     if hasattr(window, 'http_bind') and window.http_bind:
         try:
             http_port = int(window.http_bind)
@@ -24,16 +48,52 @@ def get_proxy_settings(window):
                 
     return http_host, http_port, socks_host, socks_port
 
+# Output is coalesced into batches so the GUI appends once per flush instead of once per line
+LOG_FLUSH_INTERVAL = 0.1  # seconds
+LOG_FLUSH_LINES = 200
+LOG_MAX_LINES_PER_SECOND = 2000
+
+DEFAULT_STOP_TIMEOUT = 5.0  # seconds before a graceful stop escalates to kill
+
 class CommandWorker(QThread):
     output = Signal(str)
     finished = Signal()
+    stop_progress = Signal(str)
+    state_changed = Signal(str)
 
-    def __init__(self, command_args, proxy_enabled, window=None):
+    def __init__(self, command_args, proxy_enabled, window=None, keep_proxy_on_failure=False, endpoints=None,
+                 prefetcher=None, split_tunnel=False):
         super().__init__()
         self.command_args = command_args
+        self.split_tunnel = split_tunnel
+        self.pac_server = None
+        self.prefetcher = prefetcher
+        self.endpoints = endpoints or []
+        self.endpoint = self.endpoints[0] if self.endpoints else None
         self.proxy_enabled = proxy_enabled
         self.window = window
+        self.keep_proxy_on_failure = keep_proxy_on_failure
         self.process = None
+        self.exit_reason = None
+        self.recent_lines = deque(maxlen=50)
+        self.dropped_lines = 0
+        self._lines = queue.SimpleQueue()
+        self._window_start = 0.0
+        self._window_lines = 0
+        self._suppressed = 0
+        self._session_log = get_session_log()
+        self.parser = OutputParser()
+        self.state_machine = ConnectionStateMachine(self._on_transition)
+        self.stop_latency = None
+        self._telemetry = get_telemetry()
+        self._run_started = 0.0
+        self._state_since = 0
+        self._stop_requested = False
+        self._stop_reason = EXIT_STOPPED
+        self._stop_started = 0.0
+        self._kill_timer = QTimer(self)
+        self._kill_timer.setSingleShot(True)
+        self._kill_timer.timeout.connect(self._kill_if_alive)
         self._proxy_handlers = {
             "Windows": set_windows_proxy,
             "Darwin": set_macos_proxy,
@@ -41,90 +101,490 @@ class CommandWorker(QThread):
         }
 
     def run(self):
+        self._state_since = time.perf_counter_ns()
+        self._run_started = time.monotonic()
+        self._telemetry.processes = self._process_ids
         try:
+            with span("select_server"):
+                self._select_server()
+
             # Set proxy if enabled
-            if self.proxy_enabled and self.window:
+            if self.proxy_enabled and self.window and self.split_tunnel:
+                self._start_pac_server()
+            elif self.proxy_enabled and self.window:
                 proxy_handler = self._proxy_handlers.get(system())
                 if proxy_handler:
                     proxy_handler(True, *get_proxy_settings(self.window))
 
-            # Run process
-            creation_flags = CREATE_NO_WINDOW if system() == "Windows" else 0
-            self.process = subprocess.Popen(
-                self.command_args,
+            if self._stop_requested:
+                return
+
+            with span("launch"):
+                self._launch()
+            self._pump_output()
+            returncode = self._wait_for_exit()
+            if self._stop_requested:
+                self.exit_reason = self._stop_reason
+            else:
+                self.exit_reason = classify_exit(returncode, self.recent_lines)
+        finally:
+            with span("cleanup"):
+                self._cleanup()
+                if self.pac_server:
+                    self.pac_server.stop()
+            # Disable proxy on completion, unless a restart is expected to take over
+            keep_proxy = self.keep_proxy_on_failure and self.exit_reason in RETRYABLE_EXITS
+            if self.proxy_enabled and not keep_proxy:
+                proxy_handler = self._proxy_handlers.get(system())
+                if proxy_handler:
+                    proxy_handler(False)
+            if self._stop_requested:
+                self.stop_latency = time.monotonic() - self._stop_started
+                self.stop_progress.emit(f"zju-connect stopped in {self.stop_latency:.2f}s")
+                end = time.perf_counter_ns()
+                get_tracer().record("stop", end - int(self.stop_latency * 1e9), end, {"reason": self._stop_reason})
+                self._telemetry.stop_latency.observe(self.stop_latency)
+            if self._telemetry.processes == self._process_ids:
+                self._telemetry.processes = None
+            self.state_machine.stop()
+            self.finished.emit()
+
+    def _start_pac_server(self):
+        """Serve the split tunneling rules as a PAC script and register it as the system auto-config URL"""
+        _, http_port, _, socks_port = get_proxy_settings(self.window)
+        self.pac_server = PacServer(get_rules_path(), http_port, socks_port, on_reload=self._reload_pac)
+        try:
+            self.pac_server.start()
+        except OSError as e:
+            self.output.emit(f"Could not serve the split tunneling rules: {e}")
+            self.pac_server = None
+            return
+        rules = self.pac_server.rules
+        if rules is not None:
+            self.output.emit(f"Split tunneling: {rules.domains.count} domain rules, "
+                             f"{rules.networks.count} network rules")
+            for line in rules.invalid:
+                self.output.emit(f"Ignored invalid split tunneling rule: {line}")
+        apply_system_proxy(True, pac_url=self.pac_server.url)
+
+    def _reload_pac(self, pac_server):
+        """Re-register the PAC URL after the rules file changed; the tunnel keeps running"""
+        if self._stop_requested:
+            return
+        self.output.emit(f"Split tunneling rules reloaded: {pac_server.rules.domains.count} domain rules, "
+                         f"{pac_server.rules.networks.count} network rules")
+        apply_system_proxy(True, pac_url=pac_server.url)
+
+    def _launch(self):
+        """Start zju-connect and the thread that reads its output"""
+        self.process = self._popen(self.command_args)
+        if self._stop_requested:
+            self.process.terminate()
+
+        reader = threading.Thread(target=self._read_output, daemon=True)
+        reader.start()
+
+    def _popen(self, command_args):
+        creation_flags = CREATE_NO_WINDOW if system() == "Windows" else 0
+        with span("popen"):
+            return subprocess.Popen(
+                command_args,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 universal_newlines=True,
                 encoding="utf-8",
+                errors="replace",
                 creationflags=creation_flags
             )
-            
+
+    def _processes(self):
+        return [self.process] if self.process else []
+
+    def _process_ids(self):
+        return [process.pid for process in self._processes()]
+
+    def _wait_for_exit(self):
+        """Wait for zju-connect to exit and return its exit code"""
+        return self.process.wait()
+
+    def _cleanup(self):
+        """Release anything the worker started besides zju-connect"""
+
+    def _select_server(self):
+        """Pick the server endpoint, from the prefetcher if it has a fresh answer or by racing"""
+        prefetched = self.prefetcher.take(self.endpoints) if self.prefetcher else None
+        if prefetched:
+            self._use_prefetched(*prefetched)
+        elif len(self.endpoints) > 1:
+            self._select_endpoint()
+
+    def _select_endpoint(self):
+        """Race the configured server endpoints and point zju-connect at the fastest"""
+        endpoint, latency = race_endpoints(self.endpoints)
+        if endpoint is None:
+            self.output.emit(f"No server endpoint answered, trying {self.endpoint[0]}:{self.endpoint[1]}")
+            return
+        self.endpoint = endpoint
+        self.command_args = apply_endpoint(self.command_args, *endpoint)
+        self.output.emit(f"Using server endpoint {endpoint[0]}:{endpoint[1]} ({latency * 1000:.0f} ms)")
+
+    def _use_prefetched(self, endpoint, age):
+        """Point zju-connect at the endpoint that won a background race instead of racing again.
+
+        The host name is passed on unchanged so the TLS server name and Host header stay the same.
+        """
+        self.endpoint = endpoint
+        self.command_args = apply_endpoint(self.command_args, *endpoint)
+        self.output.emit(f"Using prefetched server endpoint {endpoint[0]}:{endpoint[1]} "
+                         f"(checked {age:.0f}s ago)")
+
+    def _read_output(self):
+        """Read process output line by line on a helper thread"""
+        try:
             for line in self.process.stdout:
-                self.output.emit(line)
-            self.process.wait()
+                self._lines.put(line)
         finally:
-            # Disable proxy on completion
-            if self.proxy_enabled:
-                proxy_handler = self._proxy_handlers.get(system())
-                if proxy_handler:
-                    proxy_handler(False)
+            # _pump_output waits for this sentinel, so it must arrive even if reading fails
+            self._lines.put(None)
+
+    def _pump_output(self):
+        """Emit output in batches, flushing on a timer or when the batch is full"""
+        batch = []
+        raw = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if raw else None
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                line = ''
+
+            if line is None:
+                self._flush_output(batch, raw)
+                return
+
+            if line:
+                if not raw:
+                    deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+                raw.append(line)
+                self.recent_lines.append(line)
+                event = self.parser.feed(line)
+                if event:
+                    self.state_machine.handle(event)
+                if self._accept_line():
+                    batch.append(line.rstrip('\n'))
+
+            if len(raw) >= LOG_FLUSH_LINES or (raw and time.monotonic() >= deadline):
+                self._flush_output(batch, raw)
+                batch = []
+                raw = []
+
+    def _on_transition(self, old_state, new_state, event):
+        # Time spent in each state, e.g. login in "authenticating" and listener readiness up to "ready"
+        now = time.perf_counter_ns()
+        if self._state_since:
+            get_tracer().record(f"state.{old_state}", self._state_since, now,
+                                {"event": event.kind} if event is not None else None)
+        self._state_since = now
+        self._telemetry.set_state(new_state)
+        if new_state == STATE_READY and old_state in (STATE_CONNECTING, STATE_AUTHENTICATING) and self._run_started:
+            self._telemetry.connect_latency.observe(time.monotonic() - self._run_started)
+        self.state_changed.emit(new_state)
+        if new_state == STATE_STOPPED and event is not None and event.kind == EVENT_LOGIN_FAILED:
+            # zju-connect may keep retrying a rejected login; there is no point waiting for it
+            self._fail_fast(EXIT_AUTH_FAILURE)
+
+    def _fail_fast(self, reason):
+        """Stop zju-connect from the worker thread because its output showed it cannot succeed"""
+        if self._stop_requested:
+            return
+        self._stop_requested = True
+        self._stop_reason = reason
+        self._stop_started = time.monotonic()
+        self.stop_progress.emit("Login failed, stopping zju-connect")
+        for process in self._processes():
+            if process.poll() is None:
+                process.terminate()
+        timer = threading.Timer(DEFAULT_STOP_TIMEOUT, self._kill_if_alive)
+        timer.daemon = True
+        timer.start()
+
+    def _accept_line(self):
+        """Rate limit lines delivered to the GUI, counting the ones that are dropped"""
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_lines = 0
+        if self._window_lines >= LOG_MAX_LINES_PER_SECOND:
+            self.dropped_lines += 1
+            self._suppressed += 1
+            return False
+        self._window_lines += 1
+        return True
+
+    def _flush_output(self, batch, raw):
+        """Write the full batch to the session log and emit the accepted lines as a single output signal"""
+        self._session_log.write_lines(raw)
+        self._telemetry.log_lines += len(raw)
+        if self._suppressed:
+            batch.append(f"[{self._suppressed} lines suppressed, {self.dropped_lines} in total]")
+            self._suppressed = 0
+        if batch:
+            self.output.emit('\n'.join(batch))
+
+    def stop(self, timeout=DEFAULT_STOP_TIMEOUT, reason=EXIT_STOPPED):
+        """Ask zju-connect to exit gracefully and kill it if it is still alive after timeout seconds.
+
+        Returns immediately; completion is reported through the finished signal.
+        reason becomes the worker's exit_reason, so a stop can be marked as restartable.
+        """
+        if self._stop_requested:
+            return
+        self._stop_requested = True
+        self._stop_reason = reason
+        self._stop_started = time.monotonic()
+        self.stop_progress.emit("Stopping zju-connect...")
+        for process in self._processes():
+            if process.poll() is None:
+                process.terminate()
+        self._kill_timer.start(int(timeout * 1000))
+
+    def _kill_if_alive(self):
+        """Escalate a graceful stop that did not finish in time"""
+        alive = [process for process in self._processes() if process.poll() is None]
+        if alive:
+            self.stop_progress.emit("zju-connect did not exit in time, killing it")
+            for process in alive:
+                process.kill()
+
+    def is_stopping(self):
+        return self._stop_requested and self.isRunning()
+
+class MultiTunnelWorker(CommandWorker):
+    """CommandWorker running one or more zju-connect tunnels behind a local relay.
+
+    Each tunnel listens on its own free ports; the relay takes over the configured
+    SOCKS/HTTP ports, spreads new connections across the tunnels that are up and
+    counts the traffic. The worker finishes once every tunnel has exited.
+    """
+
+    def __init__(self, command_args, proxy_enabled, window=None, keep_proxy_on_failure=False, endpoints=None,
+                 prefetcher=None, split_tunnel=False, tunnels=2):
+        super().__init__(command_args, proxy_enabled, window, keep_proxy_on_failure, endpoints, prefetcher,
+                         split_tunnel)
+        self.tunnels = tunnels
+        self.processes = []
+        http_host, http_port, socks_host, socks_port = get_proxy_settings(window) if window else (None,) * 4
+        listen_ports = {kind: port for kind, port in (("http", http_port), ("socks", socks_port)) if port}
+        ports = find_free_ports(len(listen_ports) * tunnels)
+        backends = [RelayBackend(i, {kind: ports.pop() for kind in listen_ports}) for i in range(tunnels)]
+        self.relay = Relay(listen_ports, backends)
+
+    def _launch(self):
+        try:
+            self.relay.start()
+        except OSError as e:
+            self.output.emit(f"Could not listen on the proxy ports: {e}")
+            self._lines.put(None)
+            return
+        readers = []
+        for backend in self.relay.backends:
+            command_args = apply_binds(self.command_args, backend.ports.get("http"), backend.ports.get("socks"))
+            process = self._popen(command_args)
+            self.processes.append(process)
+            readers.append(threading.Thread(target=self._read_tunnel, args=(backend.index, process), daemon=True))
+        if self._stop_requested:
+            for process in self.processes:
+                process.terminate()
+        self._open_readers = len(readers)
+        self._readers_lock = threading.Lock()
+        for reader in readers:
+            reader.start()
+
+    def _read_tunnel(self, index, process):
+        """Read one tunnel's output, prefixed with its number, and take it out of rotation when it exits"""
+        prefix = f"[tunnel {index + 1}] " if self.tunnels > 1 else ""
+        try:
+            for line in process.stdout:
+                self._lines.put(prefix + line)
+            process.wait()
+            self.relay.set_alive(index, False)
+            if not self._stop_requested and self.tunnels > 1:
+                self._lines.put(f"{prefix}exited with code {process.returncode}\n")
+        finally:
+            with self._readers_lock:
+                self._open_readers -= 1
+                if self._open_readers == 0:
+                    self._lines.put(None)
+
+    def _processes(self):
+        return list(self.processes)
+
+    def _wait_for_exit(self):
+        if not self.processes:
+            return 1
+        returncodes = [process.wait() for process in self.processes]
+        return next((code for code in returncodes if code != 0), 0)
+
+    def _cleanup(self):
+        self.relay.close()
+
+class DaemonWorker(CommandWorker):
+    """CommandWorker whose zju-connect runs in a detached tunnel daemon that outlives the GUI.
+
+    Without state it launches a new daemon; with the state of a running daemon it attaches
+    to it. Either way output is streamed back through the same signals as CommandWorker.
+    """
+
+    def __init__(self, command_args=None, proxy_enabled=False, window=None, keep_proxy_on_failure=False,
+                 endpoints=None, prefetcher=None, state=None):
+        super().__init__(command_args or [], proxy_enabled, window, keep_proxy_on_failure, endpoints, prefetcher)
+        self.state = state
+        self._sock = None
+
+    def run(self):
+        try:
+            if self.state is None:
+                self._select_server()
+                proxy = None
+                if self.proxy_enabled and self.window:
+                    http_host, http_port, socks_host, socks_port = get_proxy_settings(self.window)
+                    if http_host and http_port:
+                        proxy = [http_host, http_port, socks_host, socks_port]
+                process = launch_daemon({
+                    "command_args": self.command_args,
+                    "proxy": proxy,
+                    "keep_proxy_on_failure": self.keep_proxy_on_failure,
+                })
+                self.state = wait_for_daemon(process.pid)
+                if self.state is None:
+                    self.output.emit("Tunnel daemon did not start")
+                    return
+
+            if self.exit_reason == EXIT_DETACHED:
+                return
+            try:
+                self._sock = send_request(self.state, {"cmd": "attach"})
+                self._sock.settimeout(None)
+            except OSError:
+                self.output.emit("Could not attach to the tunnel daemon")
+                return
+            if self._stop_requested:
+                self._send_stop()
+
+            reader = threading.Thread(target=self._read_daemon, daemon=True)
+            reader.start()
+            self._pump_output()
+        finally:
+            if self._stop_requested and self.exit_reason != EXIT_DETACHED:
+                self.stop_latency = time.monotonic() - self._stop_started
+                self.stop_progress.emit(f"zju-connect stopped in {self.stop_latency:.2f}s")
+            self.state_machine.stop()
             self.finished.emit()
 
+    def _read_daemon(self):
+        """Turn daemon messages into output lines on a helper thread"""
+        try:
+            for raw in self._sock.makefile("r", encoding="utf-8"):
+                message = json.loads(raw)
+                if message["type"] == "history" and message["lines"]:
+                    # Replayed lines are already in the session log, so bypass the pump
+                    self.output.emit("\n".join(message["lines"]))
+                    for line in message["lines"]:
+                        event = self.parser.feed(line)
+                        if event:
+                            self.state_machine.handle(event)
+                elif message["type"] == "output":
+                    self._lines.put(message["text"])
+                elif message["type"] == "exit":
+                    self.exit_reason = message["reason"]
+        except (OSError, ValueError):
+            pass
+        self._lines.put(None)
+
+    def _send_stop(self):
+        try:
+            send_request(self.state, {"cmd": "stop", "timeout": self._stop_timeout, "reason": self._stop_reason}).close()
+        except OSError:
+            pass
+
+    def _fail_fast(self, reason):
+        if self._stop_requested:
+            return
+        self._stop_requested = True
+        self._stop_reason = reason
+        self._stop_timeout = DEFAULT_STOP_TIMEOUT
+        self._stop_started = time.monotonic()
+        self.stop_progress.emit("Login failed, stopping zju-connect")
+        if self._sock:
+            self._send_stop()
+
+    def stop(self, timeout=DEFAULT_STOP_TIMEOUT, reason=EXIT_STOPPED):
+        """Ask the daemon to stop zju-connect; escalation to kill happens in the daemon"""
+        if self._stop_requested:
+            return
+        self._stop_requested = True
+        self._stop_reason = reason
+        self._stop_timeout = timeout
+        self._stop_started = time.monotonic()
+        self.stop_progress.emit("Stopping zju-connect...")
+        if self._sock:
+            self._send_stop()
+
+    def detach(self):
+        """Stop streaming from the daemon and leave the tunnel running"""
+        self.exit_reason = EXIT_DETACHED
+        if self._sock:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class HealthWorker(QObject):
+    """Qt front end for HealthMonitor; its signals are delivered on the GUI thread"""
+    sample = Signal(object)
+    unhealthy = Signal(int)
+
+    def __init__(self, probe, interval, failure_threshold):
+        super().__init__()
+        self.monitor = HealthMonitor(probe, interval=interval, failure_threshold=failure_threshold,
+                                     on_sample=self.sample.emit, on_unhealthy=self.unhealthy.emit)
+
+    def start(self):
+        self.monitor.start()
+
     def stop(self):
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
+        self.monitor.stop()
 
 def set_windows_proxy(enable, http_host=None, http_port=None, socks_host=None, socks_port=None):
     """Manage proxy settings for Windows using the Windows Registry."""
     if system() != "Windows":
         return
-
-    import winreg as reg
-    import ctypes
-    
-    with reg.OpenKey(reg.HKEY_CURRENT_USER,
-                    r'Software\Microsoft\Windows\CurrentVersion\Internet Settings',
-                    0, reg.KEY_ALL_ACCESS) as internet_settings:
-        reg.SetValueEx(internet_settings, 'ProxyEnable', 0, reg.REG_DWORD, 1 if enable else 0)
-        if enable and http_host and http_port:
-            reg.SetValueEx(internet_settings, 'ProxyServer', 0, reg.REG_SZ, f"{http_host}:{http_port}")
-
-    # Refresh system proxy settings
-    ctypes.windll.Wininet.InternetSetOptionW(0, 37, 0, 0)
-    ctypes.windll.Wininet.InternetSetOptionW(0, 39, 0, 0)
+    apply_system_proxy(enable, http_host, http_port, socks_host, socks_port)
 
 def set_macos_proxy(enable, http_host=None, http_port=None, socks_host=None, socks_port=None):
     """Manage proxy settings for macOS using networksetup."""
     if system() != "Darwin":
         return
-
-    services = subprocess.check_output(['networksetup', '-listallnetworkservices']).decode().split('\n')[1:]
-    services = [s for s in services if s and not s.startswith('*')]
-
-    for service in services:
-        if enable and http_host and http_port:
-            subprocess.run(['networksetup', '-setwebproxy', service, http_host, str(http_port)])
-            subprocess.run(['networksetup', '-setsecurewebproxy', service, http_host, str(http_port)])
-            if socks_host and socks_port:
-                subprocess.run(['networksetup', '-setsocksfirewallproxy', service, socks_host, str(socks_port)])
-        else:
-            subprocess.run(['networksetup', '-setwebproxystate', service, 'off'])
-            subprocess.run(['networksetup', '-setsecurewebproxystate', service, 'off'])
-            subprocess.run(['networksetup', '-setsocksfirewallproxystate', service, 'off'])
+    apply_system_proxy(enable, http_host, http_port, socks_host, socks_port)
 
 def set_linux_proxy(enable, http_host=None, http_port=None, socks_host=None, socks_port=None):
     """Manage proxy settings for Linux using gsettings."""
     if system() != "Linux":
         return
+    apply_system_proxy(enable, http_host, http_port, socks_host, socks_port)
 
-    if enable and http_host and http_port:
-        subprocess.run(['gsettings', 'set', 'org.gnome.system.proxy', 'mode', 'manual'])
-        for protocol in ['http', 'https']:
-            subprocess.run(['gsettings', 'set', f'org.gnome.system.proxy.{protocol}', 'host', http_host])
-            subprocess.run(['gsettings', 'set', f'org.gnome.system.proxy.{protocol}', 'port', str(http_port)])
-        if socks_host and socks_port:
-            subprocess.run(['gsettings', 'set', 'org.gnome.system.proxy.socks', 'host', socks_host])
-            subprocess.run(['gsettings', 'set', 'org.gnome.system.proxy.socks', 'port', str(socks_port)])
-    else:
-        subprocess.run(['gsettings', 'set', 'org.gnome.system.proxy', 'mode', 'none'])
\ No newline at end of file
+def apply_system_proxy(enable, http_host=None, http_port=None, socks_host=None, socks_port=None, pac_url=None):
+    """Enable the proxy (or the PAC script at pac_url) through the platform backend, or restore the settings it replaced"""
+    backend = get_proxy_backend()
+    if not backend:
+        return
+    started = time.perf_counter()
+    with span("proxy_apply", enable=enable, pac=bool(pac_url)):
+        if enable and pac_url:
+            backend.enable(pac_url=pac_url)
+        elif enable and http_host and http_port:
+            backend.enable(http_host, http_port, socks_host, socks_port)
+        else:
+            backend.disable()
+    get_telemetry().proxy_apply.observe(time.perf_counter() - started)
@@ -4,9 +4,24 @@ from platform import system
 if system() == "Windows":
     import winreg
 import subprocess
+import threading
+import time
+from .log_utils import append_output
+from .telemetry_utils import process_usage
+
+STARTUP_BUDGET = 1.5  # seconds from the first import to the tray icon being shown
+STARTUP_CHECK_FLAG = "--startup-check"
+
+_launch_cache = {'value': None, 'probe_time': None}
+_probe_done = threading.Event()
+_probe_thread = None
+_probe_lock = threading.Lock()
+_probe_listeners = []
 
 def set_launch_at_login(enable: bool):
     """Set application to launch at login"""
+    if _probe_done.is_set() and _launch_cache['value'] == enable:
+        return
     if system() == "Windows":
         app_path = sys.argv[0]
         key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
@@ -45,7 +60,55 @@ def set_launch_at_login(enable: bool):
         except subprocess.SubprocessError:
             pass
 
-def get_launch_at_login() -> bool:
+    # Re-read the state rather than trusting that the change took effect
+    probe_launch_at_login_async(force=True)
+
+def probe_launch_at_login_async(force=False):
+    """Start reading the login item state in the background, unless it is cached or being read"""
+    global _probe_thread
+    if _probe_thread is not None:
+        if not force:
+            return
+        # A probe started before the change could report the old state
+        _probe_thread.join()
+    _probe_done.clear()
+    _probe_thread = threading.Thread(target=_run_probe, daemon=True)
+    _probe_thread.start()
+
+def _run_probe():
+    start = time.perf_counter()
+    value = _read_launch_at_login()
+    with _probe_lock:
+        _launch_cache['probe_time'] = time.perf_counter() - start
+        _launch_cache['value'] = value
+        _probe_done.set()
+        listeners = list(_probe_listeners)
+        _probe_listeners.clear()
+    for listener in listeners:
+        listener(value)
+
+def get_launch_probe_time():
+    """Seconds the last login item probe took, or None if it has not finished"""
+    return _launch_cache['probe_time'] if _probe_done.is_set() else None
+
+def peek_launch_at_login(on_probed=None):
+    """Return the cached login item state without waiting, or None while the probe is still running.
+
+    In the latter case on_probed(value) is called from the probe thread once it finishes.
+    """
+    probe_launch_at_login_async()
+    with _probe_lock:
+        if _probe_done.is_set():
+            return _launch_cache['value']
+        if on_probed:
+            _probe_listeners.append(on_probed)
+    return None
+
+def set_launch_at_login_async(enable: bool):
+    """Apply the login item state on a background thread; it is joined at interpreter exit"""
+    threading.Thread(target=set_launch_at_login, args=(enable,)).start()
+
+def _read_launch_at_login() -> bool:
     """Check if application is set to launch at login"""
     if system() == "Windows":
         key_path = r"Software\Microsoft\Windows\CurrentVersion\Run"
@@ -72,3 +135,24 @@ def get_launch_at_login() -> bool:
             return False
     
     return False
+
+def report_startup(window, started):
+    """Log the time from process start to the tray icon being shown.
+
+    With --startup-check the app prints the time and exits right away, non-zero
+    if it is over STARTUP_BUDGET, so cold start can be checked from a script.
+    """
+    elapsed = time.perf_counter() - started
+    # The login item probe runs in the background and is not part of the budget
+    probe_time = get_launch_probe_time()
+    probe = "still running" if probe_time is None else f"{probe_time * 1000:.0f} ms"
+    usage = process_usage(os.getpid())
+    memory = f"{usage[0] / 1024 / 1024:.0f} MB" if usage else "unknown"
+    panel = "built" if getattr(window, 'output_text', None) is not None else "deferred"
+    append_output(window, f"Started in {elapsed * 1000:.0f} ms, RSS {memory}, panel {panel} "
+                          f"(login item probe: {probe})\n")
+    if STARTUP_CHECK_FLAG in sys.argv:
+        print(f"startup: {elapsed * 1000:.0f} ms (budget {STARTUP_BUDGET * 1000:.0f} ms), RSS {memory}, "
+              f"panel {panel}, login item probe: {probe}", flush=True)
+        # Nothing has been connected yet, so there is no state to tear down
+        os._exit(0 if elapsed <= STARTUP_BUDGET else 1)
@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+import subprocess
+from bisect import bisect_left
+from platform import system
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .keepalive_utils import KeepAliveStats
+
+PREFIX = "hitsz_connect"
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROXY_APPLY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+STATES = ("connecting", "authenticating", "ready", "degraded", "stopped")
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations in seconds"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, help_text):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = [f"# TYPE {name} histogram", f"# UNIT {name} seconds", f"# HELP {name} {help_text}"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{name}_sum {total}")
+        lines.append(f"{name}_count {count}")
+        return lines
+
+class Telemetry:
+    """Counters and gauges describing the app and its tunnel, rendered in OpenMetrics text format.
+
+    Workers and the GUI write plain attributes from their own threads; render() only
+    reads them, so scraping never waits on the GUI.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.state = "stopped"
+        self.connected_since = None
+        self.reconnects = 0
+        self.log_lines = 0
+        self.connect_latency = Histogram(LATENCY_BUCKETS)
+        self.stop_latency = Histogram(LATENCY_BUCKETS)
+        self.proxy_apply = Histogram(PROXY_APPLY_BUCKETS)
+        self.keepalive = KeepAliveStats()
+        self.processes = None  # callable returning the zju-connect pids
+
+    def set_state(self, state):
+        self.state = state
+        if state == "ready" and self.connected_since is None:
+            self.connected_since = time.monotonic()
+        elif state == "stopped":
+            self.connected_since = None
+
+    def render(self):
+        now = time.monotonic()
+        lines = []
+
+        def metric(name, kind, help_text, samples, unit=None):
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            if unit:
+                lines.append(f"# UNIT {PREFIX}_{name} {unit}")
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            for suffix, labels, value in samples:
+                label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+                lines.append(f"{PREFIX}_{name}{suffix}{label_text} {value}")
+
+        metric("tunnel_state", "stateset", "Current tunnel connection state",
+               [("", {f"{PREFIX}_tunnel_state": state}, int(state == self.state)) for state in STATES])
+        metric("app_uptime_seconds", "gauge", "Seconds since the app started",
+               [("", {}, round(now - self.started, 3))], unit="seconds")
+        metric("tunnel_uptime_seconds", "gauge", "Seconds since the tunnel became ready, 0 when not connected",
+               [("", {}, round(now - self.connected_since, 3) if self.connected_since else 0)], unit="seconds")
+        metric("reconnects", "counter", "Automatic reconnects since the app started",
+               [("_total", {}, self.reconnects)])
+        metric("log_lines", "counter", "zju-connect output lines read", [("_total", {}, self.log_lines)])
+        metric("keepalive_idle_timeout_seconds", "gauge",
+               "Idle timeout the app schedules keep-alive pings for, 0 when zju-connect does its own",
+               [("", {}, self.keepalive.idle_timeout)], unit="seconds")
+        metric("keepalive_pings", "counter", "Keep-alive pings sent through the tunnel",
+               [("_total", {}, self.keepalive.pings)])
+        metric("keepalive_ping_failures", "counter", "Keep-alive pings that failed",
+               [("_total", {}, self.keepalive.failures)])
+        metric("keepalive_pings_skipped", "counter", "Keep-alive pings skipped because real traffic was flowing",
+               [("_total", {}, self.keepalive.skipped)])
+        metric("keepalive_idle_drops_avoided", "counter",
+               "Idle stretches longer than the idle timeout that pings kept the session through",
+               [("_total", {}, self.keepalive.drops_avoided)])
+        lines += self.connect_latency.render(f"{PREFIX}_connect_latency_seconds",
+                                             "Time from starting zju-connect to the tunnel being ready")
+        lines += self.stop_latency.render(f"{PREFIX}_stop_latency_seconds",
+                                          "Time from a stop request to zju-connect exiting")
+        lines += self.proxy_apply.render(f"{PREFIX}_proxy_apply_seconds",
+                                         "Time taken to set or restore the system proxy")
+
+        stats = []
+        for pid in (self.processes() if self.processes else []):
+            usage = process_usage(pid)
+            if usage:
+                stats.append((pid, usage))
+        metric("core_resident_memory_bytes", "gauge", "Resident memory of each zju-connect process",
+               [("", {"pid": pid}, rss) for pid, (rss, _) in stats], unit="bytes")
+        metric("core_cpu_seconds", "counter", "CPU time used by each zju-connect process",
+               [("_total", {"pid": pid}, round(cpu, 3)) for pid, (_, cpu) in stats], unit="seconds")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+def process_usage(pid):
+    """Resident memory in bytes and CPU seconds of a process, or None if it cannot be read"""
+    try:
+        if system() == "Linux":
+            with open(f"/proc/{pid}/statm") as f:
+                rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(f"/proc/{pid}/stat") as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+            return rss, (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        if system() == "Darwin":
+            output = subprocess.run(["ps", "-o", "rss=,time=", "-p", str(pid)],
+                                    capture_output=True, text=True).stdout.split()
+            if len(output) != 2:
+                return None
+            minutes, seconds = output[1].split(":")[-2:]
+            hours = output[1].split(":")[0] if output[1].count(":") == 2 else 0
+            return int(output[0]) * 1024, int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        if system() == "Windows":
+            return _windows_process_usage(pid)
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+def _windows_process_usage(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                   [(name, ctypes.c_size_t) for name in (
+                       "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                       "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return None
+    try:
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        times = [wintypes.FILETIME() for _ in range(4)]
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        if not ctypes.windll.kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times)):
+            return None
+        kernel, user = ((t.dwHighDateTime << 32 | t.dwLowDateTime) / 1e7 for t in times[2:])
+        return counters.WorkingSetSize, kernel + user
+    finally:
+        ctypes.windll.kernel32.CloseHandle(handle)
+
+class MetricsHTTPServer(ThreadingHTTPServer):
+    # On Windows SO_REUSEADDR would let the server bind a port another process is listening on
+    allow_reuse_address = system() != "Windows"
+    daemon_threads = True
+
+class MetricsServer:
+    """Serve Telemetry.render() at /metrics on a local port from a background thread"""
+
+    def __init__(self, telemetry, port, host="127.0.0.1"):
+        self.telemetry = telemetry
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        telemetry = self.telemetry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = MetricsHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+_telemetry = None
+
+def get_telemetry():
+    """Get the shared telemetry registry"""
+    global _telemetry
+    if _telemetry is None:
+        _telemetry = Telemetry()
+    return _telemetry
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+TRACE_BUFFER_SIZE = 20000  # events kept in memory; the oldest are dropped first
+
+class Span:
+    """Context manager timing one phase on the monotonic clock"""
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args or (), error=exc_type.__name__)
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+class Tracer:
+    """In-memory ring buffer of timed spans, exportable as JSON lines or Chrome trace events.
+
+    Recording a span is two clock reads and one deque append, which is atomic, so
+    spans can be recorded from any thread without a lock and tracing stays on.
+    """
+
+    def __init__(self, size=TRACE_BUFFER_SIZE):
+        self.events = deque(maxlen=size)
+        self.pid = os.getpid()
+
+    def span(self, name, **args):
+        return Span(self, name, args or None)
+
+    def record(self, name, start, end, args=None):
+        """Record a span from perf_counter_ns() timestamps, e.g. one that began on another thread"""
+        self.events.append((name, start, end - start, threading.get_ident(), args))
+
+    def mark(self, name, **args):
+        """Record an instant event"""
+        self.events.append((name, time.perf_counter_ns(), None, threading.get_ident(), args or None))
+
+    def clear(self):
+        self.events.clear()
+
+    def export_jsonl(self, path):
+        """One JSON object per event, times in milliseconds since the first event"""
+        events = list(self.events)
+        origin = events[0][1] if events else 0
+        with open(path, "w", encoding="utf-8") as f:
+            for name, start, duration, thread, args in events:
+                record = {"name": name, "start_ms": (start - origin) / 1e6,
+                          "duration_ms": None if duration is None else duration / 1e6, "thread": thread}
+                if args:
+                    record["args"] = args
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def export_chrome(self, path):
+        """Chrome trace event format, for chrome://tracing or Perfetto"""
+        trace_events = []
+        for name, start, duration, thread, args in list(self.events):
+            event = {"name": name, "ts": start / 1000, "pid": self.pid, "tid": thread}
+            if duration is None:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=duration / 1000)
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def export(self, path):
+        """Export in the format implied by the file extension: .jsonl for JSON lines, otherwise Chrome trace"""
+        if path.endswith(".jsonl"):
+            self.export_jsonl(path)
+        else:
+            self.export_chrome(path)
+
+_tracer = None
+
+def get_tracer():
+    """Get the shared tracer"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+def span(name, **args):
+    """Time a phase with the shared tracer: with span("launch"): ..."""
+    return get_tracer().span(name, **args)
@@ -1,20 +1,29 @@
 from PySide6.QtWidgets import QSystemTrayIcon, QMenu, QApplication, QMainWindow
 from PySide6.QtGui import QIcon, QAction
+from PySide6.QtCore import QTimer
 from platform import system
 from .common import get_resource_path
+from .config_utils import get_config_store
 import gc
 
+PANEL_RELEASE_DELAY = 120  # seconds a hidden panel is kept before its widgets are released
+# Widgets owned by the panel; they are None while it is not built
+PANEL_WIDGETS = ("username_input", "password_input", "show_password_cb", "remember_cb", "rate_label",
+                 "status_icon", "status_label", "output_text", "connect_button", "exit_button",
+                 "advanced_action", "command_bar")
+
 def create_tray_menu(window: QMainWindow, tray_icon):
     """Create and set up the system tray menu"""
     menu = QMenu()
     show_action = menu.addAction("打开面板")
-    show_action.triggered.connect(window.show)
-    show_action.triggered.connect(window.raise_)
-    connect_action = QAction("系统代理", menu)
-    connect_action.setCheckable(True)
-    connect_action.triggered.connect(lambda checked: window.connect_button.setChecked(checked))
-    window.connect_button.toggled.connect(connect_action.setChecked) # Sync connect_action item with connect_button state
-    menu.addAction(connect_action)
+    show_action.triggered.connect(lambda: show_panel(window))
+    # The connect toggle lives here so it works without the panel; the panel's button mirrors it
+    window.connect_action = QAction("系统代理", menu)
+    window.connect_action.setCheckable(True)
+    window.connect_action.toggled.connect(
+        lambda checked: window.start_connection() if checked else window.stop_connection())
+    window.connect_action.toggled.connect(window.save_credentials)
+    menu.addAction(window.connect_action)
     quit_action = menu.addAction("退出")
     quit_action.triggered.connect(window.quit_app)
     
@@ -24,20 +33,72 @@ def create_tray_menu(window: QMainWindow, tray_icon):
 def tray_icon_activated(reason, window):
     """Handle tray icon activation"""
     if reason == QSystemTrayIcon.DoubleClick:
-        window.show()
-        window.activateWindow()
+        show_panel(window)
+
+def show_panel(window):
+    """Show the main window, building its widgets first if they were never built or have been released"""
+    if getattr(window, 'release_timer', None):
+        window.release_timer.stop()
+    if getattr(window, 'output_text', None) is None:
+        window.build_panel()
+    window.show()
+    window.raise_()
+    window.activateWindow()
+
+def schedule_panel_release(window):
+    """Release the panel's widgets if the window stays hidden for PANEL_RELEASE_DELAY"""
+    if getattr(window, 'release_timer', None) is None:
+        window.release_timer = QTimer(window)
+        window.release_timer.setSingleShot(True)
+        window.release_timer.timeout.connect(lambda: release_panel(window))
+    window.release_timer.start(PANEL_RELEASE_DELAY * 1000)
+
+def release_panel(window):
+    """Drop the widgets of a hidden window; connection state and the log live on the window and survive"""
+    if window.isVisible() or getattr(window, 'output_text', None) is None:
+        return
+    # Keep unsaved edits for connecting from the tray
+    window.username = window.username_input.text()
+    window.password = window.password_input.text()
+    window.destroy_panel()
+    for name in PANEL_WIDGETS:
+        setattr(window, name, None)
+    if getattr(window, 'advanced_dialog', None) is not None:
+        window.advanced_dialog.deleteLater()
+        window.advanced_dialog = None
+    gc.collect()
 
 def handle_close_event(window, event, tray_icon):
     """Handle window close event"""
     if tray_icon.isVisible():
         window.hide()
         event.ignore()
+        schedule_panel_release(window)
     else:
         window.quit_app()
 
 def quit_app(window, tray_icon):
-    """Quit the application"""
+    """Quit the application once the connection has stopped"""
+    if window.worker and window.worker.isRunning():
+        # handle_connection_finished calls back into quit_app when the worker exits
+        window.quitting = True
+        if window.detached_tunnel and hasattr(window.worker, 'detach'):
+            window.worker.detach()
+        else:
+            window.stop_connection()
+        return
+
     window.stop_connection()
+    if getattr(window, 'themeListener', None) is not None:
+        window.themeListener.terminate()
+        window.themeListener.deleteLater()
+    if getattr(window, 'update_worker', None) is not None:
+        # An update check still in flight is left to its daemon thread; only its result is dropped
+        window.update_worker.result.disconnect()
+        window.update_worker.failed.disconnect()
+        window.update_worker.finished.disconnect()
+        window.update_worker = None
+    get_config_store().flush()
     window.deleteLater()
     tray_icon.deleteLater()
     gc.collect()
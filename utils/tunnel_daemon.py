@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import socket
+import secrets
+import subprocess
+import signal
+import threading
+from collections import deque
+from platform import system
+from .common import get_app_data_dir
+from .proxy_backend import get_proxy_backend
+from .reconnect_utils import classify_exit, EXIT_STOPPED, RETRYABLE_EXITS
+
+DAEMON_FLAG = "--tunnel-daemon"
+STATE_FILE = "daemon.json"
+HISTORY_LINES = 2000
+CONNECT_TIMEOUT = 0.5
+
+def get_state_path():
+    return os.path.join(get_app_data_dir(), STATE_FILE)
+
+def read_state():
+    """Read the running daemon's pid, control port and token, or None if there is none"""
+    try:
+        with open(get_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def send_request(state, request, timeout=CONNECT_TIMEOUT):
+    """Open a control connection, send one request and return the connected socket"""
+    sock = socket.create_connection(("127.0.0.1", state["port"]), timeout=timeout)
+    sock.sendall((json.dumps(dict(request, token=state["token"])) + "\n").encode())
+    return sock
+
+def query_status(state):
+    """Return the daemon's status reply, or None if it does not answer"""
+    try:
+        with send_request(state, {"cmd": "status"}) as sock:
+            return json.loads(sock.makefile("r", encoding="utf-8").readline())
+    except (OSError, ValueError):
+        return None
+
+def find_running_daemon():
+    """Return the state of a live daemon, removing a stale state file"""
+    state = read_state()
+    if state is None:
+        return None
+    if query_status(state) is None:
+        try:
+            os.remove(get_state_path())
+        except OSError:
+            pass
+        return None
+    return state
+
+def launch_daemon(config):
+    """Start a detached daemon process and hand it the tunnel configuration over stdin"""
+    if getattr(sys, 'frozen', False):
+        # The bundled app handles the flag before it loads Qt
+        args = [sys.executable, DAEMON_FLAG]
+        cwd = None
+    else:
+        args = [sys.executable, "-m", "utils.tunnel_daemon"]
+        cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    if system() == "Windows":
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.CREATE_NO_WINDOW
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, creationflags=flags, cwd=cwd)
+    else:
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, start_new_session=True, cwd=cwd)
+    process.stdin.write((json.dumps(config) + "\n").encode())
+    process.stdin.close()
+    return process
+
+def wait_for_daemon(pid, timeout=5.0):
+    """Wait until the daemon with pid has published its control port"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = read_state()
+        if state and state.get("pid") == pid:
+            return state
+        time.sleep(0.05)
+    return None
+
+class TunnelDaemon:
+    """Own one zju-connect process and serve its output and controls on a local socket.
+
+    The daemon lives exactly as long as the tunnel; restarts are decided by whoever
+    is attached, which launches a new daemon.
+    """
+
+    def __init__(self, config, echo=None):
+        self.command_args = config["command_args"]
+        self.proxy = config.get("proxy")  # [http_host, http_port, socks_host, socks_port] or None
+        self.keep_proxy_on_failure = config.get("keep_proxy_on_failure", False)
+        # Set when the caller restarts the tunnel itself, so it counts as always attached
+        self.supervised = config.get("supervised", False)
+        self.echo = echo
+        self.token = secrets.token_hex(16)
+        self.history = deque(maxlen=HISTORY_LINES)
+        self.clients = []
+        self.process = None
+        self.exit_reason = None
+        self._stop_reason = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+
+        try:
+            if self.proxy:
+                get_proxy_backend().enable(*self.proxy)
+
+            creation_flags = subprocess.CREATE_NO_WINDOW if system() == "Windows" else 0
+            self.process = subprocess.Popen(
+                self.command_args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                encoding="utf-8",
+                errors="replace",
+                creationflags=creation_flags
+            )
+            self._write_state(server.getsockname()[1])
+            for line in self.process.stdout:
+                if self.echo:
+                    self.echo.write(line)
+                    self.echo.flush()
+                self._publish({"type": "output", "text": line.rstrip("\n")}, line)
+            self.process.wait()
+
+            if self._stop_reason:
+                self.exit_reason = self._stop_reason
+            else:
+                self.exit_reason = classify_exit(self.process.returncode, list(self.history)[-50:])
+        finally:
+            with self._lock:
+                attached = bool(self.clients) or self.supervised
+            # Only leave the proxy in place if someone attached is going to restart the tunnel
+            keep_proxy = attached and self.keep_proxy_on_failure and self.exit_reason in RETRYABLE_EXITS
+            if self.proxy and not keep_proxy:
+                get_proxy_backend().disable()
+            self._publish({"type": "exit", "reason": self.exit_reason})
+            self._remove_state()
+            server.close()
+
+    def _write_state(self, port):
+        """Write the state file through a temporary file that is private from creation, since it holds the token"""
+        path = get_state_path()
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "port": port, "token": self.token}, f)
+        os.replace(temporary, path)
+
+    def _remove_state(self):
+        state = read_state()
+        if state and state.get("pid") == os.getpid():
+            try:
+                os.remove(get_state_path())
+            except OSError:
+                pass
+
+    def _publish(self, message, line=None):
+        """Record an output line and send a message to every attached client"""
+        data = (json.dumps(message) + "\n").encode()
+        with self._lock:
+            if line is not None:
+                self.history.append(line.rstrip("\n"))
+            for client in list(self.clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self.clients.remove(client)
+
+    def _accept(self, server):
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle_client, args=(client,), daemon=True).start()
+
+    def _handle_client(self, client):
+        try:
+            request = json.loads(client.makefile("r", encoding="utf-8").readline())
+        except (OSError, ValueError):
+            client.close()
+            return
+        if not secrets.compare_digest(str(request.get("token", "")), self.token):
+            client.close()
+            return
+
+        command = request.get("cmd")
+        if command == "status":
+            running = self.process is not None and self.process.poll() is None
+            client.sendall((json.dumps({"type": "status", "pid": os.getpid(), "running": running}) + "\n").encode())
+            client.close()
+        elif command == "attach":
+            with self._lock:
+                client.sendall((json.dumps({"type": "history", "lines": list(self.history)}) + "\n").encode())
+                self.clients.append(client)
+            self._watch_client(client)
+        elif command == "stop":
+            self.stop(float(request.get("timeout", 5.0)), request.get("reason", EXIT_STOPPED))
+            client.close()
+        else:
+            client.close()
+
+    def _watch_client(self, client):
+        """Drop a client from the broadcast list once it disconnects"""
+        try:
+            while client.recv(1024):
+                pass
+        except OSError:
+            pass
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        client.close()
+
+    def stop(self, timeout, reason):
+        """Terminate zju-connect and kill it if it is still alive after timeout seconds"""
+        if self._stop_reason or self.process is None:
+            return
+        self._stop_reason = reason
+        self.process.terminate()
+
+        def kill_if_alive():
+            if self.process.poll() is None:
+                self._publish({"type": "output", "text": "zju-connect did not exit in time, killing it"})
+                self.process.kill()
+        timer = threading.Timer(timeout, kill_if_alive)
+        timer.daemon = True
+        timer.start()
+
+def main():
+    config = json.loads(sys.stdin.readline())
+    daemon = TunnelDaemon(config)
+    # Stopping through a signal still restores the system proxy
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop(5.0, EXIT_STOPPED))
+    daemon.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
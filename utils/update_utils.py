@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import threading
+from PySide6.QtCore import QObject, Signal
+from .common import get_app_data_dir
+
+RELEASES_URL = "https://api.github.com/repos/kowyo/hitsz-connect-verge/releases/latest"
+CACHE_FILE = "update_cache.json"
+CACHE_TTL = 6 * 3600  # seconds a cached answer is trusted without asking GitHub again
+REQUEST_TIMEOUT = 5
+
+def get_cache_path():
+    return os.path.join(get_app_data_dir(), CACHE_FILE)
+
+def read_cache(path):
+    """Read the cached release check, or an empty dict if there is none"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(path, cache):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+def fetch_latest_version(url=RELEASES_URL, cache_path=None, ttl=CACHE_TTL, force=False):
+    """Return the latest released version, asking GitHub only when the cached answer is stale.
+
+    The request carries the cached ETag, so an unchanged release costs a 304 with no body.
+    force skips the TTL but still sends the conditional request.
+    Raises requests.RequestException when the check fails.
+    """
+    import requests
+
+    cache_path = cache_path or get_cache_path()
+    cache = read_cache(cache_path)
+    if not force and cache.get("version") and time.time() - cache.get("checked_at", 0) < ttl:
+        return cache["version"]
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if cache.get("etag") and cache.get("version"):
+        headers["If-None-Match"] = cache["etag"]
+    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and cache.get("version"):
+        cache["checked_at"] = time.time()
+        write_cache(cache_path, cache)
+        return cache["version"]
+
+    response.raise_for_status()
+    try:
+        latest_version = response.json()["tag_name"].lstrip('v')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise requests.RequestException("Unexpected response from the releases API")
+    write_cache(cache_path, {
+        "version": latest_version,
+        "etag": response.headers.get("ETag", ""),
+        "checked_at": time.time(),
+    })
+    return latest_version
+
+def is_newer(latest_version, current_version):
+    from packaging import version
+    try:
+        return version.parse(latest_version) > version.parse(current_version)
+    except version.InvalidVersion:
+        return False
+
+class UpdateWorker(QObject):
+    """Run the release check on a daemon thread and report the result through signals.
+
+    The thread never holds up quitting: a check still in flight is abandoned at exit.
+    """
+    result = Signal(str, bool)  # latest version, whether it is newer than the running one
+    failed = Signal()
+    finished = Signal()
+
+    def __init__(self, current_version, force=False, url=RELEASES_URL, cache_path=None):
+        super().__init__()
+        self.current_version = current_version
+        self.force = force
+        self.url = url
+        self.cache_path = cache_path
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        import requests
+        try:
+            latest_version = fetch_latest_version(self.url, self.cache_path, force=self.force)
+        except requests.RequestException:
+            self.failed.emit()
+        else:
+            self.result.emit(latest_version, is_newer(latest_version, self.current_version))
+        finally:
+            self.finished.emit()